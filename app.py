@@ -1,6 +1,7 @@
 """
 Flask app entrypoint.
 """
+import logging
 from flask import Flask, send_from_directory
 from flask_cors import CORS
 from src.api.routes_auth import auth_bp
@@ -8,15 +9,47 @@ from src.api.routes_product import product_bp
 from src.api.routes_sales import sales_bp
 from src.api.routes_employee import employee_bp
 from src.api.routes_dashboard import dashboard_bp
+from src.api.routes_system import system_bp
+from src.api.routes_metrics import metrics_bp
+from src.api.routes_events import events_bp
+from core.database import init_app as init_db
+from core.instrumentation import init_app as init_instrumentation
+from core.query_budget import init_app as init_query_budget
+from core.tracing import init_app as init_tracing
+from core.connection import connection_manager
+from core.indexes import ensure_indexes
+from services.journal_service import receipt_journal
+from services.checkout_service import init_app as init_checkout
+from services.event_service import init_app as init_events
+from services.catalog_snapshot import init_app as init_catalog_snapshot
+from config import ENSURE_INDEXES_ON_STARTUP, LOG_LEVEL
+
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s %(message)s")
 
 app = Flask(__name__, static_folder='templates', static_url_path='')
 CORS(app)
+init_db(app)
+# before anything opens the MongoClient, so the command listener is bound
+init_instrumentation(app)
+init_query_budget(app)
+init_tracing(app)
+init_events(app)
+init_checkout(app)
+init_catalog_snapshot(app)
+
+if ENSURE_INDEXES_ON_STARTUP:
+    ensure_indexes(connection_manager.get_database())
+# receipts journaled by a worker that died before flushing them
+receipt_journal.recover(connection_manager.get_database())
 
 app.register_blueprint(auth_bp, url_prefix="/api")
 app.register_blueprint(product_bp, url_prefix="/api/products")
 app.register_blueprint(sales_bp, url_prefix="/api/sales")
 app.register_blueprint(employee_bp, url_prefix="/api/employees")
 app.register_blueprint(dashboard_bp, url_prefix="/api/dashboard")
+app.register_blueprint(system_bp, url_prefix="/api/system")
+app.register_blueprint(events_bp, url_prefix="/api/events")
+app.register_blueprint(metrics_bp)
 
 @app.route("/")
 def first():
@@ -0,0 +1,64 @@
+"""
+Database backends for the benchmarks.
+
+- mongod: a real server at MONGO_URI (default mongodb://localhost:27017),
+  in a throwaway database whose name must contain "bench"
+- mock: mongomock in process (pip install mongomock); no indexes, no
+  transactions, only good for comparing Python-side cost between commits
+
+Both must be selected before the app is imported: they set the env the
+config and the connection manager read at import time.
+"""
+import inspect
+import os
+
+
+def configure(backend, db_name, uri=None):
+    if "bench" not in db_name:
+        raise SystemExit(f"refusing to use database {db_name!r}: its name must contain 'bench'")
+    os.environ["DB_NAME"] = db_name
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("TRACE_SAMPLE_RATE", "0")
+    os.environ.setdefault("LOGIN_LOG_SAMPLE_RATE", "0")
+    if backend == "mongod":
+        os.environ["MONGO_URI"] = uri or os.getenv("BENCH_MONGO_URI", "mongodb://localhost:27017")
+    elif backend == "mock":
+        # mongomock ignores partial filters, so the partial unique indexes
+        # would reject ordinary documents
+        os.environ["ENSURE_INDEXES_ON_STARTUP"] = "false"
+    else:
+        raise SystemExit(f"unknown backend {backend!r}")
+
+
+def _patch_mongomock_bulk():
+    # newer pymongo passes bulk options (e.g. sort) mongomock doesn't know
+    from mongomock.collection import BulkOperationBuilder
+
+    for name in ("add_update", "add_replace", "add_delete", "add_insert"):
+        original = getattr(BulkOperationBuilder, name, None)
+        if original is None:
+            continue
+        accepted = set(inspect.signature(original).parameters)
+
+        def call(self, *args, _original=original, _accepted=accepted, **kwargs):
+            return _original(self, *args, **{k: v for k, v in kwargs.items() if k in _accepted})
+        setattr(BulkOperationBuilder, name, call)
+
+
+def connect(backend):
+    """Bind the app's connection manager to the backend; returns the database."""
+    from core.connection import connection_manager
+
+    if backend == "mock":
+        try:
+            import mongomock
+        except ImportError:
+            raise SystemExit("the mock backend needs mongomock: pip install mongomock")
+        _patch_mongomock_bulk()
+        connection_manager._client = mongomock.MongoClient()
+        connection_manager._pid = os.getpid()
+        connection_manager._transactions = False
+
+    db = connection_manager.get_database()
+    db.client.drop_database(db.name)
+    return db
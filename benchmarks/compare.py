@@ -0,0 +1,66 @@
+"""
+Compare two benchmark result files.
+
+    python -m benchmarks.compare BASE.json NEW.json [--threshold 10]
+
+Prints the change of every metric and exits 1 when a scenario's p95 or
+throughput, or a micro-benchmark's ns/op, got worse by more than
+--threshold percent.
+"""
+import argparse
+import json
+import sys
+
+# metric -> True when higher is better
+SCENARIO_METRICS = {"throughput_rps": True, "p50_ms": False, "p95_ms": False, "p99_ms": False}
+GATED = {"throughput_rps", "p95_ms", "ns_per_op"}
+MICRO_METRICS = {"ns_per_op": False, "p95_ns": False}
+
+
+def change(base, new):
+    if base in (None, 0) or new is None:
+        return None
+    return (new - base) / base * 100
+
+
+def compare(base, new, threshold):
+    """Rows of (section, name, metric, base, new, change %, regressed)."""
+    rows = []
+    for section, metrics in (("scenarios", SCENARIO_METRICS), ("micro", MICRO_METRICS)):
+        for name in sorted(set(base.get(section, {})) & set(new.get(section, {}))):
+            for metric, higher_is_better in metrics.items():
+                b, n = base[section][name].get(metric), new[section][name].get(metric)
+                pct = change(b, n)
+                worse = pct is not None and (-pct if higher_is_better else pct) > threshold
+                rows.append((section, name, metric, b, n, pct, worse and metric in GATED))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed regression in percent")
+    args = parser.parse_args(argv)
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    print(f"base {base['meta'].get('commit')} ({base['meta'].get('backend')})  "
+          f"new {new['meta'].get('commit')} ({new['meta'].get('backend')})")
+    if base["meta"].get("backend") != new["meta"].get("backend"):
+        print("warning: results come from different backends", file=sys.stderr)
+
+    regressions = 0
+    for section, name, metric, b, n, pct, regressed in compare(base, new, args.threshold):
+        regressions += regressed
+        delta = f"{pct:+7.1f}%" if pct is not None else "      -"
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{section:9} {name:28} {metric:15} {b!s:>12} -> {n!s:>12} {delta}{flag}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Load-test and micro-benchmark runner.
+
+    python -m benchmarks.run --backend mock
+    python -m benchmarks.run --backend mongod --uri mongodb://localhost:27017 \\
+        --requests 2000 --concurrency 8 --out before.json
+    python -m benchmarks.compare before.json after.json
+
+The Flask app is driven in process through its test client, so numbers
+are server-side cost without network or WSGI server overhead. Results
+(throughput and p50/p95/p99 per scenario, ns/op per micro-benchmark)
+are written as JSON together with the commit they were measured on.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+from benchmarks import backends
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def summarize(latencies_ms, statuses, elapsed):
+    latencies_ms.sort()
+    counts = {}
+    for status in statuses:
+        counts[str(status)] = counts.get(str(status), 0) + 1
+    return {
+        "requests": len(latencies_ms),
+        "errors": sum(1 for s in statuses if s >= 500),
+        "status_counts": counts,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies_ms) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies_ms, 0.50), 3),
+        "p95_ms": round(percentile(latencies_ms, 0.95), 3),
+        "p99_ms": round(percentile(latencies_ms, 0.99), 3),
+        "max_ms": round(latencies_ms[-1], 3),
+    }
+
+
+def run_scenario(app, ctx, scenario, requests, concurrency, seed):
+    """Spread `requests` calls over `concurrency` threads; returns the summary."""
+    latencies, statuses = [], []
+    lock = threading.Lock()
+    per_thread = [requests // concurrency + (1 if n < requests % concurrency else 0) for n in range(concurrency)]
+
+    def worker(n):
+        client = app.test_client()
+        rng = random.Random(f"{seed}:{n}")
+        local_latencies, local_statuses = [], []
+        for _ in range(per_thread[n]):
+            started = time.perf_counter()
+            response = scenario(client, rng, ctx)
+            local_latencies.append((time.perf_counter() - started) * 1000)
+            local_statuses.append(response.status_code)
+        with lock:
+            latencies.extend(local_latencies)
+            statuses.extend(local_statuses)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(latencies, statuses, time.perf_counter() - started)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the POS API.")
+    parser.add_argument("--backend", choices=["mongod", "mock"], default="mock")
+    parser.add_argument("--uri", help="MongoDB URI for --backend mongod")
+    parser.add_argument("--db", default=os.getenv("BENCH_DB_NAME", "pos_bench"))
+    parser.add_argument("--scenarios", default="login_storm,catalog_reads,checkout,dashboard_polling")
+    parser.add_argument("--micro", default="id_generator,require_auth,token_required,validate_transaction_data",
+                        help="comma separated, empty to skip")
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--login-requests", type=int, default=100, help="logins are scrypt bound; fewer by default")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--micro-iterations", type=int, default=5000)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--cashiers", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="result file (default benchmarks/results/<time>-<commit>.json)")
+    args = parser.parse_args(argv)
+
+    backends.configure(args.backend, args.db, args.uri)
+    db = backends.connect(args.backend)
+    from app import app  # after the backend is bound
+    from benchmarks import scenarios
+
+    rng = random.Random(args.seed)
+    print(f"setting up {args.products} products, {args.cashiers} cashiers on {args.backend}...", file=sys.stderr)
+    ctx = scenarios.setup(app, db, rng, products=args.products, cashiers=args.cashiers)
+
+    result = {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": datetime.utcnow().isoformat() + "Z",
+            "backend": args.backend,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "scenarios": {},
+        "micro": {},
+    }
+
+    for name in filter(None, args.scenarios.split(",")):
+        scenario = scenarios.SCENARIOS[name]
+        requests = args.login_requests if name == "login_storm" else args.requests
+        run_scenario(app, ctx, scenario, min(requests, 20), 1, f"{args.seed}:warmup")
+        summary = run_scenario(app, ctx, scenario, requests, args.concurrency, args.seed)
+        result["scenarios"][name] = summary
+        print(f"{name:20} {summary['throughput_rps']:>9} req/s  p50 {summary['p50_ms']:8.2f}  "
+              f"p95 {summary['p95_ms']:8.2f}  p99 {summary['p99_ms']:8.2f} ms  errors {summary['errors']}",
+              file=sys.stderr)
+
+    for name in filter(None, args.micro.split(",")):
+        fn = scenarios.MICRO[name](ctx, app)
+        scenarios.time_micro(fn, min(args.micro_iterations, 500))
+        per_op = sorted(scenarios.time_micro(fn, args.micro_iterations))
+        result["micro"][name] = {
+            "iterations": args.micro_iterations,
+            "ns_per_op": round(sum(per_op) / len(per_op)),
+            "p50_ns": round(percentile(per_op, 0.50)),
+            "p95_ns": round(percentile(per_op, 0.95)),
+        }
+        print(f"{name:28} {result['micro'][name]['ns_per_op']:>10} ns/op", file=sys.stderr)
+
+    out = args.out
+    if not out:
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        out = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", f"{stamp}-{result['meta']['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(out)
+
+
+if __name__ == "__main__":
+    main()
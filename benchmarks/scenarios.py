@@ -0,0 +1,195 @@
+"""
+Benchmark fixtures, request mixes and micro-benchmarks.
+
+Every scenario is a function (client, rng, ctx) -> response, called many
+times from several threads; each thread has its own test client and an
+rng seeded from the run seed, so a run is reproducible request for
+request.
+"""
+import time
+from datetime import datetime
+
+CATEGORIES = ["Beverages", "Food", "Snacks", "Household", "Personal Care", "Frozen", "Dairy", "Bakery"]
+PASSWORD = "bench-password"
+
+
+class Context:
+    """State shared by the scenarios of one run."""
+
+    def __init__(self, db, product_ids, cashiers, admin_token, cashier_tokens):
+        self.db = db
+        self.product_ids = product_ids
+        self.cashiers = cashiers
+        self.admin_token = admin_token
+        self.cashier_tokens = cashier_tokens
+        self.etag = None
+
+    def auth(self, rng, admin=False):
+        token = self.admin_token if admin else rng.choice(self.cashier_tokens)
+        return {"Authorization": f"Bearer {token}"}
+
+
+def setup(app, db, rng, products=2000, cashiers=20):
+    """Load a catalog and staff, and log everyone in once."""
+    from services.password_service import hash_password
+
+    now = datetime.utcnow()
+    product_ids = [f"PRD-BENCH-{n:06d}" for n in range(products)]
+    db.products.insert_many([
+        {
+            "product_id": pid,
+            "name": f"Bench product {n}",
+            "category": CATEGORIES[n % len(CATEGORIES)],
+            "price": float(rng.randrange(1000, 200000, 500)),
+            "stock": 10 ** 9,  # checkouts must never run dry mid-run
+            "sku": f"BENCH{n:06d}",
+            "status": "active",
+            "created_at": now,
+        }
+        for n, pid in enumerate(product_ids)
+    ], ordered=False)
+
+    password_hash = hash_password(PASSWORD)
+    staff = [("bench-admin", "admin")] + [(f"bench-kasir-{n}", "kasir") for n in range(cashiers)]
+    db.master_karyawan.insert_many([
+        {
+            "employee_id": f"EMP-BENCH-{n:04d}",
+            "name": username,
+            "username": username,
+            "email": f"{username}@bench.local",
+            "password_hash": password_hash,
+            "role": role,
+            "status": "active",
+            "created_at": now,
+        }
+        for n, (username, role) in enumerate(staff)
+    ])
+
+    client = app.test_client()
+    tokens = {}
+    for username, _ in staff:
+        response = client.post("/api/login", json={"username": username, "password": PASSWORD})
+        if response.status_code != 200:
+            raise SystemExit(f"benchmark login failed for {username}: {response.status_code} {response.get_data(as_text=True)}")
+        tokens[username] = response.get_json()["token"]
+    return Context(
+        db, product_ids, [u for u, role in staff if role == "kasir"],
+        tokens["bench-admin"], [tokens[u] for u, role in staff if role == "kasir"],
+    )
+
+
+def basket_size(rng, max_lines=60):
+    """Mostly small baskets with a long tail up to max_lines."""
+    size = 1
+    while size < max_lines and rng.random() < 0.82:
+        size += 1
+    return size
+
+
+# --- request mixes ---
+
+def login_storm(client, rng, ctx):
+    return client.post("/api/login", json={"username": rng.choice(ctx.cashiers), "password": PASSWORD})
+
+
+def catalog_reads(client, rng, ctx):
+    roll = rng.random()
+    headers = ctx.auth(rng)
+    if roll < 0.6 and ctx.etag:
+        # registers revalidating their cached list
+        return client.get("/api/products/", headers=dict(headers, **{"If-None-Match": ctx.etag}))
+    if roll < 0.8:
+        response = client.get("/api/products/", headers=headers)
+        ctx.etag = response.headers.get("ETag") or ctx.etag
+        return response
+    if roll < 0.9:
+        return client.get("/api/products/?page_size=100&shape=summary", headers=headers)
+    return client.get("/api/products/changes?since=0&limit=200", headers=headers)
+
+
+def checkout(client, rng, ctx):
+    lines = basket_size(rng)
+    items = [{"product_id": pid, "quantity": rng.randint(1, 3)} for pid in rng.sample(ctx.product_ids, lines)]
+    return client.post("/api/sales/", json={
+        "items": items, "payment_method": rng.choice(["cash", "card", "digital"])
+    }, headers=ctx.auth(rng))
+
+
+def dashboard_polling(client, rng, ctx):
+    if rng.random() < 0.7:
+        return client.get("/api/dashboard/stats", headers=ctx.auth(rng, admin=True))
+    return client.get("/api/sales/analytics/daily?days=7", headers=ctx.auth(rng, admin=True))
+
+
+SCENARIOS = {
+    "login_storm": login_storm,
+    "catalog_reads": catalog_reads,
+    "checkout": checkout,
+    "dashboard_polling": dashboard_polling,
+}
+
+
+# --- micro-benchmarks: fn(ctx, app) -> callable doing one operation ---
+
+def micro_id_generator(ctx, app):
+    from core.id_generator import IDGenerator
+    generator = IDGenerator(ctx.db)
+    return lambda: generator.get_next_id("BENCH")
+
+
+def micro_require_auth(ctx, app):
+    from utils.jwt_manager import require_auth
+
+    @require_auth()
+    def view():
+        return "ok"
+
+    headers = {"Authorization": f"Bearer {ctx.cashier_tokens[0]}"}
+
+    def call():
+        with app.test_request_context("/", headers=headers):
+            view()
+    return call
+
+
+def micro_token_required(ctx, app):
+    from utils.jwt_manager import token_required
+
+    @token_required
+    def view(current_user):
+        return "ok"
+
+    headers = {"Authorization": f"Bearer {ctx.cashier_tokens[0]}"}
+
+    def call():
+        with app.test_request_context("/", headers=headers):
+            view()
+    return call
+
+
+def micro_validate_transaction(ctx, app):
+    from src.api.routes_sales import validate_transaction_data
+    data = {
+        "items": [{"product_id": pid, "quantity": 2} for pid in ctx.product_ids[:60]],
+        "payment_method": "card",
+    }
+    return lambda: validate_transaction_data(data)
+
+
+MICRO = {
+    "id_generator": micro_id_generator,
+    "require_auth": micro_require_auth,
+    "token_required": micro_token_required,
+    "validate_transaction_data": micro_validate_transaction,
+}
+
+
+def time_micro(fn, iterations, batch=100):
+    """ns per operation, measured over batches so timer overhead stays out."""
+    per_op = []
+    for _ in range(max(iterations // batch, 1)):
+        started = time.perf_counter_ns()
+        for _ in range(batch):
+            fn()
+        per_op.append((time.perf_counter_ns() - started) / batch)
+    return per_op
@@ -0,0 +1,185 @@
+"""
+Process-wide MongoClient manager.
+
+One pooled client is kept per worker process and rebuilt lazily after a
+fork, so gunicorn workers never share sockets inherited from the master.
+"""
+import atexit
+import os
+import threading
+
+from pymongo import MongoClient
+from pymongo.monitoring import ConnectionPoolListener
+
+import config
+
+
+class PoolStatsListener(ConnectionPoolListener):
+    """Track connection pool usage from pymongo's CMAP events."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.pools = 0
+            self.open_connections = 0
+            self.checked_out = 0
+            self.waiting = 0
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.pool_clears = 0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "pools": self.pools,
+                "open_connections": self.open_connections,
+                "checked_out": self.checked_out,
+                "waiting": self.waiting,
+                "available": max(self.open_connections - self.checked_out, 0),
+                "checkouts_total": self.checkouts,
+                "checkout_failures_total": self.checkout_failures,
+                "pool_clears_total": self.pool_clears,
+            }
+
+    def pool_created(self, event):
+        with self._lock:
+            self.pools += 1
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        with self._lock:
+            self.pools = max(self.pools - 1, 0)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections = max(self.open_connections - 1, 0)
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self.waiting += 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.waiting = max(self.waiting - 1, 0)
+            self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.waiting = max(self.waiting - 1, 0)
+            self.checked_out += 1
+            self.checkouts += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out = max(self.checked_out - 1, 0)
+
+
+class ConnectionManager:
+    """Owns the MongoClient of the current process."""
+
+    def __init__(self, uri=None, db_name=None, **client_options):
+        self.uri = uri
+        self.db_name = db_name
+        self.client_options = client_options
+        self.pool_stats = PoolStatsListener()
+        self._listeners = [self.pool_stats]
+        self._client = None
+        self._pid = None
+        self._transactions = None
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener):
+        """
+        Register a pymongo event listener. Listeners are bound when the
+        client is created, so call this before the first request.
+        """
+        self._listeners.append(listener)
+
+    def get_client(self) -> MongoClient:
+        pid = os.getpid()
+        if self._client is None or self._pid != pid:
+            with self._lock:
+                if self._client is None or self._pid != pid:
+                    # a client inherited through fork() is unusable; drop it
+                    # without closing, the parent still owns its sockets
+                    self._client = None
+                    self._transactions = None
+                    self.pool_stats.reset()
+                    self._client = MongoClient(
+                        self.uri,
+                        event_listeners=list(self._listeners),
+                        **self.client_options
+                    )
+                    self._pid = pid
+        return self._client
+
+    def get_database(self):
+        return self.get_client()[self.db_name]
+
+    def supports_transactions(self) -> bool:
+        """
+        True when the deployment is a replica set or sharded cluster, i.e.
+        multi-document transactions are available. Checked once per process.
+        """
+        if config.MONGO_TRANSACTIONS == "off":
+            return False
+        client = self.get_client()
+        if self._transactions is None:
+            hello = client.admin.command("hello")
+            clustered = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+            self._transactions = clustered and "logicalSessionTimeoutMinutes" in hello
+        return self._transactions
+
+    def pool_snapshot(self):
+        stats = self.pool_stats.snapshot()
+        stats["pid"] = os.getpid()
+        stats["max_pool_size"] = self.client_options.get("maxPoolSize")
+        stats["min_pool_size"] = self.client_options.get("minPoolSize")
+        return stats
+
+    def close(self):
+        with self._lock:
+            if self._client is not None and self._pid == os.getpid():
+                self._client.close()
+            self._client = None
+            self._pid = None
+
+    def _after_fork(self):
+        self._client = None
+        self._pid = None
+        self._transactions = None
+        self._lock = threading.Lock()
+
+
+connection_manager = ConnectionManager(
+    os.getenv("MONGO_URI"),
+    os.getenv("DB_NAME"),
+    maxPoolSize=config.MONGO_MAX_POOL_SIZE,
+    minPoolSize=config.MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=config.MONGO_MAX_IDLE_TIME_MS,
+    waitQueueTimeoutMS=config.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    connectTimeoutMS=config.MONGO_CONNECT_TIMEOUT_MS,
+    serverSelectionTimeoutMS=config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    socketTimeoutMS=config.MONGO_SOCKET_TIMEOUT_MS,
+    appname=config.MONGO_APP_NAME,
+)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=connection_manager._after_fork)
+atexit.register(connection_manager.close)
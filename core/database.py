@@ -1,24 +1,36 @@
 """
 MongoDB Connection Helper
 """
-from pymongo import MongoClient
-from dotenv import load_dotenv
-import os
 from flask import g
 
-load_dotenv()
+from core.connection import connection_manager
 
-MONGO_URI = os.getenv("MONGO_URI")
-DB_NAME = os.getenv("DB_NAME")
-
-_client = None
 
 def get_db():
     if 'db' not in g:
-        mongo_uri = os.getenv("MONGO_URI")
-        db_name = os.getenv("DB_NAME")
-        
-        g.db_client = MongoClient(mongo_uri)
-        g.db = g.db_client[db_name]
+        g.db_client = connection_manager.get_client()
+        g.db = g.db_client[connection_manager.db_name]
     return g
 
+
+def run_in_transaction(callback):
+    """
+    Call callback(session) inside a multi-document transaction when the
+    deployment supports one, otherwise call callback(None).
+    Transient transaction errors are retried by pymongo.
+    """
+    if not connection_manager.supports_transactions():
+        return callback(None)
+    with connection_manager.get_client().start_session() as session:
+        return session.with_transaction(callback)
+
+
+def _release_db(exc=None):
+    # the client is shared by the whole process; only drop the references
+    g.pop("db", None)
+    g.pop("db_client", None)
+
+
+def init_app(app):
+    """Register teardown hooks for the pooled client."""
+    app.teardown_appcontext(_release_db)
@@ -1,31 +1,121 @@
+import os
+import threading
 from datetime import datetime
 from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import config
+from core.tracing import annotate, span
+
+# Blok sequence yang sudah di-lease oleh proses ini, per (database, prefix)
+_leases = {}
+_locks = {}
+_registry_lock = threading.Lock()
+
+
+class _Lease:
+    # date is the counter's, which may be ahead of this worker's clock
+    def __init__(self, date, first, last):
+        self.date = date
+        self.next = first
+        self.last = last
+
+    def remaining(self):
+        return self.last - self.next + 1
+
+
+def _reset_after_fork():
+    # child process must never hand out numbers leased by the parent
+    global _registry_lock
+    _leases.clear()
+    _locks.clear()
+    _registry_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
 
 class IDGenerator:
-    def __init__(self, db):
+    """
+    Generates PREFIX-YYYYMMDD-NNNN ids.
+
+    Each worker leases a block of sequence numbers per prefix with a single
+    atomic update and hands them out locally, so most ids cost no database
+    work. Numbers left in a block when the worker exits are skipped, and
+    ids from different workers are unique but not strictly time ordered.
+    """
+
+    def __init__(self, db, block_size: int = None, width: int = None):
         self.counters = db["counters"]
+        self.namespace = db.name
+        self.block_size = block_size or config.ID_BLOCK_SIZE
+        self.width = width or config.ID_SEQUENCE_WIDTH
 
     def get_next_id(self, prefix: str):
+        return self.get_next_ids(prefix, 1)[0]
+
+    def get_next_ids(self, prefix: str, count: int):
+        """
+        Reserve `count` ids at once, e.g. for bulk imports.
+        Large requests lease one block big enough for the remainder.
+        """
         today = datetime.now().strftime("%Y%m%d")
+        key = (self.namespace, prefix)
+        ids = []
 
-        # Ambil data counter yang sesuai prefix
-        counter = self.counters.find_one({"_id": prefix})
+        with span("id_generator.next_ids", prefix=prefix, count=count):
+            with self._lock_for(key):
+                annotate(leased=False)
+                while len(ids) < count:
+                    needed = count - len(ids)
+                    lease = _leases.get(key)
+                    if lease is None or lease.date < today or lease.remaining() < 1:
+                        annotate(leased=True)
+                        lease = self._lease_block(prefix, today, max(self.block_size, needed))
+                        _leases[key] = lease
+                    take = min(lease.remaining(), needed)
+                    # Format akhir: PREFIX-YYYYMMDD-0001
+                    ids.extend(self._format(prefix, lease.date, seq) for seq in range(lease.next, lease.next + take))
+                    lease.next += take
 
-        # Jika belum ada atau tanggal sudah berganti -> reset sequence
-        if not counter or counter.get("date") != today:
-            counter = self.counters.find_one_and_update(
-                {"_id": prefix},
-                {"$set": {"sequence": 1, "date": today}},
-                upsert=True,
-                return_document=ReturnDocument.AFTER
-            )
-        else:
-            # Jika tanggal sama, increment sequence
+        return ids
+
+    def _format(self, prefix, date, sequence):
+        return f"{prefix.upper()}-{date}-{sequence:0{self.width}d}"
+
+    def _lock_for(self, key):
+        with _registry_lock:
+            return _locks.setdefault(key, threading.Lock())
+
+    def _lease_block(self, prefix, today, size):
+        """
+        Reserve `size` numbers in one round trip. The sequence restarts
+        only when the stored date is older than today, atomically, so
+        workers crossing midnight together can't both reset it. A worker
+        whose clock is still on yesterday when another has rolled the
+        counter over gets numbers of the stored date instead of resetting
+        it back: the lease carries the counter's date.
+        """
+        stale = {"$lt": [{"$ifNull": ["$date", ""]}, today]}
+        update = [{
+            "$set": {
+                "sequence": {
+                    "$cond": [stale, size, {"$add": [{"$ifNull": ["$sequence", 0]}, size]}]
+                },
+                "date": {"$cond": [stale, today, "$date"]}
+            }
+        }]
+        try:
+            with span("id_generator.lease_block", prefix=prefix, size=size):
+                counter = self.counters.find_one_and_update(
+                    {"_id": prefix}, update,
+                    upsert=True, return_document=ReturnDocument.AFTER
+                )
+        except DuplicateKeyError:
+            # two workers upserted the very first counter at the same time
             counter = self.counters.find_one_and_update(
-                {"_id": prefix},
-                {"$inc": {"sequence": 1}},
-                return_document=ReturnDocument.AFTER
+                {"_id": prefix}, update,
+                upsert=True, return_document=ReturnDocument.AFTER
             )
-
-        # Format akhir: PREFIX-YYYYMMDD-0001
-        return f"{prefix.upper()}-{today}-{counter['sequence']:04d}"
+        last = counter["sequence"]
+        return _Lease(counter["date"], last - size + 1, last)
@@ -0,0 +1,172 @@
+"""
+Index registry.
+
+Declares the indexes each collection needs, ensures them idempotently at
+startup, and explains the canonical query of each route to flag
+collection scans.
+
+    python -m core.indexes             # ensure indexes
+    python -m core.indexes --explain   # ensure, then report query plans
+"""
+import logging
+import sys
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import ConnectionFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# counters is only read by _id, which MongoDB always indexes
+INDEXES = {
+    "products": [
+        IndexModel([("product_id", ASCENDING)], name="product_id_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("name", ASCENDING)], name="status_name"),
+        IndexModel([("status", ASCENDING), ("category", ASCENDING)], name="status_category"),
+        IndexModel([("status", ASCENDING), ("stock", ASCENDING)], name="status_stock"),
+        IndexModel([("sku", ASCENDING)], name="sku",
+                   partialFilterExpression={"sku": {"$gt": ""}}),
+        IndexModel([("change_seq", ASCENDING), ("product_id", ASCENDING)], name="change_seq"),
+        # stale stock hold sweep
+        IndexModel([("stock_holds", ASCENDING)], name="stock_holds"),
+    ],
+    "transactions": [
+        IndexModel([("transaction_id", ASCENDING)], name="transaction_id_unique", unique=True),
+        IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)], name="created_at_id"),
+        IndexModel([("cashier_id", ASCENDING), ("created_at", DESCENDING)], name="cashier_created_at"),
+        IndexModel([("idempotency_key", ASCENDING)], name="idempotency_key_unique", unique=True,
+                   partialFilterExpression={"idempotency_key": {"$type": "string"}}),
+    ],
+    "sessions": [
+        IndexModel([("token_hash", ASCENDING)], name="token_hash_unique", unique=True,
+                   partialFilterExpression={"token_hash": {"$exists": True}}),
+        IndexModel([("revoked_at", ASCENDING)], name="revoked_at_inactive",
+                   partialFilterExpression={"status": "inactive"}),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_inactive",
+                   partialFilterExpression={"status": "inactive"}),
+    ],
+    # one document per stream ticket redeemed, keyed by its jti
+    "used_stream_tickets": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "master_karyawan": [
+        IndexModel([("employee_id", ASCENDING)], name="employee_id_unique", unique=True),
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True,
+                   partialFilterExpression={"email": {"$type": "string"}}),
+        IndexModel([("status", ASCENDING)], name="status"),
+    ],
+    "sales_hourly": [
+        IndexModel([("bucket", ASCENDING), ("store_id", ASCENDING)], name="bucket_store"),
+        IndexModel([("day", ASCENDING)], name="day"),
+    ],
+    "product_sales": [
+        IndexModel([("period", ASCENDING), ("category", ASCENDING)], name="period_category"),
+        IndexModel([("day", ASCENDING), ("category", ASCENDING)], name="day_category",
+                   partialFilterExpression={"day": {"$type": "date"}}),
+    ],
+}
+
+
+def ensure_indexes(db):
+    """
+    Create every declared index. Existing identical indexes are a no-op;
+    conflicts (e.g. duplicate data under a unique index) are logged and
+    reported without stopping the others.
+    """
+    report = []
+    for collection, models in INDEXES.items():
+        for model in models:
+            name = model.document["name"]
+            try:
+                db[collection].create_indexes([model])
+                report.append({"collection": collection, "index": name, "status": "ok"})
+            except ConnectionFailure as e:
+                # don't hold up boot once per index when the server is down
+                logger.error("index bootstrap skipped, database unreachable: %s", e)
+                report.append({"collection": collection, "index": name, "status": "error", "detail": str(e)})
+                return report
+            except PyMongoError as e:
+                logger.warning("index %s.%s not created: %s", collection, name, e)
+                report.append({"collection": collection, "index": name, "status": "error", "detail": str(e)})
+    return report
+
+
+def canonical_queries():
+    """(route, collection, filter, sort) of the hot query behind each route."""
+    now = datetime.utcnow()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return [
+        ("GET /api/products/", "products", {"status": {"$ne": "deleted"}}, None),
+        ("POST /api/products/", "products", {"name": "x", "status": {"$ne": "deleted"}}, None),
+        ("PUT /api/products/<id>", "products", {"product_id": "x", "status": {"$ne": "deleted"}}, None),
+        ("GET /api/products/changes", "products", {"change_seq": {"$gt": 0}}, [("change_seq", ASCENDING)]),
+        ("POST /api/sales/", "products", {"product_id": {"$in": ["x"]}, "status": "active"}, None),
+        ("POST /api/sales/batch", "transactions", {"idempotency_key": {"$in": ["x"]}}, None),
+        ("GET /api/sales/", "transactions", {}, [("created_at", DESCENDING), ("_id", DESCENDING)]),
+        ("GET /api/sales/analytics/*", "sales_hourly",
+         {"bucket": {"$gte": now - timedelta(days=7), "$lte": now}}, None),
+        ("GET /api/sales/analytics/bestsellers", "product_sales", {"period": "all"}, None),
+        ("GET /api/sales/analytics/bestsellers?days=", "product_sales",
+         {"day": {"$gte": today - timedelta(days=30), "$lte": now}}, None),
+        ("GET /api/dashboard/stats", "sales_hourly", {"day": f"{today:%Y-%m-%d}"}, None),
+        ("GET /api/dashboard/stats", "products", {"status": "active", "stock": {"$lt": 10}}, None),
+        ("GET /api/dashboard/stats", "master_karyawan", {"status": "active"}, None),
+        ("POST /api/login", "master_karyawan", {"username": "x", "status": "active"}, None),
+        ("POST /api/employees/", "master_karyawan", {"$or": [{"username": "x"}, {"email": "x"}]}, None),
+        ("GET /api/employees/<id>", "master_karyawan", {"employee_id": "x"}, None),
+        ("POST /api/logout", "sessions", {"token_hash": "x", "status": "active"}, None),
+        ("auth revocation poll", "sessions", {"status": "inactive", "revoked_at": {"$gt": now}}, None),
+        ("IDGenerator", "counters", {"_id": "TXN"}, None),
+    ]
+
+
+def _plan_stages(plan):
+    stages = []
+    while plan:
+        stages.append(plan.get("stage"))
+        for child in plan.get("inputStages", []):
+            stages.extend(_plan_stages(child))
+        plan = plan.get("inputStage")
+    return stages
+
+
+def explain_queries(db):
+    """Explain each canonical query and flag the ones doing a COLLSCAN."""
+    report = []
+    for route, collection, query, sort in canonical_queries():
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        try:
+            winning = cursor.explain()["queryPlanner"]["winningPlan"]
+        except PyMongoError as e:
+            report.append({"route": route, "collection": collection, "error": str(e)})
+            continue
+        stages = _plan_stages(winning.get("queryPlan", winning))
+        report.append({
+            "route": route,
+            "collection": collection,
+            "filter": str(query),
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+        })
+    return report
+
+
+if __name__ == "__main__":
+    from core.connection import connection_manager
+
+    logging.basicConfig(level=logging.INFO)
+    db = connection_manager.get_database()
+    for row in ensure_indexes(db):
+        print(f"{row['status']:5} {row['collection']}.{row['index']} {row.get('detail', '')}")
+    if "--explain" in sys.argv:
+        scans = 0
+        for row in explain_queries(db):
+            if "error" in row:
+                print(f"ERROR    {row['route']}: {row['error']}")
+                continue
+            scans += row["collscan"]
+            flag = "COLLSCAN" if row["collscan"] else "ok"
+            print(f"{flag:8} {row['route']:32} {row['collection']:16} {' > '.join(row['stages'])}")
+        sys.exit(1 if scans else 0)
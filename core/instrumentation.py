@@ -0,0 +1,85 @@
+"""
+Request and MongoDB instrumentation.
+
+Flask hooks time every request into per-route histograms and status
+counters, and keep an in-flight gauge per blueprint; a pymongo command
+listener does the same for database commands. Everything lands in
+utils.metrics.registry, served by GET /metrics.
+"""
+import time
+from flask import g, request
+from pymongo import monitoring
+
+from core.connection import connection_manager
+from utils.metrics import registry
+
+REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "Request latency by route.",
+    ("blueprint", "method", "route")
+)
+REQUESTS = registry.counter(
+    "http_requests_total", "Requests by route and status code.",
+    ("blueprint", "method", "route", "status")
+)
+IN_FLIGHT = registry.gauge(
+    "http_requests_in_flight", "Requests being served, by blueprint.", ("blueprint",)
+)
+COMMAND_SECONDS = registry.histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency.", ("command",)
+)
+COMMANDS = registry.counter(
+    "mongodb_commands_total", "MongoDB commands by outcome.", ("command", "outcome")
+)
+
+
+def _route_labels():
+    # the URL rule, not the path, keeps label cardinality bounded
+    rule = request.url_rule.rule if request.url_rule else "unmatched"
+    return request.blueprint or "app", request.method, rule
+
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_labels = _route_labels()
+    IN_FLIGHT.inc(g.metrics_labels[0])
+
+
+def _record_response(response):
+    _finish(response.status_code)
+    return response
+
+
+def _record_teardown(exc=None):
+    # only reached unrecorded when the view raised
+    _finish(500)
+
+
+def _finish(status):
+    started = g.pop("metrics_started", None)
+    if started is None:
+        return
+    labels = g.metrics_labels
+    REQUEST_SECONDS.observe(*labels, value=time.perf_counter() - started)
+    REQUESTS.inc(*labels, str(status))
+    IN_FLIGHT.dec(labels[0])
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        COMMAND_SECONDS.observe(event.command_name, value=event.duration_micros / 1e6)
+        COMMANDS.inc(event.command_name, "ok")
+
+    def failed(self, event):
+        COMMAND_SECONDS.observe(event.command_name, value=event.duration_micros / 1e6)
+        COMMANDS.inc(event.command_name, "error")
+
+
+def init_app(app):
+    """Install the request hooks and the command listener."""
+    app.before_request(_start_request)
+    app.after_request(_record_response)
+    app.teardown_request(_record_teardown)
+    connection_manager.add_listener(CommandMetricsListener())
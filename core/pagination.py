@@ -0,0 +1,122 @@
+"""
+Opaque continuation tokens for keyset pagination.
+"""
+import base64
+import binascii
+from datetime import datetime
+from bson import ObjectId, json_util
+import config
+
+# what a sort key may hold in a cursor: plain values, never a document
+# (which would be read as query operators) or an array
+KEY_TYPES = (str, int, float, datetime, ObjectId)
+
+
+def encode_cursor(state: dict) -> str:
+    raw = json_util.dumps(state, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> dict:
+    """Raises ValueError for tokens that weren't produced by encode_cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        state = json_util.loads(raw.decode("utf-8"))
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError("invalid cursor") from e
+    if not isinstance(state, dict):
+        raise ValueError("invalid cursor")
+    return state
+
+
+def check_keys(sort, after, key_types=None):
+    """
+    Raises ValueError unless `after` holds one value per sort key, each
+    of that key's type in `key_types` (default: any of KEY_TYPES). A
+    cursor is client input and its values go into the filter.
+    """
+    if not isinstance(after, list) or len(after) != len(sort):
+        raise ValueError("invalid cursor")
+    for value, expected in zip(after, key_types or [KEY_TYPES] * len(sort)):
+        if not isinstance(value, expected) or isinstance(value, bool):
+            raise ValueError("invalid cursor")
+
+
+def keyset_filter(sort, after):
+    """
+    Filter for the documents strictly after `after` (the sort key values
+    of the last document of the previous page) in `sort` order.
+    """
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {f: after[j] for j, (f, _) in enumerate(sort[:i])}
+        clause[field] = {"$lt" if direction < 0 else "$gt": after[i]}
+        clauses.append(clause)
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+def keyset_page(collection, query, sort, limit, cursor=None, projection=None, key_types=None):
+    """
+    One page of `collection` in `sort` order, which must end with a unique
+    field. Deep pages cost the same as the first one: the cursor turns
+    into an index range instead of a skip. `key_types` are the types of
+    the sort keys, one class or tuple per key, for check_keys.
+    Returns (documents, next_cursor or None).
+    """
+    if cursor:
+        after = decode_cursor(cursor).get("after")
+        check_keys(sort, after, key_types)
+        query = {"$and": [query, keyset_filter(sort, after)]} if query else keyset_filter(sort, after)
+
+    if projection is not None and any(v for v in projection.values()):
+        projection = dict(projection, **{field: 1 for field, _ in sort})
+
+    docs = list(collection.find(query, projection).sort(sort).limit(limit + 1))
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor({"after": [docs[-1].get(field) for field, _ in sort]})
+    return docs, next_cursor
+
+
+def field_projection(fields, allowed, exclude=()):
+    """
+    Projection from a comma separated ?fields= value, limited to
+    `allowed`. Without fields, everything but `exclude` is returned.
+    Raises ValueError on unknown fields.
+    """
+    if not fields:
+        return {field: 0 for field in exclude} or None
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)}")
+    return {field: 1 for field in requested}
+
+
+def page_from_args(collection, query, sort, args, allowed, summary_exclude=(), always_exclude=(),
+                   default_size=None, max_size=None, key_types=None):
+    """
+    Read ?fields=, ?shape=summary, ?page_size= and ?cursor= from request
+    args and fetch one page. Returns (documents, next_cursor).
+    Raises ValueError on bad arguments.
+    """
+    default_size = default_size or config.PAGE_SIZE_DEFAULT
+    max_size = max_size or config.PAGE_SIZE_MAX
+    size = int(args.get("page_size") or args.get("limit") or default_size)
+    if size < 1:
+        raise ValueError("page_size must be positive")
+
+    exclude = tuple(always_exclude)
+    if args.get("shape") == "summary":
+        exclude += tuple(summary_exclude)
+    projection = field_projection(args.get("fields"), allowed, exclude)
+    if projection and any(projection.values()):
+        for field in always_exclude:
+            projection.pop(field, None)
+
+    return keyset_page(collection, query, sort, min(size, max_size), args.get("cursor"), projection, key_types)
+
+
+def is_paged(args):
+    return any(key in args for key in ("cursor", "page_size", "fields", "shape"))
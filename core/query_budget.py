@@ -0,0 +1,198 @@
+"""
+Per-request database accounting.
+
+A pymongo command listener charges every command to the request that
+issued it: round trips, documents returned and, when a limit or strict mode needs
+them, reply bytes, plus a count per query shape (command, collection and filter with the values stripped).
+The same shape repeating within one request is reported as an N+1.
+
+Routes declare limits with @query_budget below their route decorator;
+the others get QUERY_BUDGET_MAX_QUERIES. QUERY_BUDGET_MODE:
+
+- off: nothing installed
+- log: totals in X-DB-* response headers, violations logged
+- strict: a violation turns the response into a 500, for test runs
+"""
+import json
+import logging
+from collections import Counter
+from contextvars import ContextVar
+from bson import encode
+from flask import current_app, request
+from pymongo import monitoring
+
+import config
+from core.connection import connection_manager
+from utils.event_log import log_event
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar("query_account", default=None)
+
+# not queries the application wrote; never part of a budget
+IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "endSessions", "killCursors"}
+# continuation of a cursor, not a new query
+CONTINUATION_COMMANDS = {"getMore"}
+
+QUERIES_PER_REQUEST = registry.histogram(
+    "db_queries_per_request", "MongoDB round trips per request.", ("blueprint", "route"),
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+)
+BUDGET_VIOLATIONS = registry.counter(
+    "db_query_budget_violations_total", "Requests over their query budget or with an N+1.",
+    ("route", "kind")
+)
+
+
+def query_budget(max_queries=None, max_docs=None, max_bytes=None):
+    """Declare the database budget of a route; place below @bp.route."""
+    def decorate(view):
+        view.query_budget = {"max_queries": max_queries, "max_docs": max_docs, "max_bytes": max_bytes}
+        return view
+    return decorate
+
+
+def _shape(value):
+    if isinstance(value, dict):
+        return {k: _shape(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_shape(value[0])] if value else []
+    return type(value).__name__
+
+
+def _filter_of(name, command):
+    if name in ("find", "count", "distinct"):
+        return command.get("filter", command.get("query"))
+    if name in ("update", "delete"):
+        statements = command.get("updates") or command.get("deletes") or [{}]
+        return statements[0].get("q")
+    if name == "findAndModify":
+        return command.get("query")
+    if name == "aggregate":
+        first = (command.get("pipeline") or [{}])[0]
+        return first.get("$match")
+    return None
+
+
+def query_shape(name, command):
+    collection = command.get(name)
+    if not isinstance(collection, str):
+        collection = ""
+    query = _filter_of(name, command)
+    shape = json.dumps(_shape(query), sort_keys=True) if query else ""
+    return f"{name} {collection} {shape}".strip()
+
+
+class QueryAccount:
+    def __init__(self, count_bytes=False):
+        self.queries = 0
+        self.docs = 0
+        self.bytes = 0
+        # re-encoding every reply is as costly as decoding it
+        self.count_bytes = count_bytes
+        self.shapes = Counter()
+
+    def repeated_shapes(self, threshold):
+        return {shape: n for shape, n in self.shapes.items() if n >= threshold}
+
+
+class QueryAccountant(monitoring.CommandListener):
+    def started(self, event):
+        account = _current.get()
+        if account is None or event.command_name in IGNORED_COMMANDS:
+            return
+        account.queries += 1
+        if event.command_name not in CONTINUATION_COMMANDS:
+            account.shapes[query_shape(event.command_name, event.command)] += 1
+
+    def succeeded(self, event):
+        account = _current.get()
+        if account is None or event.command_name in IGNORED_COMMANDS:
+            return
+        reply = event.reply
+        cursor = reply.get("cursor")
+        if cursor:
+            account.docs += len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+        elif reply.get("value") is not None:
+            account.docs += 1
+        if account.count_bytes:
+            account.bytes += len(encode(reply))
+
+    def failed(self, event):
+        pass
+
+
+def _budget():
+    view = current_app.view_functions.get(request.endpoint)
+    return getattr(view, "query_budget", None) or {"max_queries": config.QUERY_BUDGET_MAX_QUERIES}
+
+
+def _begin():
+    count_bytes = config.QUERY_BUDGET_MODE == "strict" or _budget().get("max_bytes") is not None
+    request.query_account_token = _current.set(QueryAccount(count_bytes))
+
+
+def _violations(account, budget):
+    found = []
+    for kind, used in (("max_queries", account.queries), ("max_docs", account.docs), ("max_bytes", account.bytes)):
+        limit = budget.get(kind)
+        if limit is not None and used > limit:
+            found.append(f"{kind}: {used} > {limit}")
+    repeated = account.repeated_shapes(config.QUERY_N_PLUS_ONE_THRESHOLD)
+    found.extend(f"n+1: {shape} x{n}" for shape, n in repeated.items())
+    return found
+
+
+def _check(response):
+    account = _current.get()
+    if account is None:
+        return response
+    budget = _budget()
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+
+    QUERIES_PER_REQUEST.observe(request.blueprint or "app", route, value=account.queries)
+    response.headers["X-DB-Queries"] = str(account.queries)
+    response.headers["X-DB-Docs"] = str(account.docs)
+    if account.count_bytes:
+        response.headers["X-DB-Bytes"] = str(account.bytes)
+
+    violations = _violations(account, budget)
+    if not violations:
+        return response
+    for v in violations:
+        BUDGET_VIOLATIONS.inc(route, v.split(":", 1)[0])
+    log_event(
+        logger, "query_budget_exceeded", level=logging.WARNING,
+        method=request.method, route=route, queries=account.queries,
+        docs=account.docs, bytes=account.bytes if account.count_bytes else None,
+        violations=violations
+    )
+    if config.QUERY_BUDGET_MODE == "strict":
+        response = current_app.make_response(({
+            "error": "Query budget exceeded",
+            "route": route,
+            "violations": violations,
+            "shapes": dict(account.shapes),
+        }, 500))
+    return response
+
+
+def _end(exc=None):
+    # teardown runs twice for a stream_with_context response: once when
+    # the view returns and again when the stream closes
+    token = getattr(request, "query_account_token", None)
+    if token is None:
+        return
+    del request.query_account_token
+    _current.reset(token)
+
+
+def init_app(app):
+    """Install the accountant unless QUERY_BUDGET_MODE is off."""
+    if config.QUERY_BUDGET_MODE == "off":
+        return
+    app.before_request(_begin)
+    app.after_request(_check)
+    app.teardown_request(_end)
+    connection_manager.add_listener(QueryAccountant())
@@ -0,0 +1,254 @@
+"""
+Lightweight request tracing.
+
+Every request gets a request id (X-Request-ID, taken from the caller when
+sane) and a root span; code on the hot path opens child spans with
+`with span("stage"):`, which costs nothing outside a request. Spans are
+kept in memory until the request ends, then the trace is written or
+dropped: TRACE_SAMPLE_RATE of the requests are kept, plus every request
+slower than TRACE_SLOW_MS or answered with a 5xx.
+
+Kept traces go to TRACE_FILE (rotated), one OTLP/JSON
+ExportTraceServiceRequest per line, which OpenTelemetry collectors' file
+receivers and most trace viewers read.
+
+    python -m core.tracing --report [FILE ...]   # per-stage latency breakdown
+"""
+import glob
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from flask import request
+
+import config
+
+_trace = ContextVar("trace", default=None)
+_span = ContextVar("trace_span", default=None)
+
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_ERROR = 2
+
+_writer = None
+
+
+class Trace:
+    __slots__ = ("trace_id", "request_id", "spans")
+
+    def __init__(self, request_id):
+        self.trace_id = os.urandom(16).hex()
+        self.request_id = request_id
+        self.spans = []
+
+
+def current_request_id():
+    trace = _trace.get()
+    return trace.request_id if trace else None
+
+
+def _open_span(name, kind, attributes):
+    parent = _span.get()
+    return {
+        "name": name,
+        "kind": kind,
+        "span_id": os.urandom(8).hex(),
+        "parent_id": parent["span_id"] if parent else None,
+        "start": time.time_ns(),
+        "end": None,
+        "attributes": attributes,
+        "error": None,
+    }
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a stage of the current request; a no-op outside one."""
+    trace = _trace.get()
+    if trace is None:
+        yield None
+        return
+    record = _open_span(name, SPAN_KIND_INTERNAL, attributes)
+    token = _span.set(record)
+    try:
+        yield record
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record["end"] = time.time_ns()
+        _span.reset(token)
+        trace.spans.append(record)
+
+
+def annotate(**attributes):
+    """Add attributes to the innermost open span."""
+    record = _span.get()
+    if record is not None:
+        record["attributes"].update(attributes)
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(trace):
+    spans = []
+    for record in trace.spans:
+        otlp = {
+            "traceId": trace.trace_id,
+            "spanId": record["span_id"],
+            "name": record["name"],
+            "kind": record["kind"],
+            "startTimeUnixNano": str(record["start"]),
+            "endTimeUnixNano": str(record["end"]),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in record["attributes"].items()],
+            "status": {"code": STATUS_ERROR, "message": record["error"]} if record["error"] else {},
+        }
+        if record["parent_id"]:
+            otlp["parentSpanId"] = record["parent_id"]
+        spans.append(otlp)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [
+            {"key": "service.name", "value": {"stringValue": config.MONGO_APP_NAME}},
+            {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+        ]},
+        "scopeSpans": [{"scope": {"name": "pos"}, "spans": spans}],
+    }]}
+
+
+def _trace_writer():
+    global _writer
+    if _writer is None:
+        os.makedirs(os.path.dirname(config.TRACE_FILE) or ".", exist_ok=True)
+        _writer = logging.getLogger("pos.traces")
+        _writer.propagate = False
+        _writer.setLevel(logging.INFO)
+        handler = RotatingFileHandler(
+            config.TRACE_FILE, maxBytes=config.TRACE_FILE_MAX_BYTES, backupCount=config.TRACE_FILE_BACKUPS
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _writer.addHandler(handler)
+    return _writer
+
+
+def _start_trace():
+    incoming = request.headers.get("X-Request-ID", "")
+    trace = Trace(incoming if REQUEST_ID_PATTERN.match(incoming) else uuid.uuid4().hex)
+    rule = request.url_rule.rule if request.url_rule else "unmatched"
+    root = _open_span(f"{request.method} {rule}", SPAN_KIND_SERVER, {
+        "http.method": request.method, "http.route": rule, "request.id": trace.request_id,
+    })
+    request.trace_root = root
+    request.trace_tokens = (_trace.set(trace), _span.set(root))
+
+
+def _tag_response(response):
+    trace = _trace.get()
+    if trace is not None:
+        response.headers["X-Request-ID"] = trace.request_id
+        request.trace_root["attributes"]["http.status_code"] = response.status_code
+    return response
+
+
+def _finish_trace(exc=None):
+    # teardown runs twice for a stream_with_context response: once when
+    # the view returns and again when the stream closes
+    tokens = getattr(request, "trace_tokens", None)
+    if tokens is None:
+        return
+    del request.trace_tokens
+    trace, root = _trace.get(), request.trace_root
+    root["end"] = time.time_ns()
+    status = root["attributes"].setdefault("http.status_code", 500)
+    if exc is not None:
+        root["error"] = f"{type(exc).__name__}: {exc}"
+    trace.spans.append(root)
+    _span.reset(tokens[1])
+    _trace.reset(tokens[0])
+
+    slow = (root["end"] - root["start"]) >= config.TRACE_SLOW_MS * 1_000_000
+    if slow or status >= 500 or random.random() < config.TRACE_SAMPLE_RATE:
+        try:
+            _trace_writer().info(json.dumps(to_otlp(trace), separators=(",", ":")))
+        except OSError:
+            logging.getLogger(__name__).exception("trace not written")
+
+
+def init_app(app):
+    """Install the request hooks unless TRACING_ENABLED is off."""
+    if not config.TRACING_ENABLED:
+        return
+    app.before_request(_start_trace)
+    app.after_request(_tag_response)
+    app.teardown_request(_finish_trace)
+
+
+# --- offline report ---
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def stage_report(paths):
+    """Per span name: count and latency percentiles (ms), share of request time."""
+    stages, root_total = {}, {}
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                try:
+                    batch = json.loads(line)
+                except ValueError:
+                    continue
+                for resource in batch.get("resourceSpans", []):
+                    for scope in resource.get("scopeSpans", []):
+                        spans = scope.get("spans", [])
+                        roots = {s["traceId"]: s for s in spans if not s.get("parentSpanId")}
+                        for s in spans:
+                            ms = (int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"])) / 1e6
+                            stages.setdefault(s["name"], []).append(ms)
+                            root = roots.get(s["traceId"])
+                            if root is not None and s is not root:
+                                root_total.setdefault(s["name"], []).append(
+                                    (int(root["endTimeUnixNano"]) - int(root["startTimeUnixNano"])) / 1e6
+                                )
+    rows = []
+    for name, values in stages.items():
+        totals = root_total.get(name)
+        rows.append({
+            "stage": name,
+            "count": len(values),
+            "p50_ms": round(_percentile(values, 0.5), 3),
+            "p95_ms": round(_percentile(values, 0.95), 3),
+            "p99_ms": round(_percentile(values, 0.99), 3),
+            "max_ms": round(max(values), 3),
+            "share": round(sum(values) / sum(totals), 3) if totals and sum(totals) else None,
+        })
+    return sorted(rows, key=lambda r: -r["p95_ms"])
+
+
+if __name__ == "__main__":
+    if "--report" not in sys.argv:
+        print(__doc__)
+        sys.exit(2)
+    paths = sys.argv[sys.argv.index("--report") + 1:] or sorted(glob.glob(config.TRACE_FILE + "*"))
+    print(f"{'stage':40} {'count':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9} {'share':>6}")
+    for row in stage_report(paths):
+        share = f"{row['share']:.0%}" if row["share"] is not None else "-"
+        print(f"{row['stage']:40} {row['count']:7} {row['p50_ms']:9.2f} {row['p95_ms']:9.2f} "
+              f"{row['p99_ms']:9.2f} {row['max_ms']:9.2f} {share:>6}")
@@ -0,0 +1,332 @@
+"""
+Synthetic data at production scale, on top of seed_data.py.
+
+Runs the regular seeder (collections, counters, default admin/kasir1
+accounts), then adds a generated catalog, staff and sales history:
+
+    python seed_synthetic.py --products 50000 --employees 200 \\
+        --transactions 10000000 --days 730 --workers 8 --seed 42
+
+Sales follow a retail shape: hour-of-day peaks around lunch and evening,
+busier weekends, growth over the period and a December bump; baskets are
+long-tailed (median ~3 lines, up to 60) and product popularity is Zipf
+like. Days are generated in parallel processes, each inserting unordered
+insert_many batches; every day draws from its own RNG derived from
+--seed, so the same arguments give the same data whatever the worker
+count. Generated documents carry source: "synthetic" (--reset removes
+them), and generated sales are numbered SYN-YYYYMMDD-NNNNNN so they never
+take a TXN- number checkout would hand out. Re-running without --reset
+keeps the synthetic products, staff and sales already stored (matched by
+sku, username and SYN- id) and adds only what is missing. Sales rollups and indexes are
+rebuilt at the end.
+"""
+import argparse
+import bisect
+import itertools
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+
+from pymongo.errors import BulkWriteError
+from werkzeug.security import generate_password_hash
+
+import config
+import seed_data
+from core.connection import connection_manager
+from core.id_generator import IDGenerator
+from core.indexes import ensure_indexes
+from services import bulk_product_service, rollup_service
+
+SOURCE = "synthetic"
+PASSWORD = "kasir123"
+DUPLICATE_KEY = 11000
+
+CATEGORIES = [
+    "Beverages", "Food", "Snacks", "Dairy", "Bakery", "Frozen", "Produce",
+    "Household", "Personal Care", "Baby", "Pet", "Stationery",
+]
+ADJECTIVES = ["Premium", "Fresh", "Organik", "Spesial", "Hemat", "Jumbo", "Mini", "Original", "Extra", "Lite"]
+NOUNS = {
+    "Beverages": ["Kopi", "Teh", "Jus", "Susu Kedelai", "Air Mineral", "Soda"],
+    "Food": ["Mie Instan", "Beras", "Sarden", "Kecap", "Sambal", "Minyak Goreng"],
+    "Snacks": ["Keripik", "Biskuit", "Wafer", "Cokelat", "Kacang", "Permen"],
+    "Dairy": ["Susu", "Keju", "Yogurt", "Mentega"],
+    "Bakery": ["Roti Tawar", "Roti Manis", "Donat", "Bolu"],
+    "Frozen": ["Nugget", "Sosis", "Es Krim", "Dimsum"],
+    "Produce": ["Apel", "Pisang", "Tomat", "Bawang", "Cabai"],
+    "Household": ["Sabun Cuci", "Pewangi", "Tisu", "Pembersih Lantai"],
+    "Personal Care": ["Sampo", "Sabun Mandi", "Pasta Gigi", "Deodoran"],
+    "Baby": ["Popok", "Susu Formula", "Tisu Basah"],
+    "Pet": ["Makanan Kucing", "Makanan Anjing", "Pasir Kucing"],
+    "Stationery": ["Pulpen", "Buku Tulis", "Lakban", "Baterai"],
+}
+
+# share of a day's sales per hour, store open 06:00-23:00
+HOUR_WEIGHTS = [0, 0, 0, 0, 0, 0, 0.2, 1.0, 2.0, 2.5, 2.8, 3.5, 4.5, 4.2, 3.0, 2.6, 3.0, 4.0, 5.0, 5.2, 4.0, 2.5, 1.0, 0.2]
+# Monday .. Sunday
+WEEKDAY_WEIGHTS = [0.90, 0.88, 0.90, 0.95, 1.10, 1.35, 1.25]
+PAYMENT_METHODS = (["cash", "card", "digital"], [55, 30, 15])
+
+# set in each worker process by _init_worker
+_catalog = None
+
+
+def day_weights(days, end):
+    """Relative sales volume of each day: weekday x growth x December."""
+    weights = []
+    for n in range(days):
+        day = end - timedelta(days=days - 1 - n)
+        growth = 1 + 0.3 * n / max(days - 1, 1)
+        season = 1.3 if day.month == 12 else 1.0
+        weights.append(WEEKDAY_WEIGHTS[day.weekday()] * growth * season)
+    return weights
+
+
+def split_total(total, weights):
+    """Integer counts proportional to weights that sum exactly to total."""
+    scale = total / sum(weights)
+    exact = [w * scale for w in weights]
+    counts = [math.floor(x) for x in exact]
+    by_fraction = sorted(range(len(exact)), key=lambda i: exact[i] - counts[i], reverse=True)
+    for i in by_fraction[:total - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+
+def make_products(rng, count):
+    products = []
+    for n in range(count):
+        category = CATEGORIES[n % len(CATEGORIES)]
+        price = max(1000, round(rng.lognormvariate(9.6, 0.8) / 500) * 500)
+        stock = rng.randint(0, 9) if rng.random() < 0.05 else rng.randint(10, 500)
+        products.append({
+            "name": f"{rng.choice(NOUNS[category])} {rng.choice(ADJECTIVES)} {n + 1}",
+            "category": category,
+            "price": float(price),
+            "stock": stock,
+            "sku": f"SYN{n + 1:06d}",
+            "source": SOURCE,
+        })
+    return products
+
+
+def seed_products(db, rng, count):
+    """Insert the synthetic catalog; products whose sku is already stored are kept as they are."""
+    products = make_products(rng, count)
+    stored = {
+        p["sku"]: p for p in db.products.find(
+            {"source": SOURCE, "status": {"$ne": "deleted"}},
+            {"_id": 0, "product_id": 1, "name": 1, "price": 1, "sku": 1}
+        )
+    }
+    new = [p for p in products if p["sku"] not in stored]
+    errors = bulk_product_service.insert_products(db, new)
+    if errors:
+        print(f"{len(errors)} products not inserted, e.g. {next(iter(errors.values()))}", file=sys.stderr)
+    if stored:
+        print(f"{len(products) - len(new)} products already stored, kept")
+    failed = {new[i]["sku"] for i in errors}
+    return [stored.get(p["sku"], p) for p in products if p["sku"] not in failed]
+
+
+def seed_staff(db, count):
+    """Insert the synthetic staff; usernames already taken are kept as they are. Returns the cashiers."""
+    usernames = [f"kasir_syn_{n + 1}" for n in range(count)]
+    stored = {
+        e["username"]: e for e in db.master_karyawan.find(
+            {"username": {"$in": usernames}},
+            {"_id": 0, "employee_id": 1, "username": 1, "role": 1}
+        )
+    }
+    missing = [n for n, username in enumerate(usernames) if username not in stored]
+    staff = []
+    if missing:
+        password_hash = generate_password_hash(PASSWORD, method=config.PASSWORD_HASH_METHOD)
+        ids = IDGenerator(db).get_next_ids("EMP", len(missing))
+        staff = [{
+            "employee_id": employee_id,
+            "name": f"Kasir Sintetis {n + 1}",
+            "username": usernames[n],
+            "email": f"{usernames[n]}@smartretail.com",
+            "password_hash": password_hash,
+            "role": "admin" if n % 50 == 0 else "kasir",
+            "status": "active",
+            "created_at": datetime.utcnow(),
+            "source": SOURCE,
+        } for n, employee_id in zip(missing, ids)]
+        db.master_karyawan.insert_many(staff, ordered=False)
+    if stored:
+        print(f"{len(stored)} employees already stored, kept")
+    by_username = dict(stored, **{s["username"]: s for s in staff})
+    return [by_username[u] for u in usernames if by_username[u]["role"] == "kasir"]
+
+
+def _init_worker(catalog):
+    global _catalog
+    _catalog = catalog
+
+
+def _basket(rng, catalog):
+    lines = min(60, max(1, int(rng.lognormvariate(1.1, 0.75))))
+    picks = {}
+    for _ in range(lines):
+        index = bisect.bisect_left(catalog["cum_weights"], rng.random() * catalog["cum_weights"][-1])
+        roll = rng.random()
+        picks[index] = picks.get(index, 0) + (1 if roll < 0.7 else 2 if roll < 0.9 else rng.randint(3, 5))
+    items, total = [], 0.0
+    for index, quantity in picks.items():
+        product = catalog["products"][index]
+        subtotal = product["price"] * quantity
+        total += subtotal
+        items.append({
+            "product_id": product["product_id"],
+            "product_name": product["name"],
+            "price": product["price"],
+            "quantity": quantity,
+            "subtotal": subtotal,
+        })
+    return items, total
+
+
+def _insert_sales(db, batch):
+    """
+    insert_many that skips sales an earlier run already stored.
+    Returns (inserted, skipped); other write errors are raised.
+    """
+    try:
+        db.transactions.insert_many(batch, ordered=False)
+        return len(batch), 0
+    except BulkWriteError as e:
+        errors = e.details["writeErrors"]
+        if any(err["code"] != DUPLICATE_KEY for err in errors):
+            raise
+        return e.details["nInserted"], len(errors)
+
+
+def generate_days(task):
+    """Worker: generate and insert the sales of (day, count) pairs; returns (inserted, skipped)."""
+    catalog = _catalog
+    db = connection_manager.get_database()
+    batch, inserted, skipped = [], 0, 0
+    hours = list(range(24))
+    for day_ordinal, count in task:
+        day = date.fromordinal(day_ordinal)
+        rng = random.Random(f"{catalog['seed']}:sales:{day_ordinal}")
+        seconds = sorted(
+            rng.choices(hours, weights=HOUR_WEIGHTS)[0] * 3600 + rng.randrange(3600)
+            for _ in range(count)
+        )
+        midnight = datetime(day.year, day.month, day.day)
+        for n, second in enumerate(seconds):
+            items, total = _basket(rng, catalog)
+            cashier = rng.choice(catalog["cashiers"])
+            batch.append({
+                "transaction_id": f"SYN-{day:%Y%m%d}-{n + 1:06d}",
+                "items": items,
+                "total_amount": total,
+                "payment_method": rng.choices(*PAYMENT_METHODS)[0],
+                "cashier_id": cashier["employee_id"],
+                "cashier_name": cashier["username"],
+                "customer_name": "",
+                "status": "completed",
+                "store_id": catalog["store_id"],
+                "created_at": midnight + timedelta(seconds=second, microseconds=rng.randrange(1000) * 1000),
+                "source": SOURCE,
+            })
+            if len(batch) >= catalog["batch_size"]:
+                stored, duplicates = _insert_sales(db, batch)
+                inserted += stored
+                skipped += duplicates
+                batch = []
+    if batch:
+        stored, duplicates = _insert_sales(db, batch)
+        inserted += stored
+        skipped += duplicates
+    return inserted, skipped
+
+
+def seed_transactions(products, cashiers, args):
+    end = date.fromisoformat(args.end) if args.end else date.today() - timedelta(days=1)
+    counts = split_total(args.transactions, day_weights(args.days, end))
+    first = end.toordinal() - args.days + 1
+    days = [(first + n, c) for n, c in enumerate(counts) if c]
+    tasks = [days[i:i + 7] for i in range(0, len(days), 7)]
+
+    rng = random.Random(f"{args.seed}:popularity")
+    ranks = list(range(1, len(products) + 1))
+    rng.shuffle(ranks)
+    catalog = {
+        "products": [{k: p[k] for k in ("product_id", "name", "price")} for p in products],
+        "cum_weights": list(itertools.accumulate(1 / rank ** 0.9 for rank in ranks)),
+        "cashiers": [{k: c[k] for k in ("employee_id", "username")} for c in cashiers],
+        "seed": args.seed,
+        "batch_size": args.batch_size,
+        "store_id": args.store_id,
+    }
+
+    started, done, skipped = time.time(), 0, 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(catalog,)) as pool:
+        for inserted, duplicates in pool.map(generate_days, tasks):
+            done += inserted
+            skipped += duplicates
+            rate = (done + skipped) / max(time.time() - started, 1e-6)
+            print(f"\r{done + skipped:,}/{args.transactions:,} transactions ({rate:,.0f}/s)", end="", file=sys.stderr)
+    print(file=sys.stderr)
+    if skipped:
+        print(f"{skipped:,} transactions already stored, skipped")
+    return done
+
+
+def reset(db):
+    for collection in ("transactions", "products", "master_karyawan"):
+        removed = db[collection].delete_many({"source": SOURCE}).deleted_count
+        print(f"removed {removed} synthetic {collection}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a production-sized synthetic dataset.")
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--employees", type=int, default=200)
+    parser.add_argument("--transactions", type=int, default=10_000_000)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--end", help="last day of sales history, YYYY-MM-DD (default yesterday)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--store-id", default=config.STORE_ID)
+    parser.add_argument("--skip-rollups", action="store_true")
+    parser.add_argument("--reset", action="store_true", help="remove previously generated data first")
+    args = parser.parse_args(argv)
+
+    db = connection_manager.get_database()
+    if args.reset:
+        reset(db)
+
+    seed_data.seed_collections()
+    seed_data.seed_counters()
+    seed_data.seed_employees()
+
+    rng = random.Random(args.seed)
+    started = time.time()
+    products = seed_products(db, rng, args.products)
+    print(f"{len(products)} products")
+    cashiers = seed_staff(db, args.employees)
+    print(f"{args.employees} employees ({len(cashiers)} cashiers), password {PASSWORD}")
+    if args.transactions and cashiers and products:
+        print(f"{seed_transactions(products, cashiers, args):,} transactions")
+
+    for row in ensure_indexes(db):
+        if row["status"] != "ok":
+            print(f"index {row['collection']}.{row['index']}: {row.get('detail')}", file=sys.stderr)
+    if not args.skip_rollups:
+        print(f"{rollup_service.rebuild_sales_rollups(db)} hourly buckets")
+        print(f"{rollup_service.rebuild_product_sales(db)} product counters")
+    print(f"done in {time.time() - started:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 """
 Auth business logic: register and login.
 """
-from werkzeug.security import generate_password_hash, check_password_hash
+from services.password_service import hash_password, verify_password
 from core.database import get_db
 from utils.jwt_manager import generate_token
 
@@ -18,7 +18,7 @@ def register_user(username: str, password: str, role: str = "kasir"):
     """
     if _users.find_one({"username": username}):
         return None
-    hashed = generate_password_hash(password)
+    hashed = hash_password(password)
     res = _users.insert_one({"username": username, "password": hashed, "role": role})
     return str(res.inserted_id)
 
@@ -29,7 +29,7 @@ def authenticate_user(username: str, password: str):
     user = _users.find_one({"username": username})
     if not user:
         return None
-    if not check_password_hash(user["password"], password):
+    if not verify_password(user["password"], password)[0]:
         return None
     token = generate_token(str(user["_id"]), user.get("role", "kasir"))
     return {"token": token, "user_id": str(user["_id"]), "role": user.get("role")}
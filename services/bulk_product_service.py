@@ -0,0 +1,136 @@
+"""
+services/bulk_product_service.py
+Bulk catalog writes: import many products and apply price/stock changes
+in batches instead of one request and several round trips per row.
+
+Batches can be far larger than a transaction should be, so they reserve
+their change sequences with catalog_service.write_changes: readers don't
+see the new catalog version until the write has returned.
+"""
+from datetime import datetime
+from pymongo import UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
+from core.id_generator import IDGenerator
+from services import catalog_service
+
+
+def existing_names(db, names):
+    """Names already used by a non-deleted product, in one query."""
+    cursor = db.products.find(
+        {"name": {"$in": list(names)}, "status": {"$ne": "deleted"}},
+        {"_id": 0, "name": 1}
+    )
+    return {p["name"] for p in cursor}
+
+
+def insert_products(db, products):
+    """
+    Assign ids and change sequences to `products` in one block each and
+    insert them with an unordered bulk write.
+    Returns {index in products: error message} for the rows that failed.
+    """
+    if not products:
+        return {}
+    ids = IDGenerator(db).get_next_ids("PRD", len(products))
+
+    def write(last_seq):
+        now = datetime.utcnow()
+        for i, product in enumerate(products):
+            seq = last_seq - len(products) + 1 + i
+            product.update({
+                "product_id": ids[i],
+                "status": "active",
+                "created_at": now,
+                "change_seq": seq,
+                "created_seq": seq
+            })
+
+        errors = {}
+        try:
+            db.products.insert_many(products, ordered=False)
+        except BulkWriteError as e:
+            for err in e.details.get("writeErrors", []):
+                errors[err["index"]] = err.get("errmsg", "write failed")
+        return errors
+
+    return catalog_service.write_changes(db, len(products), write)
+
+
+def update_products(db, updates, key="product_id"):
+    """
+    Apply per-product changes keyed by product_id or sku; an sku update
+    applies to every product carrying it. Each update is a dict with the
+    key and any of price, stock, stock_delta, and keys must not repeat.
+    A stock_delta never takes stock below zero. Returns {index in updates:
+    error message} for the updates not applied.
+    """
+    matches = {}
+    for p in db.products.find(
+        {key: {"$in": [u[key] for u in updates]}, "status": {"$ne": "deleted"}},
+        {"_id": 0, key: 1, "stock": 1}
+    ):
+        matches.setdefault(p[key], []).append(p.get("stock", 0))
+
+    errors = {}
+    todo = []
+    for i, u in enumerate(updates):
+        stocks = matches.get(u[key])
+        if not stocks:
+            errors[i] = "Product not found"
+        elif min(stocks) + u.get("stock_delta", 0) < 0:
+            errors[i] = "Stock would go negative"
+        else:
+            todo.append(i)
+    if not todo:
+        return errors
+
+    def write(last_seq):
+        first_seq = last_seq - len(todo) + 1
+        now = datetime.utcnow()
+        ops = []
+        for n, i in enumerate(todo):
+            u = updates[i]
+            query = {key: u[key], "status": {"$ne": "deleted"}}
+            change = {"$set": {"updated_at": now, "change_seq": first_seq + n}}
+            for field in ("price", "stock"):
+                if field in u:
+                    change["$set"][field] = u[field]
+            if "stock_delta" in u:
+                change["$inc"] = {"stock": u["stock_delta"]}
+                if u["stock_delta"] < 0:
+                    # a sale since the read above may have taken the stock
+                    query["stock"] = {"$gte": -u["stock_delta"]}
+            ops.append((UpdateMany if key == "sku" else UpdateOne)(query, change))
+        result = db.products.bulk_write(ops, ordered=False)
+
+        if result.matched_count < sum(len(matches[updates[i][key]]) for i in todo):
+            # each update stamped its own change_seq, so the products
+            # carrying it are the ones it reached
+            applied = {}
+            for p in db.products.find({"change_seq": {"$gte": first_seq, "$lte": last_seq}}, {"_id": 0, "change_seq": 1}):
+                applied[p["change_seq"]] = applied.get(p["change_seq"], 0) + 1
+            for n, i in enumerate(todo):
+                expected = len(matches[updates[i][key]])
+                done = applied.get(first_seq + n, 0)
+                if done == 0:
+                    errors[i] = "Stock would go negative"
+                elif done < expected:
+                    errors[i] = f"Applied to {done} of {expected} products, stock would go negative for the rest"
+
+    catalog_service.write_changes(db, len(todo), write)
+    return errors
+
+
+def update_category(db, category, price=None, price_multiplier=None, stock=None):
+    """Set price/stock, or scale price, of every product in a category."""
+    def write(seq):
+        change = {"$set": {"updated_at": datetime.utcnow(), "change_seq": seq}}
+        if price is not None:
+            change["$set"]["price"] = price
+        if stock is not None:
+            change["$set"]["stock"] = stock
+        if price_multiplier is not None:
+            change["$mul"] = {"price": price_multiplier}
+        return db.products.update_many({"category": category, "status": {"$ne": "deleted"}}, change)
+
+    return catalog_service.write_changes(db, 1, write).modified_count
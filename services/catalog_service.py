@@ -0,0 +1,238 @@
+"""
+services/catalog_service.py
+Catalog version, change feed and cached product list body.
+
+The catalog version is a monotonically increasing sequence. Product
+writes allocate a number and stamp it on the product as change_seq, and
+a reader that sees version N also sees every product change up to N:
+
+- with transactions (replica set), a single product write and its number
+  commit together;
+- without them (standalone server), and for bulk writes too large for
+  one transaction, the numbers are reserved first and listed on the
+  counter as in flight until the write returns. Readers are given the
+  version just below the oldest write still in flight.
+
+A writer that dies mid-write holds readers back for PENDING_TIMEOUT_SECONDS
+at most. The guarantee holds for writes that finish within that time.
+
+Sales don't move the version: a counter bumped on every checkout would
+change the list's ETag all day long. Stock in the cached list is as of
+the last catalog write; clients lay stock_levels over it and follow
+stock events.
+"""
+import threading
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+from core.database import run_in_transaction
+from core.pagination import encode_cursor
+
+CATALOG_COUNTER = "catalog"
+# how long readers wait on a reservation before assuming its writer died
+PENDING_TIMEOUT_SECONDS = 60
+LIST_FILTER = {"status": {"$ne": "deleted"}}
+# bookkeeping fields of product documents no API response includes
+INTERNAL_FIELDS = ("stock_holds",)
+LIST_PROJECTION = {field: 0 for field in INTERNAL_FIELDS}
+
+_cache = {"version": None, "body": None}
+_cache_lock = threading.Lock()
+
+
+def bump_version(db, count: int = 1, session=None) -> int:
+    """Allocate `count` sequence numbers inside `session`; returns the last one."""
+    counter = db.counters.find_one_and_update(
+        {"_id": CATALOG_COUNTER},
+        {"$inc": {"version": count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+    return counter["version"]
+
+
+def _reserve(db, count):
+    """
+    Allocate `count` sequence numbers and list them as in flight, in one
+    update. Returns (last number, reservation id).
+    """
+    reservation = ObjectId()
+    now = datetime.utcnow()
+    version = {"$ifNull": ["$version", 0]}
+    counter = db.counters.find_one_and_update(
+        {"_id": CATALOG_COUNTER},
+        [{"$set": {
+            "version": {"$add": [version, count]},
+            "pending": {"$concatArrays": [
+                # reservations of writers that died are dropped here
+                {"$filter": {
+                    "input": {"$ifNull": ["$pending", []]},
+                    "cond": {"$gt": ["$$this.at", now - timedelta(seconds=PENDING_TIMEOUT_SECONDS)]}
+                }},
+                [{"id": reservation, "first": {"$add": [version, 1]}, "at": now}]
+            ]}
+        }}],
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["version"], reservation
+
+
+def write_changes(db, count, write):
+    """
+    Call write(last_seq) with `count` fresh sequence numbers, last_seq -
+    count + 1 to last_seq, outside any transaction, and return its
+    result. Readers don't see those versions until write returns.
+    """
+    last_seq, reservation = _reserve(db, count)
+    try:
+        return write(last_seq)
+    finally:
+        db.counters.update_one({"_id": CATALOG_COUNTER}, {"$pull": {"pending": {"id": reservation}}})
+
+
+def write_change(db, write):
+    """
+    Call write(seq, session) with a freshly allocated change sequence and
+    return its result. seq must be stamped as change_seq on the product.
+    """
+    def callback(session):
+        if session is None:
+            return write_changes(db, 1, lambda seq: write(seq, None))
+        seq = bump_version(db, session=session)
+        return write(seq, session)
+    return run_in_transaction(callback)
+
+
+def current_version(db) -> int:
+    """The newest version whose product changes are all stored."""
+    counter = db.counters.find_one({"_id": CATALOG_COUNTER}, {"version": 1, "pending": 1})
+    if not counter:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(seconds=PENDING_TIMEOUT_SECONDS)
+    in_flight = [p["first"] for p in counter.get("pending", []) if p["at"] > cutoff]
+    return min(in_flight) - 1 if in_flight else counter.get("version", 0)
+
+
+def edit_sequence(db) -> int:
+    """
+    change_seq of the newest product edit readers can see. Unlike
+    current_version it doesn't move for numbers that stamped no product
+    (a bulk update that matched nothing), so it only changes with the
+    catalog's content. Two queries.
+    """
+    newest = db.products.find_one(
+        {"change_seq": {"$lte": current_version(db)}},
+        {"_id": 0, "change_seq": 1},
+        sort=[("change_seq", -1)]
+    )
+    return newest["change_seq"] if newest else 0
+
+
+def etag_for(version: int) -> str:
+    return f"catalog-v{version}"
+
+
+def list_body(db, version, render):
+    """
+    (version, body): the serialized product list as of `version` or
+    newer, built once per worker and version. `render` turns the product
+    list into response bytes. A caller whose version lags (a snapshot
+    being rebuilt) gets the newer cached body and its version rather
+    than a query.
+    """
+    with _cache_lock:
+        if _cache["version"] is not None and _cache["version"] >= version:
+            return _cache["version"], _cache["body"]
+
+    products = list(db.products.find(LIST_FILTER, LIST_PROJECTION))
+    for p in products:
+        p["_id"] = str(p["_id"])
+    body = render(products)
+
+    with _cache_lock:
+        if _cache["version"] is None or version >= _cache["version"]:
+            _cache["version"] = version
+            _cache["body"] = body
+    return version, body
+
+
+def stock_levels(db, product_ids=None):
+    """{product_id: stock} of active products, all of them or `product_ids`."""
+    query = {"status": "active"}
+    if product_ids is not None:
+        query["product_id"] = {"$in": list(product_ids)}
+    return {p["product_id"]: p.get("stock", 0) for p in db.products.find(query, {"_id": 0, "product_id": 1, "stock": 1})}
+
+
+def _change_type(product, since):
+    if since is None:
+        return "snapshot"
+    if product.get("status") == "deleted":
+        return "deleted"
+    if product.get("created_seq", 0) > since:
+        return "created"
+    return "updated"
+
+
+def check_after(since, after):
+    """Raises ValueError unless `after` is a page key changes_since made for `since`."""
+    types = (str,) if since is None else (int, str)
+    if not isinstance(after, list) or len(after) != len(types):
+        raise ValueError("invalid cursor")
+    for value, expected in zip(after, types):
+        if not isinstance(value, expected) or isinstance(value, bool):
+            raise ValueError("invalid cursor")
+
+
+def changes_since(db, since, limit: int, after=None, version=None):
+    """
+    One page of the change feed.
+
+    since None is a cold start: a snapshot of non-deleted products paged
+    by product_id. Otherwise products with change_seq > since, paged by
+    (change_seq, product_id). `version` is the catalog version read on
+    the first page; once the last page is fetched, the client continues
+    with since=version. Products changed meanwhile may be sent again,
+    which is harmless since changes are keyed by product_id.
+    """
+    if version is None:
+        version = current_version(db)
+
+    if since is None:
+        query = {"status": {"$ne": "deleted"}}
+        if after:
+            query["product_id"] = {"$gt": after[0]}
+        sort = [("product_id", ASCENDING)]
+    else:
+        query = {"change_seq": {"$gt": since}}
+        if after:
+            query = {"$or": [
+                {"change_seq": {"$gt": after[0]}},
+                {"change_seq": after[0], "product_id": {"$gt": after[1]}}
+            ]}
+        sort = [("change_seq", ASCENDING), ("product_id", ASCENDING)]
+
+    products = list(db.products.find(query, LIST_PROJECTION).sort(sort).limit(limit + 1))
+    has_more = len(products) > limit
+    products = products[:limit]
+
+    changes = []
+    for p in products:
+        p["_id"] = str(p["_id"])
+        changes.append({"type": _change_type(p, since), "product": p})
+
+    cursor = None
+    if has_more:
+        last = products[-1]
+        key = [last["product_id"]] if since is None else [last["change_seq"], last["product_id"]]
+        cursor = encode_cursor({"since": since, "version": version, "after": key})
+
+    return {
+        "since": since,
+        "version": version,
+        "changes": changes,
+        "has_more": has_more,
+        "cursor": cursor
+    }
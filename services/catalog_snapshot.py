@@ -0,0 +1,356 @@
+"""
+services/catalog_snapshot.py
+Read-only catalog columns in a memory-mapped file shared by all workers.
+
+One worker (whoever holds the flock on the lock file) checks every
+CATALOG_SNAPSHOT_REFRESH_SECONDS for a product edit newer than the
+snapshot (catalog_service.edit_sequence; sales don't count) and then
+rebuilds the file in a child process, `python -m services.catalog_snapshot
+--build`: reading and packing the catalog is CPU work that would stall
+the worker's requests, its green threads under eventlet included.
+Builds go to a temp file that is renamed over the snapshot, so a
+generation is swapped in atomically. Workers map it read-only and
+notice a new generation with a stat, and a mapping being read stays
+valid until it is dropped. The pages sit once in the OS page cache
+however many workers map them.
+
+Layout (little-endian, sections 8-byte aligned):
+
+    header     magic, catalog version, edit sequence, built_at (ms), rows,
+               strings, categories and the offset of every section
+    price      float64[rows]
+    stock      int64[rows]
+    product_id uint32[rows]  string refs, rows sorted by product_id
+    name       uint32[rows]
+    sku        uint32[rows]
+    category   uint16[rows]  index into the category table
+    categories uint32[categories]  string refs
+    offsets    uint32[strings + 1] into the blob
+    blob       utf-8 of every interned string
+
+Prices and names are as of the last build; stock may lag further, since
+checkouts move it constantly. Checkout uses the snapshot for pricing and
+leaves stock to the guarded reserve.
+
+    python -m services.catalog_snapshot --build
+    python -m services.catalog_snapshot --show [PRODUCT_ID]
+"""
+import array
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+import config
+from core.connection import connection_manager
+from services import catalog_service
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"POSCAT02"
+# magic, version, edit_seq, built_at_ms, rows, strings, categories, 9 section offsets
+HEADER = struct.Struct("<8sQQQIII" + "Q" * 9)
+SECTIONS = ("price", "stock", "product_id", "name", "sku", "category", "categories", "offsets", "blob")
+SNAPSHOT_FIELDS = {"_id": 0, "product_id": 1, "name": 1, "sku": 1, "category": 1, "price": 1, "stock": 1}
+# how often readers stat the file for a new generation
+CHECK_INTERVAL = 0.5
+# a build taking longer is killed and retried on the next check
+BUILD_TIMEOUT_SECONDS = 300
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+def build(db, path):
+    """Write a snapshot of the active catalog to `path`; returns its version."""
+    version = catalog_service.current_version(db)
+    edit_seq = catalog_service.edit_sequence(db)
+    products = sorted(
+        db.products.find({"status": "active"}, SNAPSHOT_FIELDS),
+        key=lambda p: p["product_id"]
+    )
+
+    strings, interned = [], {}
+
+    def intern(value):
+        value = str(value or "")
+        ref = interned.get(value)
+        if ref is None:
+            ref = interned[value] = len(strings)
+            strings.append(value.encode("utf-8"))
+        return ref
+
+    category_codes = {}
+    columns = {
+        "price": array.array("d"), "stock": array.array("q"),
+        "product_id": array.array("I"), "name": array.array("I"), "sku": array.array("I"),
+        "category": array.array("H"), "categories": array.array("I"),
+    }
+    for p in products:
+        columns["price"].append(float(p.get("price") or 0))
+        columns["stock"].append(int(p.get("stock") or 0))
+        columns["product_id"].append(intern(p["product_id"]))
+        columns["name"].append(intern(p.get("name")))
+        columns["sku"].append(intern(p.get("sku")))
+        category = str(p.get("category") or "")
+        if category not in category_codes:
+            category_codes[category] = len(category_codes)
+            columns["categories"].append(intern(category))
+        columns["category"].append(category_codes[category])
+
+    offsets = array.array("I", [0])
+    for s in strings:
+        offsets.append(offsets[-1] + len(s))
+    columns["offsets"] = offsets
+    blob = b"".join(strings)
+
+    section_offsets, position = [], _align(HEADER.size)
+    for name in SECTIONS:
+        section_offsets.append(position)
+        size = len(blob) if name == "blob" else columns[name].itemsize * len(columns[name])
+        position = _align(position + size)
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    tmp = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(
+            MAGIC, version, edit_seq, int(time.time() * 1000), len(products), len(strings), len(category_codes),
+            *section_offsets
+        ))
+        for name, offset in zip(SECTIONS, section_offsets):
+            f.seek(offset)
+            f.write(blob if name == "blob" else columns[name].tobytes())
+        f.truncate(position)
+    os.replace(tmp, path)
+    return version
+
+
+class CatalogSnapshot:
+    """One mapped generation. Lookups decode only the strings they touch."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.identity = _identity(os.fstat(f.fileno()))
+        header = HEADER.unpack_from(self._mmap)
+        magic, self.version, self.edit_seq, built_at_ms, self.rows, strings, categories = header[:7]
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        self.built_at = built_at_ms / 1000
+        offsets = dict(zip(SECTIONS, header[7:]))
+        view = memoryview(self._mmap)
+
+        def column(name, fmt, count):
+            start = offsets[name]
+            return view[start:start + struct.calcsize(fmt) * count].cast(fmt)
+
+        self.price = column("price", "d", self.rows)
+        self.stock = column("stock", "q", self.rows)
+        self._ids = column("product_id", "I", self.rows)
+        self._names = column("name", "I", self.rows)
+        self._skus = column("sku", "I", self.rows)
+        self._category = column("category", "H", self.rows)
+        self._categories = column("categories", "I", categories)
+        self._offsets = column("offsets", "I", strings + 1)
+        self._blob = view[offsets["blob"]:]
+
+    def string(self, ref):
+        return str(self._blob[self._offsets[ref]:self._offsets[ref + 1]], "utf-8")
+
+    def find(self, product_id):
+        """Row of product_id, or None; binary search over the sorted ids."""
+        lo, hi = 0, self.rows
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.string(self._ids[mid]) < product_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.rows and self.string(self._ids[lo]) == product_id:
+            return lo
+        return None
+
+    def product(self, row):
+        return {
+            "product_id": self.string(self._ids[row]),
+            "name": self.string(self._names[row]),
+            "sku": self.string(self._skus[row]),
+            "category": self.string(self._categories[self._category[row]]),
+            "price": self.price[row],
+            "stock": self.stock[row],
+        }
+
+    def products(self, product_ids):
+        """{product_id: product} for ids in the snapshot."""
+        found = {}
+        for product_id in product_ids:
+            row = self.find(product_id)
+            if row is not None:
+                found[product_id] = self.product(row)
+        return found
+
+
+def _identity(stat):
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+class SnapshotManager:
+    """This worker's view of the current generation, and the builder when it leads."""
+
+    def __init__(self, path, refresh_seconds):
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._started = False
+        self._lock_file = None
+        self.builds = 0
+        self.build_failures = 0
+
+    def current(self):
+        """The newest mapped generation, or None while there is none."""
+        now = time.monotonic()
+        if now - self._checked_at < CHECK_INTERVAL:
+            return self._snapshot
+        with self._lock:
+            if now - self._checked_at < CHECK_INTERVAL:
+                return self._snapshot
+            self._checked_at = now
+            try:
+                identity = _identity(os.stat(self.path))
+            except FileNotFoundError:
+                return self._snapshot
+            if self._snapshot is None or self._snapshot.identity != identity:
+                try:
+                    # the old generation is unmapped once its last reader drops it
+                    self._snapshot = CatalogSnapshot(self.path)
+                except (OSError, ValueError, struct.error) as e:
+                    logger.warning("catalog snapshot %s unreadable: %s", self.path, e)
+            return self._snapshot
+
+    def version(self):
+        snapshot = self.current()
+        return snapshot.version if snapshot else None
+
+    def products(self, product_ids):
+        """
+        {product_id: product} when the snapshot has every id, else None
+        (new products, or no snapshot yet) so the caller asks the database.
+        """
+        snapshot = self.current()
+        if snapshot is None:
+            return None
+        found = snapshot.products(product_ids)
+        return found if len(found) == len(product_ids) else None
+
+    def start(self):
+        """Start the builder loop; only the worker holding the lock builds."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._run, name="catalog-snapshot", daemon=True).start()
+
+    def _try_lead(self):
+        if self._lock_file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            f = open(self.path + ".lock", "a")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                return False
+            # held until this process exits
+            self._lock_file = f
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                if self._try_lead():
+                    edit_seq = catalog_service.edit_sequence(connection_manager.get_database())
+                    snapshot = self.current()
+                    if snapshot is None or snapshot.edit_seq != edit_seq:
+                        self._build()
+            except Exception:
+                self.build_failures += 1
+                logger.exception("catalog snapshot build failed")
+            time.sleep(self.refresh_seconds)
+
+    def _build(self):
+        """Build in a child process; this thread only waits for it."""
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-m", "services.catalog_snapshot", "--build"],
+            cwd=ROOT, env=dict(os.environ, CATALOG_SNAPSHOT_PATH=self.path),
+            capture_output=True, text=True, timeout=BUILD_TIMEOUT_SECONDS
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"build exited with {result.returncode}: {result.stderr.strip()[-2000:]}")
+        self.builds += 1
+        # map the new generation now rather than at the next check
+        self._checked_at = 0.0
+        snapshot = self.current()
+        logger.info(
+            "catalog snapshot v%d (edit %d) built in %.0f ms",
+            snapshot.version, snapshot.edit_seq, (time.perf_counter() - started) * 1000
+        )
+
+    def stats(self):
+        snapshot = self.current()
+        return {
+            "enabled": config.CATALOG_SNAPSHOT_ENABLED,
+            "path": self.path,
+            "builder": self._lock_file is not None,
+            "version": snapshot.version if snapshot else None,
+            "edit_seq": snapshot.edit_seq if snapshot else None,
+            "products": snapshot.rows if snapshot else 0,
+            "age_seconds": round(time.time() - snapshot.built_at, 1) if snapshot else None,
+            "builds": self.builds,
+            "build_failures": self.build_failures,
+        }
+
+    def _after_fork(self):
+        # the builder thread and the lock stay with the parent
+        self._lock = threading.Lock()
+        self._started = False
+        self._lock_file = None
+
+
+catalog_snapshot = SnapshotManager(config.CATALOG_SNAPSHOT_PATH, config.CATALOG_SNAPSHOT_REFRESH_SECONDS)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=catalog_snapshot._after_fork)
+
+
+def init_app(app):
+    """Run the builder loop in every worker when the snapshot is enabled."""
+    if config.CATALOG_SNAPSHOT_ENABLED:
+        # threads started at import would not survive gunicorn's fork
+        app.before_request(catalog_snapshot.start)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if "--build" in sys.argv:
+        version = build(connection_manager.get_database(), catalog_snapshot.path)
+        print(f"catalog snapshot v{version} written to {catalog_snapshot.path}")
+    elif "--show" in sys.argv:
+        snapshot = CatalogSnapshot(catalog_snapshot.path)
+        print(f"v{snapshot.version} (edit {snapshot.edit_seq}), {snapshot.rows} products, built {time.ctime(snapshot.built_at)}")
+        args = sys.argv[sys.argv.index("--show") + 1:]
+        for product_id in args:
+            row = snapshot.find(product_id)
+            print(snapshot.product(row) if row is not None else f"{product_id}: not in snapshot")
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -0,0 +1,424 @@
+"""
+services/checkout_service.py
+Checkout engine: prices a cart and reserves stock in a fixed number of
+round trips, whatever the basket size. Offline registers replay their
+sales through ingest_batch, which does the same for a whole batch.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+import config
+from core.connection import connection_manager
+from core.database import run_in_transaction
+from core.id_generator import IDGenerator
+from core.tracing import annotate, span
+from services import event_service, rollup_service
+from services.catalog_snapshot import catalog_snapshot
+from services.journal_service import receipt_journal
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_FIELDS = {"_id": 0, "product_id": 1, "name": 1, "price": 1, "stock": 1, "category": 1}
+
+
+class CheckoutError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def load_products(db, product_ids, session=None):
+    """Fetch every active product of the cart with one $in query."""
+    cursor = db.products.find(
+        {"product_id": {"$in": list(product_ids)}, "status": "active"},
+        PRODUCT_FIELDS,
+        session=session
+    )
+    return {p["product_id"]: p for p in cursor}
+
+
+def price_items(items, products):
+    """
+    Build transaction lines from the cart and the loaded products.
+    Returns (lines, total_amount, quantities per product_id).
+    """
+    lines = []
+    total_amount = 0
+    quantities = {}
+
+    for item in items:
+        product = products.get(item["product_id"])
+        if not product:
+            raise CheckoutError(f"Product {item['product_id']} not found")
+
+        quantity = int(item["quantity"])
+        quantities[product["product_id"]] = quantities.get(product["product_id"], 0) + quantity
+        if product["stock"] < quantities[product["product_id"]]:
+            raise CheckoutError(f"Insufficient stock for {product['name']}")
+
+        item_total = product["price"] * quantity
+        total_amount += item_total
+        lines.append({
+            "product_id": product["product_id"],
+            "product_name": product["name"],
+            "price": product["price"],
+            "quantity": quantity,
+            "subtotal": item_total
+        })
+
+    return lines, total_amount, quantities
+
+
+def _shortfall_error(db, quantities, session=None):
+    current = load_products(db, quantities.keys(), session=session)
+    for product_id, qty in quantities.items():
+        product = current.get(product_id)
+        if not product:
+            return CheckoutError(f"Product {product_id} not found")
+        if product["stock"] < qty:
+            return CheckoutError(f"Insufficient stock for {product['name']}")
+    return CheckoutError("Insufficient stock", status=409)
+
+
+def reserve_stock(db, quantities, session=None):
+    """
+    Decrement stock for every product in one bulk_write. Each update is
+    guarded by stock >= qty, so a concurrent sale that drained a product
+    makes the whole basket fail.
+
+    Inside a transaction a shortfall simply aborts it. Without one, each
+    update pushes a hold marker so exactly the applied decrements can be
+    given back, and the hold is returned for release_stock. Holds are not
+    pulled on the sale path; sweep_holds clears them once they are older
+    than any sale takes to commit or give its stock back.
+    """
+    if session is not None:
+        ops = [
+            UpdateOne(
+                {"product_id": pid, "status": "active", "stock": {"$gte": qty}},
+                {"$inc": {"stock": -qty}}
+            )
+            for pid, qty in quantities.items()
+        ]
+        result = db.products.bulk_write(ops, ordered=False, session=session)
+        if result.matched_count != len(ops):
+            raise _shortfall_error(db, quantities, session=session)
+        return None
+
+    hold = ObjectId()
+    ops = [
+        UpdateOne(
+            {"product_id": pid, "status": "active", "stock": {"$gte": qty}},
+            {"$inc": {"stock": -qty}, "$push": {"stock_holds": hold}}
+        )
+        for pid, qty in quantities.items()
+    ]
+    result = db.products.bulk_write(ops, ordered=False)
+    if result.matched_count != len(ops):
+        release_stock(db, quantities, hold)
+        raise _shortfall_error(db, quantities)
+    return hold
+
+
+def release_stock(db, quantities, hold=None):
+    """
+    Give back decrements. With a hold only the updates applied under that
+    hold are reverted.
+    """
+    ops = []
+    for pid, qty in quantities.items():
+        if hold is None:
+            ops.append(UpdateOne({"product_id": pid}, {"$inc": {"stock": qty}}))
+        else:
+            ops.append(UpdateOne(
+                {"product_id": pid, "stock_holds": hold},
+                {"$inc": {"stock": qty}, "$pull": {"stock_holds": hold}}
+            ))
+    db.products.bulk_write(ops, ordered=False)
+
+
+def sweep_holds(db, ttl=None):
+    """Pull holds older than `ttl` seconds from every product; returns the products touched."""
+    ttl = config.STOCK_HOLD_TTL_SECONDS if ttl is None else ttl
+    # holds are ObjectIds, so their age is in their first bytes
+    cutoff = ObjectId.from_datetime(datetime.utcnow() - timedelta(seconds=ttl))
+    result = db.products.update_many(
+        {"stock_holds": {"$lt": cutoff}},
+        {"$pull": {"stock_holds": {"$lt": cutoff}}}
+    )
+    return result.modified_count
+
+
+class HoldSweeper:
+    """Runs sweep_holds every STOCK_HOLD_TTL_SECONDS in a daemon thread."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._run, name="stock-hold-sweeper", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                swept = sweep_holds(connection_manager.get_database(), self.interval)
+                if swept:
+                    logger.info("cleared stale stock holds on %d products", swept)
+            except Exception:
+                logger.exception("stock hold sweep failed")
+
+    def _after_fork(self):
+        self._started = False
+        self._lock = threading.Lock()
+
+
+hold_sweeper = HoldSweeper(config.STOCK_HOLD_TTL_SECONDS)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=hold_sweeper._after_fork)
+
+
+def init_app(app):
+    """Sweep stock holds from every worker; the update is idempotent."""
+    # threads started at import would not survive gunicorn's fork
+    app.before_request(hold_sweeper.start)
+
+
+def categories_of(products):
+    return {pid: p.get("category", "") for pid, p in products.items()}
+
+
+def _transaction_doc(transaction_id, data, lines, total_amount, cashier):
+    return {
+        "transaction_id": transaction_id,
+        "items": lines,
+        "total_amount": total_amount,
+        "payment_method": data.get("payment_method", "cash"),
+        "cashier_id": cashier["user_id"],
+        "cashier_name": cashier.get("username", ""),
+        "customer_name": data.get("customer_name", ""),
+        "status": "completed",
+        "store_id": config.STORE_ID,
+        "created_at": datetime.utcnow()
+    }
+
+
+def _journal_receipt(db, transaction, quantities, products):
+    """
+    Reserve stock now and leave the receipt insert and its rollups to the
+    journal flusher. Returns False, with the stock given back, when the
+    journal can't be written so the caller commits synchronously.
+    """
+    transaction["_id"] = ObjectId()
+    with span("checkout.reserve_stock", products=len(quantities)):
+        hold = reserve_stock(db, quantities)
+    try:
+        with span("checkout.journal_append"):
+            receipt_journal.append(transaction, categories_of(products))
+    except OSError:
+        logger.exception("receipt journal unavailable, storing %s synchronously", transaction["transaction_id"])
+        release_stock(db, quantities, hold)
+        del transaction["_id"]
+        return False
+    return True
+
+
+def checkout(db, data, cashier):
+    """
+    Validate a cart against the catalog, reserve stock and record the
+    transaction. Raises CheckoutError when the basket can't be sold.
+    """
+    product_ids = {item["product_id"] for item in data["items"]}
+    products = catalog_snapshot.products(product_ids) if config.CATALOG_SNAPSHOT_ENABLED else None
+    if products is not None:
+        annotate(catalog="snapshot")
+        try:
+            with span("checkout.price", lines=len(data["items"])):
+                lines, total_amount, quantities = price_items(data["items"], products)
+        except CheckoutError:
+            # snapshot stock may predate a restock; let the database decide
+            products = None
+    if products is None:
+        with span("checkout.load_products"):
+            products = load_products(db, product_ids)
+        with span("checkout.price", lines=len(data["items"])):
+            lines, total_amount, quantities = price_items(data["items"], products)
+
+    with span("checkout.id_generation"):
+        transaction_id = IDGenerator(db).get_next_id("TXN")
+    transaction = _transaction_doc(transaction_id, data, lines, total_amount, cashier)
+
+    if config.CHECKOUT_DURABILITY == "journal" and _journal_receipt(db, transaction, quantities, products):
+        event_service.publish_sale(transaction)
+        return transaction
+
+    def commit(session):
+        annotate(transactional=session is not None)
+        transaction.pop("_id", None)
+        with span("checkout.reserve_stock", products=len(quantities)):
+            hold = reserve_stock(db, quantities, session=session)
+        try:
+            with span("checkout.insert"):
+                db.transactions.insert_one(transaction, session=session)
+        except Exception:
+            if session is None:
+                release_stock(db, quantities, hold)
+            raise
+        if session is not None:
+            with span("checkout.product_sales"):
+                rollup_service.record_product_sales(db, [transaction], categories_of(products), session=session)
+        return session is not None
+
+    with span("checkout.commit"):
+        transactional = run_in_transaction(commit)
+    with span("checkout.rollups"):
+        rollup_service.record_committed(db, [transaction], categories_of(products), product_sales=not transactional)
+    event_service.publish_sale(transaction)
+    return transaction
+
+
+def _plan_batch(entries, pending, products):
+    """
+    Price the pending entries in order against one snapshot of stock.
+    Returns (accepted [(index, lines, total)], quantities per product,
+    rejected {index: reason}); an entry is rejected when it would sell
+    more than what the entries before it left.
+    """
+    remaining = {pid: p["stock"] for pid, p in products.items()}
+    accepted, quantities, rejected = [], {}, {}
+    for i in pending:
+        try:
+            lines, total_amount, needed = price_items(entries[i]["items"], products)
+        except CheckoutError as e:
+            rejected[i] = str(e)
+            continue
+        short = next((pid for pid, qty in needed.items() if remaining[pid] < qty), None)
+        if short:
+            rejected[i] = f"Insufficient stock for {products[short]['name']}"
+            continue
+        for pid, qty in needed.items():
+            remaining[pid] -= qty
+            quantities[pid] = quantities.get(pid, 0) + qty
+        accepted.append((i, lines, total_amount))
+    return accepted, quantities, rejected
+
+
+def _line_quantities(docs):
+    quantities = {}
+    for doc in docs:
+        for line in doc["items"]:
+            quantities[line["product_id"]] = quantities.get(line["product_id"], 0) + line["quantity"]
+    return quantities
+
+
+def ingest_batch(db, entries, cashier, attempts=3):
+    """
+    Record a batch of sales replayed by an offline register. Each entry is
+    a validated cart carrying a client `idempotency_key` and optionally
+    the `created_at` (naive UTC datetime) of the original sale.
+
+    Keys already stored, or repeated in the batch, come back as duplicate
+    with the stored transaction_id, so a replayed batch never sells twice.
+    The rest is priced against one read of the catalog and committed with
+    one guarded stock bulk_write and one insert_many, in a transaction
+    when the deployment has them. A batch that races another sale or a
+    concurrent replay of the same keys is planned again from fresh state.
+
+    Returns one result per entry: created, duplicate, rejected or error.
+    """
+    results = [None] * len(entries)
+    first_by_key = {}
+    pending = []
+    for i, entry in enumerate(entries):
+        key = entry["idempotency_key"]
+        if key in first_by_key:
+            results[i] = {"status": "duplicate", "duplicate_of": first_by_key[key]}
+        else:
+            first_by_key[key] = i
+            pending.append(i)
+
+    committed = []
+    products = {}
+    for attempt in range(attempts):
+        stored = db.transactions.find(
+            {"idempotency_key": {"$in": [entries[i]["idempotency_key"] for i in pending]}},
+            {"_id": 0, "idempotency_key": 1, "transaction_id": 1}
+        )
+        stored = {t["idempotency_key"]: t["transaction_id"] for t in stored}
+        for i in pending:
+            if entries[i]["idempotency_key"] in stored:
+                results[i] = {"status": "duplicate", "transaction_id": stored[entries[i]["idempotency_key"]]}
+        pending = [i for i in pending if results[i] is None]
+
+        products = load_products(db, {item["product_id"] for i in pending for item in entries[i]["items"]})
+        accepted, quantities, rejected = _plan_batch(entries, pending, products)
+        if not accepted:
+            break
+
+        received_at = datetime.utcnow()
+        ids = IDGenerator(db).get_next_ids("TXN", len(accepted))
+        docs = []
+        for transaction_id, (i, lines, total_amount) in zip(ids, accepted):
+            doc = _transaction_doc(transaction_id, entries[i], lines, total_amount, cashier)
+            doc["idempotency_key"] = entries[i]["idempotency_key"]
+            doc["created_at"] = entries[i].get("created_at") or received_at
+            doc["received_at"] = received_at
+            docs.append(doc)
+
+        def commit(session):
+            for doc in docs:
+                doc.pop("_id", None)
+            hold = reserve_stock(db, quantities, session=session)
+            try:
+                db.transactions.insert_many(docs, ordered=False, session=session)
+            except BulkWriteError as e:
+                if session is not None:
+                    raise
+                # without a transaction the other inserts stand; give back
+                # the stock of the ones that failed
+                failed = {err["index"]: err for err in e.details["writeErrors"]}
+                release_stock(db, _line_quantities([docs[n] for n in failed]), hold)
+                return failed, False
+            if session is not None:
+                rollup_service.record_product_sales(db, docs, categories_of(products), session=session)
+            return {}, session is not None
+
+        try:
+            failed, transactional = run_in_transaction(commit)
+        except (CheckoutError, BulkWriteError) as e:
+            logger.info("batch ingest attempt %d conflicted: %s", attempt + 1, e)
+            continue
+
+        for n, (i, _, _) in enumerate(accepted):
+            err = failed.get(n)
+            if err is None:
+                committed.append(docs[n])
+                results[i] = {"status": "created", "transaction_id": docs[n]["transaction_id"]}
+            elif err.get("code") == 11000 and "idempotency_key" in err.get("keyPattern", {}):
+                # stored by a concurrent replay since we looked
+                results[i] = {"status": "duplicate"}
+            else:
+                results[i] = {"status": "error", "error": err.get("errmsg", "insert failed")}
+        break
+    else:
+        raise CheckoutError("Batch kept conflicting with concurrent sales, retry it", status=409)
+
+    for i, reason in rejected.items():
+        results[i] = {"status": "rejected", "error": reason}
+    if committed:
+        rollup_service.record_committed(db, committed, categories_of(products), product_sales=not transactional)
+        for transaction in committed:
+            event_service.publish_sale(transaction)
+    return results
@@ -0,0 +1,177 @@
+"""
+services/dashboard_service.py
+Everything the admin dashboard shows, in one payload.
+
+Each section is an independent query run on a small per-worker thread
+pool, so the bundle takes as long as its slowest section rather than
+the sum of all of them. Sections that fail or miss the deadline are
+reported in "errors" and the rest is returned anyway. A complete bundle
+is kept for DASHBOARD_CACHE_TTL_SECONDS and callers arriving while one
+is being computed wait for it instead of starting their own.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+import config
+from services import rollup_service
+from services.catalog_service import LIST_FILTER, LIST_PROJECTION
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+SECTION_SECONDS = registry.histogram(
+    "dashboard_section_seconds", "Time to compute one dashboard bundle section.", ("section",)
+)
+
+
+def _today(db):
+    total, count = rollup_service.day_totals(db, datetime.utcnow())
+    return {"today_sales": total, "today_transactions": count}
+
+
+def _daily(db):
+    end = datetime.utcnow()
+    return rollup_service.sales_series(db, end - timedelta(days=7), end, "day")
+
+
+def _products(db):
+    products = list(db.products.find(LIST_FILTER, LIST_PROJECTION))
+    for p in products:
+        p["_id"] = str(p["_id"])
+    return products
+
+
+def _employees(db):
+    employees = list(db.master_karyawan.find({"status": "active"}, {"password_hash": 0}))
+    for e in employees:
+        e["_id"] = str(e["_id"])
+    return employees
+
+
+SECTIONS = {
+    "today": _today,
+    "total_products": lambda db: db.products.count_documents({"status": "active"}),
+    "low_stock_products": lambda db: db.products.count_documents({"status": "active", "stock": {"$lt": 10}}),
+    "total_employees": lambda db: db.master_karyawan.count_documents({"status": "active"}),
+    "daily": _daily,
+    "bestsellers": lambda db: rollup_service.top_products(db, 5),
+    "products": _products,
+    "employees": _employees,
+}
+
+
+class DashboardBundle:
+    def __init__(self, workers, ttl, timeout):
+        self.workers = workers
+        self.ttl = ttl
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+        self._cached = None  # (monotonic time computed, body)
+        self._pending = None
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="dashboard")
+            return self._executor
+
+    def _timed(self, name, db):
+        started = time.perf_counter()
+        try:
+            return SECTIONS[name](db), round((time.perf_counter() - started) * 1000, 1)
+        finally:
+            SECTION_SECONDS.observe(name, value=time.perf_counter() - started)
+
+    def compute(self, db):
+        """Run every section concurrently; returns the payload."""
+        started = time.perf_counter()
+        pool = self._pool()
+        # each section carries the request's context, so its queries are
+        # charged to the request's budget and its spans to its trace
+        futures = {
+            pool.submit(contextvars.copy_context().run, self._timed, name, db): name
+            for name in SECTIONS
+        }
+        done, _ = wait(futures, timeout=self.timeout)
+
+        results, errors, timings = {}, {}, {}
+        for future, name in futures.items():
+            if future not in done:
+                errors[name] = "timed out"
+                continue
+            try:
+                results[name], timings[name] = future.result()
+            except Exception as e:
+                logger.exception("dashboard section %s failed", name)
+                errors[name] = f"{type(e).__name__}: {e}"
+
+        today = results.pop("today", {"today_sales": None, "today_transactions": None})
+        stats = dict(today)
+        for name in ("total_products", "low_stock_products", "total_employees"):
+            stats[name] = results.pop(name, None)
+        return {
+            "stats": stats,
+            "daily": results.get("daily"),
+            "bestsellers": results.get("bestsellers"),
+            "products": results.get("products"),
+            "employees": results.get("employees"),
+            "errors": errors,
+            "timings_ms": timings,
+            "total_ms": round((time.perf_counter() - started) * 1000, 1),
+            "generated_at": datetime.utcnow().isoformat() + "Z",
+        }
+
+    def get(self, db, render):
+        """
+        (body, age in seconds) where body is render(payload); age 0 means
+        this call computed it. Bundles with errors are handed to callers
+        already waiting on them but not cached.
+        """
+        with self._lock:
+            if self._cached and time.monotonic() - self._cached[0] < self.ttl:
+                return self._cached[1], time.monotonic() - self._cached[0]
+            pending = self._pending
+            leader = pending is None
+            if leader:
+                pending = self._pending = Future()
+
+        if not leader:
+            body, computed_at = pending.result()
+            return body, time.monotonic() - computed_at
+
+        try:
+            payload = self.compute(db)
+            body = render(payload)
+            computed_at = time.monotonic()
+            with self._lock:
+                if not payload["errors"] and self.ttl > 0:
+                    self._cached = (computed_at, body)
+                self._pending = None
+            pending.set_result((body, computed_at))
+            return body, 0.0
+        except BaseException as e:
+            with self._lock:
+                self._pending = None
+            pending.set_exception(e)
+            raise
+
+    def _after_fork(self):
+        # threads don't survive a fork; start a fresh pool on first use
+        self._executor = None
+        self._lock = threading.Lock()
+        self._cached = None
+        self._pending = None
+
+
+dashboard_bundle = DashboardBundle(
+    config.DASHBOARD_WORKERS, config.DASHBOARD_CACHE_TTL_SECONDS, config.DASHBOARD_SECTION_TIMEOUT_SECONDS
+)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=dashboard_bundle._after_fork)
@@ -2,7 +2,7 @@
 services/karyawan_service.py
 Manage employee (karyawan) data.
 """
-from werkzeug.security import generate_password_hash
+from services.password_service import hash_password
 from core.database import get_db
 from core.id_generator import IDGenerator
 from datetime import datetime
@@ -13,7 +13,7 @@ id_gen = IDGenerator(db)
 def create_karyawan(name, username, password, role):
     # Generate unique employee ID
     emp_id = id_gen.get_next_id("EMP")
-    password_hash = generate_password_hash(password)
+    password_hash = hash_password(password)
 
     karyawan = {
         "employee_id": emp_id,
@@ -0,0 +1,316 @@
+"""
+services/event_service.py
+Live events for dashboards and registers, served as server-sent events.
+
+Events are small JSON payloads: a committed sale, stock level changes
+and catalog edits. Each worker keeps a bus with the last EVENTS_HISTORY
+events, so a client reconnecting with Last-Event-ID gets what it missed,
+and one bounded queue per open stream. A stream that falls behind by
+more than EVENTS_QUEUE_SIZE events, or resumes from an id the bus no
+longer has, gets a "reset" event and should reload full state.
+
+EVENTS_SOURCE picks where events come from:
+
+- local: the API write paths publish to this worker's bus. Enough with
+  one worker per instance (the Dockerfile runs one eventlet worker);
+  streams don't see writes handled by other instances.
+- change_stream: every worker follows MongoDB change streams on
+  transactions and products, so all streams see all writes. Needs a
+  replica set.
+
+Waiting uses threading primitives, which the eventlet worker patches into
+green ones: an idle stream is a parked greenthread and a heartbeat
+comment every EVENTS_HEARTBEAT_SECONDS.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import config
+from core.connection import connection_manager
+
+logger = logging.getLogger(__name__)
+
+RESET = "reset"
+# product fields whose change is not worth an event
+QUIET_FIELDS = {"stock_holds", "change_seq", "updated_at", "deleted_at"}
+# the only product fields a checkout, its release or the hold sweep writes
+CHECKOUT_FIELDS = {"stock", "stock_holds"}
+# product ids listed in one catalog event
+MAX_EVENT_PRODUCT_IDS = 100
+
+
+class Subscription:
+    """One open stream: a bounded queue of encoded frames."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._frames = deque()
+        self._cond = threading.Condition()
+        self.lagged = False
+        self.closed = False
+
+    def offer(self, frame):
+        with self._cond:
+            if self.lagged:
+                return
+            if len(self._frames) >= self.max_size:
+                # don't block the publisher on a slow client; it resyncs
+                self._frames.clear()
+                self.lagged = True
+            else:
+                self._frames.append(frame)
+            self._cond.notify()
+
+    def next_frames(self, timeout):
+        """Queued frames, [] after `timeout` seconds, or RESET once lagged."""
+        with self._cond:
+            if not self._frames and not self.lagged and not self.closed:
+                self._cond.wait(timeout)
+            if self.lagged:
+                self.lagged = False
+                return RESET
+            frames = list(self._frames)
+            self._frames.clear()
+            return frames
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+
+class EventBus:
+    def __init__(self, history, queue_size, max_subscribers):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._reset_ids()
+        self.published = 0
+        self.resets = 0
+
+    def _reset_ids(self):
+        # ids are "<boot>-<seq>"; an id from an earlier process (or another
+        # worker) can't be resumed and gets a reset instead
+        self.boot = f"{int(time.time() * 1000):x}{os.getpid():x}"
+        self._seq = 0
+
+    def publish(self, event_type, data):
+        with self._lock:
+            self._seq += 1
+            event_id = f"{self.boot}-{self._seq}"
+            payload = json.dumps(data, separators=(",", ":"), default=str)
+            frame = f"id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n".encode()
+            self._history.append((self._seq, frame))
+            subscribers = list(self._subscribers)
+            self.published += 1
+        for subscription in subscribers:
+            if subscription.lagged:
+                continue
+            subscription.offer(frame)
+            if subscription.lagged:
+                self.resets += 1
+
+    def subscribe(self, last_event_id=None):
+        """
+        (subscription, backlog) where backlog is the frames after
+        last_event_id, or a reset frame when they are no longer available.
+        Returns (None, None) when the worker has no room for another stream.
+        """
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None, None
+            self._subscribers.add(subscription)
+            backlog = self._since(last_event_id) if last_event_id else []
+        return subscription, backlog
+
+    def _since(self, last_event_id):
+        boot, _, seq = last_event_id.rpartition("-")
+        if boot != self.boot or not seq.isdigit():
+            return [self._reset_frame()]
+        seq = int(seq)
+        oldest = self._history[0][0] if self._history else self._seq + 1
+        if seq > self._seq or seq < oldest - 1:
+            return [self._reset_frame()]
+        return [frame for s, frame in self._history if s > seq]
+
+    def _reset_frame(self):
+        # carries the latest id, so the client resumes from here after reloading
+        return f"id: {self.boot}-{self._seq}\nevent: {RESET}\ndata: {{}}\n\n".encode()
+
+    def reset_frame(self):
+        with self._lock:
+            return self._reset_frame()
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+        subscription.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "source": config.EVENTS_SOURCE,
+                "subscribers": len(self._subscribers),
+                "max_subscribers": self.max_subscribers,
+                "history": len(self._history),
+                "published": self.published,
+                "resets": self.resets,
+            }
+
+    def _after_fork(self):
+        # parent streams and ids don't belong to the child
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history.clear()
+        self._reset_ids()
+
+
+event_bus = EventBus(config.EVENTS_HISTORY, config.EVENTS_QUEUE_SIZE, config.EVENTS_MAX_SUBSCRIBERS)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=event_bus._after_fork)
+
+
+# --- event payloads ---
+
+def sale_event(transaction):
+    return {
+        "transaction_id": transaction["transaction_id"],
+        "total_amount": transaction["total_amount"],
+        "items": len(transaction["items"]),
+        "payment_method": transaction.get("payment_method"),
+        "store_id": transaction.get("store_id", config.STORE_ID),
+        "created_at": transaction["created_at"].isoformat() + "Z",
+    }
+
+
+def stock_deltas(transaction):
+    return {"changes": [
+        {"product_id": line["product_id"], "delta": -line["quantity"]} for line in transaction["items"]
+    ]}
+
+
+def _local():
+    return config.EVENTS_SOURCE == "local"
+
+
+def publish_sale(transaction):
+    """A committed sale and the stock it took."""
+    if not _local():
+        return
+    event_bus.publish("sale", sale_event(transaction))
+    event_bus.publish("stock", stock_deltas(transaction))
+
+
+def publish_catalog(action, product_ids=(), count=None, **fields):
+    """
+    Products created, updated or deleted. Bulk edits too big to list (or
+    keyed by sku) send only the count; clients then catch up through
+    /api/products/changes.
+    """
+    if not _local():
+        return
+    product_ids = list(product_ids)
+    data = {"action": action, "count": len(product_ids) if count is None else count}
+    if 0 < len(product_ids) <= MAX_EVENT_PRODUCT_IDS:
+        data["product_ids"] = product_ids
+    data.update(fields)
+    event_bus.publish("catalog", data)
+
+
+def publish_stock(changes):
+    """[{"product_id", "stock"}] for absolute levels or {"product_id", "delta"}."""
+    if _local() and changes:
+        event_bus.publish("stock", {"changes": changes})
+
+
+# --- change stream source ---
+
+class ChangeStreamFeed:
+    """Publishes events from MongoDB change streams, one thread per watch."""
+
+    def __init__(self, bus):
+        self.bus = bus
+        self._started = False
+        self._lock = threading.Lock()
+        # last change seen per collection, to resume without gaps
+        self._resume = {}
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for collection, handle in (("transactions", self._on_transaction), ("products", self._on_product)):
+            threading.Thread(target=self._follow, args=(collection, handle), daemon=True).start()
+
+    def _follow(self, collection, handle):
+        delay = 1
+        while True:
+            try:
+                self._watch(collection, handle)
+                delay = 1
+            except Exception as e:
+                # e.g. a standalone server, which has no change streams
+                logger.warning("change stream on %s interrupted, retrying in %ds: %s", collection, delay, e)
+                time.sleep(delay)
+                delay = min(delay * 2, 60)
+
+    def _watch(self, collection, handle):
+        db = connection_manager.get_database()
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+        with db[collection].watch(
+            pipeline, resume_after=self._resume.get(collection), full_document="updateLookup"
+        ) as stream:
+            for change in stream:
+                self._resume[collection] = change["_id"]
+                handle(change)
+
+    def _on_transaction(self, change):
+        if change["operationType"] == "insert":
+            transaction = change["fullDocument"]
+            self.bus.publish("sale", sale_event(transaction))
+            self.bus.publish("stock", stock_deltas(transaction))
+
+    def _on_product(self, change):
+        product = change.get("fullDocument") or {}
+        product_id = product.get("product_id")
+        if change["operationType"] != "update":
+            action = "created" if change["operationType"] == "insert" else "updated"
+            self.bus.publish("catalog", {"action": action, "count": 1, "product_ids": [product_id]})
+            return
+        updated = {f.split(".")[0] for f in change["updateDescription"]["updatedFields"]}
+        if updated <= CHECKOUT_FIELDS:
+            # checkout stock moves, already reported as sale deltas
+            return
+        fields = updated - QUIET_FIELDS
+        if "stock" in fields:
+            self.bus.publish("stock", {"changes": [{"product_id": product_id, "stock": product.get("stock")}]})
+        fields.discard("stock")
+        if fields:
+            action = "deleted" if product.get("status") == "deleted" else "updated"
+            self.bus.publish("catalog", {"action": action, "count": 1, "product_ids": [product_id]})
+
+    def _after_fork(self):
+        self._started = False
+        self._lock = threading.Lock()
+
+
+change_stream_feed = ChangeStreamFeed(event_bus)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=change_stream_feed._after_fork)
+
+
+def init_app(app):
+    """Follow change streams when EVENTS_SOURCE is change_stream."""
+    if config.EVENTS_SOURCE == "change_stream":
+        # threads started at import would not survive gunicorn's fork
+        app.before_request(change_stream_feed.start)
@@ -0,0 +1,110 @@
+"""
+services/export_service.py
+Streaming transaction export (NDJSON or CSV, optionally gzipped).
+Rows are pulled from a server-side cursor and written out in small
+chunks, so memory stays flat whatever the date range.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+BATCH_SIZE = 1000
+CHUNK_BYTES = 64 * 1024
+
+TRANSACTION_COLUMNS = [
+    "transaction_id", "created_at", "store_id", "cashier_id", "cashier_name",
+    "customer_name", "payment_method", "status", "total_amount"
+]
+LINE_COLUMNS = [
+    "transaction_id", "created_at", "store_id", "cashier_id", "payment_method",
+    "product_id", "product_name", "price", "quantity", "subtotal"
+]
+
+
+def export_query(start=None, end=None, cashier_id=None, payment_method=None):
+    query = {}
+    if start or end:
+        query["created_at"] = {}
+        if start:
+            query["created_at"]["$gte"] = start
+        if end:
+            query["created_at"]["$lt"] = end
+    if cashier_id:
+        query["cashier_id"] = cashier_id
+    if payment_method:
+        query["payment_method"] = payment_method
+    return query
+
+
+def iter_rows(db, query, lines=False):
+    """Transactions, or one row per line item, oldest first."""
+    projection = {"_id": 0} if lines else {"_id": 0, "items": 0}
+    cursor = db.transactions.find(query, projection).sort("created_at", 1).batch_size(BATCH_SIZE)
+    try:
+        for t in cursor:
+            if not lines:
+                yield t
+                continue
+            for item in t.get("items", []):
+                row = {c: t.get(c) for c in LINE_COLUMNS[:5]}
+                row.update(item)
+                yield row
+    finally:
+        cursor.close()
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def ndjson_chunks(rows):
+    buf = []
+    size = 0
+    for row in rows:
+        line = json.dumps(row, default=_default, separators=(",", ":")) + "\n"
+        buf.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield "".join(buf).encode("utf-8")
+            buf, size = [], 0
+    if buf:
+        yield "".join(buf).encode("utf-8")
+
+
+def csv_chunks(rows, columns):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([
+            row.get(c).isoformat() if isinstance(row.get(c), datetime) else row.get(c, "")
+            for c in columns
+        ])
+        if out.tell() >= CHUNK_BYTES:
+            yield out.getvalue().encode("utf-8")
+            out.seek(0)
+            out.truncate()
+    if out.tell():
+        yield out.getvalue().encode("utf-8")
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(db, query, fmt="ndjson", lines=False, gzip=False):
+    rows = iter_rows(db, query, lines)
+    if fmt == "csv":
+        chunks = csv_chunks(rows, LINE_COLUMNS if lines else TRANSACTION_COLUMNS)
+    else:
+        chunks = ndjson_chunks(rows)
+    return gzip_chunks(chunks) if gzip else chunks
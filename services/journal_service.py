@@ -0,0 +1,267 @@
+"""
+services/journal_service.py
+Write-behind receipt journal, used when CHECKOUT_DURABILITY=journal.
+
+Checkout reserves stock synchronously, appends the receipt to a local
+append-only file and returns; a background thread group-commits the
+journaled receipts to `transactions` with one insert_many per batch.
+
+Each worker writes its own journal file and holds an flock on it while
+alive, so at startup every unlocked file is the leftover of a dead worker
+and is replayed. Replays are idempotent: receipts carry their _id and
+transaction_id, and receipts already stored are skipped.
+
+    python -m services.journal_service --recover
+"""
+import atexit
+import fcntl
+import glob
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from bson import json_util
+from bson.json_util import CANONICAL_JSON_OPTIONS
+from pymongo.errors import BulkWriteError, PyMongoError
+import config
+from core.connection import connection_manager
+from services import rollup_service
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+
+def _encode(record):
+    return json_util.dumps(record, json_options=CANONICAL_JSON_OPTIONS).encode() + b"\n"
+
+
+def _decode(line):
+    return json_util.loads(line, json_options=CANONICAL_JSON_OPTIONS)
+
+
+def _insert_new(db, docs):
+    """
+    insert_many that skips receipts already stored.
+    Returns (inserted docs, docs to retry).
+    """
+    try:
+        db.transactions.insert_many(docs, ordered=False)
+        return docs, []
+    except BulkWriteError as e:
+        errors = {err["index"]: err for err in e.details["writeErrors"]}
+        inserted = [doc for n, doc in enumerate(docs) if n not in errors]
+        retry = [docs[n] for n, err in errors.items() if err["code"] != DUPLICATE_KEY]
+        return inserted, retry
+
+
+def _record_rollups(db, records):
+    categories = {}
+    for record in records:
+        categories.update(record.get("categories", {}))
+    rollup_service.record_committed(db, [r["doc"] for r in records], categories)
+
+
+class ReceiptJournal:
+    def __init__(self, directory, batch_size, flush_interval, fsync=True):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._pending = deque()
+        self._inflight = 0
+        self._file = None
+        self._path = None
+        self._pid = None
+        self._thread = None
+        self._stats = {"appended": 0, "flushed": 0, "flush_failures": 0, "replayed": 0, "last_flush_at": None}
+
+    def _open(self):
+        # created under a temporary name and locked before it becomes
+        # visible, so recovery can never mistake it for a dead worker's
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"journal-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        tmp = os.path.join(self.directory, f".{name}.tmp")
+        f = open(tmp, "ab")
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._path = os.path.join(self.directory, f"{name}.ndjson")
+        os.rename(tmp, self._path)
+        self._file = f
+        self._pid = os.getpid()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="receipt-journal", daemon=True)
+        self._thread.start()
+
+    def append(self, transaction, categories=None):
+        """
+        Durably journal one receipt (it must already carry its _id).
+        Raises OSError when the journal can't be written.
+        """
+        line = _encode({"doc": transaction, "categories": categories or {}})
+        with self._lock:
+            if self._pid != os.getpid():
+                self._open()
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            # keep a decoded copy: the caller goes on to mutate its dict
+            self._pending.append((time.monotonic(), _decode(line)))
+            self._stats["appended"] += 1
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush(connection_manager.get_database())
+            except Exception:
+                logger.exception("receipt journal flush crashed")
+
+    def flush(self, db):
+        """Group-commit pending receipts until the queue is empty or a write fails."""
+        while True:
+            with self._lock:
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                self._inflight = len(batch)
+            if not batch:
+                return True
+
+            try:
+                inserted, retry = _insert_new(db, [record["doc"] for _, record in batch])
+            except PyMongoError as e:
+                inserted, retry = [], [record["doc"] for _, record in batch]
+                logger.warning("receipt journal flush failed, %d receipts kept: %s", len(batch), e)
+
+            if inserted:
+                inserted_ids = {doc["_id"] for doc in inserted}
+                _record_rollups(db, [record for _, record in batch if record["doc"]["_id"] in inserted_ids])
+
+            retry_ids = {doc["_id"] for doc in retry}
+            with self._lock:
+                # failed receipts go back to the front, in their order
+                self._pending.extendleft(reversed([item for item in batch if item[1]["doc"]["_id"] in retry_ids]))
+                self._inflight = 0
+                self._stats["flushed"] += len(batch) - len(retry_ids)
+                self._stats["last_flush_at"] = datetime.utcnow().isoformat()
+                if retry_ids:
+                    self._stats["flush_failures"] += 1
+                    return False
+                if not self._pending:
+                    # everything journaled is stored; start the file over
+                    self._file.truncate(0)
+                    if self.fsync:
+                        os.fsync(self._file.fileno())
+
+    def recover(self, db):
+        """
+        Replay journal files left by dead workers. A file whose replay
+        fails is kept for the next start. Returns the receipts stored.
+        """
+        stored = 0
+        for path in sorted(glob.glob(os.path.join(self.directory, "journal-*.ndjson"))):
+            if path == self._path:
+                continue
+            try:
+                f = open(path, "rb")
+            except FileNotFoundError:
+                continue
+            with f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # owned by a live worker
+                records = []
+                for number, line in enumerate(f, 1):
+                    try:
+                        records.append(_decode(line))
+                    except ValueError:
+                        # a torn last write from the crash
+                        logger.warning("skipping unreadable line %d of %s", number, path)
+                try:
+                    for start in range(0, len(records), self.batch_size):
+                        chunk = records[start:start + self.batch_size]
+                        inserted, retry = _insert_new(db, [r["doc"] for r in chunk])
+                        if retry:
+                            raise PyMongoError(f"{len(retry)} receipts could not be stored")
+                        inserted_ids = {doc["_id"] for doc in inserted}
+                        _record_rollups(db, [r for r in chunk if r["doc"]["_id"] in inserted_ids])
+                        stored += len(inserted)
+                except PyMongoError as e:
+                    logger.error("journal %s not replayed, kept for next start: %s", path, e)
+                    continue
+                os.remove(path)
+                logger.info("replayed journal %s (%d receipts)", path, len(records))
+        with self._lock:
+            self._stats["replayed"] += stored
+        return stored
+
+    def stats(self):
+        """Queue depth and lag of receipts not yet in `transactions`."""
+        with self._lock:
+            oldest = self._pending[0][0] if self._pending else None
+            size = os.path.getsize(self._path) if self._path and self._pid == os.getpid() else 0
+            return dict(
+                self._stats,
+                mode=config.CHECKOUT_DURABILITY,
+                pending=len(self._pending) + self._inflight,
+                lag_seconds=round(time.monotonic() - oldest, 3) if oldest is not None else 0.0,
+                journal_bytes=size,
+            )
+
+    def close(self, timeout=5.0):
+        """Stop the flusher and store what is left; the file stays if that fails."""
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+        try:
+            drained = self.flush(connection_manager.get_database())
+        except Exception:
+            logger.exception("final receipt journal flush failed")
+            drained = False
+        with self._lock:
+            self._file.close()
+            if drained and not self._pending:
+                os.remove(self._path)
+            self._file = self._path = self._pid = None
+
+    def _after_fork(self):
+        # the child starts with no journal of its own; the parent's file
+        # and its lock stay with the parent
+        self._lock = threading.Lock()
+        self._pending.clear()
+        self._inflight = 0
+        self._file = self._path = self._pid = self._thread = None
+
+
+receipt_journal = ReceiptJournal(
+    config.JOURNAL_DIR,
+    batch_size=config.JOURNAL_BATCH_SIZE,
+    flush_interval=config.JOURNAL_FLUSH_INTERVAL_MS / 1000,
+    fsync=config.JOURNAL_FSYNC,
+)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=receipt_journal._after_fork)
+atexit.register(receipt_journal.close)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if "--recover" not in sys.argv:
+        print(__doc__)
+        sys.exit(2)
+    print(f"{receipt_journal.recover(connection_manager.get_database())} receipts stored")
@@ -0,0 +1,168 @@
+"""
+services/password_service.py
+Password hashing off the request worker.
+
+scrypt/pbkdf2 are CPU bound, so they run in a small process pool instead
+of the web worker. Under gunicorn's eventlet worker they run in eventlet's
+native thread pool (tpool) instead: a process pool's management thread
+and pipes are green there, and hashlib's scrypt and pbkdf2 release the
+GIL, so native threads hash in parallel without blocking the hub. At most PASSWORD_HASH_MAX_PENDING
+calls may be queued or running; past that, callers wait up to
+PASSWORD_HASH_WAIT_SECONDS and then get HashingBusy, which routes turn
+into a 503 instead of letting a login burst stall every other request.
+
+Hashes use PASSWORD_HASH_METHOD (werkzeug syntax, e.g. scrypt:32768:8:1
+or pbkdf2:sha256:600000). A successful verify against a hash made with
+other parameters also returns a fresh hash to store.
+"""
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+import config
+from utils.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class HashingBusy(Exception):
+    """Too many hashes queued; the caller should retry shortly."""
+
+
+def normalize_method(method: str) -> str:
+    """Spell out werkzeug's defaults, as they appear in stored hashes."""
+    name, *args = method.split(":")
+    if name == "scrypt" and not args:
+        args = ["32768", "8", "1"]
+    elif name == "pbkdf2":
+        hash_name = args[0] if args else "sha256"
+        iterations = args[1] if len(args) > 1 else str(DEFAULT_PBKDF2_ITERATIONS)
+        args = [hash_name, iterations]
+    return ":".join([name] + args)
+
+
+def needs_rehash(stored_hash: str, method: str = None) -> bool:
+    return stored_hash.split("$", 1)[0] != normalize_method(method or config.PASSWORD_HASH_METHOD)
+
+
+# --- run inside the pool processes; keep them free of app imports ---
+
+def _hash(password, method):
+    started = time.perf_counter()
+    hashed = generate_password_hash(password, method=method)
+    return hashed, time.perf_counter() - started
+
+
+def _verify(stored_hash, password, method):
+    started = time.perf_counter()
+    ok = check_password_hash(stored_hash, password)
+    new_hash = None
+    if ok and needs_rehash(stored_hash, method):
+        new_hash = generate_password_hash(password, method=method)
+    return ok, new_hash, time.perf_counter() - started
+
+
+def _green_threads():
+    """True in a process eventlet has monkey patched (gunicorn -k eventlet)."""
+    if "eventlet" not in sys.modules:
+        return False
+    from eventlet import patcher
+    return patcher.is_monkey_patched("thread")
+
+
+class PasswordHasher:
+    def __init__(self, workers, max_pending, wait_seconds, method):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.wait_seconds = wait_seconds
+        self.method = method
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self.rejected = 0
+        self.rehashed = 0
+        self.histograms = {op: Histogram() for op in ("hash", "verify", "rehash", "queue_wait")}
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                # spawn: forking a process that runs threads (or eventlet) is unsafe
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+                self._pid = os.getpid()
+            return self._pool
+
+    def _reset(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False)
+
+    def _call(self, fn, *args):
+        queued = time.perf_counter()
+        if not self._slots.acquire(timeout=self.wait_seconds):
+            self.rejected += 1
+            raise HashingBusy("Password hashing is saturated")
+        try:
+            self.histograms["queue_wait"].observe(time.perf_counter() - queued)
+            if not self.workers:
+                return fn(*args)
+            if _green_threads():
+                from eventlet import tpool
+                return tpool.execute(fn, *args)
+            for attempt in range(2):
+                pool = self._executor()
+                try:
+                    return pool.submit(fn, *args).result()
+                except BrokenProcessPool:
+                    # a pool process died (e.g. OOM killed); start a new pool once
+                    logger.warning("password hashing pool broken, restarting")
+                    self._reset(pool)
+                    if attempt:
+                        raise
+        finally:
+            self._slots.release()
+
+    def hash_password(self, password: str) -> str:
+        hashed, seconds = self._call(_hash, password, self.method)
+        self.histograms["hash"].observe(seconds)
+        return hashed
+
+    def verify(self, stored_hash: str, password: str):
+        """
+        (ok, new_hash). new_hash is set when the password matched but the
+        stored hash uses outdated parameters.
+        """
+        ok, new_hash, seconds = self._call(_verify, stored_hash or "", password, self.method)
+        self.histograms["rehash" if new_hash else "verify"].observe(seconds)
+        if new_hash:
+            self.rehashed += 1
+        return ok, new_hash
+
+    def stats(self):
+        return {
+            "method": normalize_method(self.method),
+            "workers": self.workers,
+            "runner": "inline" if not self.workers else "tpool" if _green_threads() else "processes",
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+            "histograms": {op: h.snapshot() for op, h in self.histograms.items()},
+        }
+
+
+password_hasher = PasswordHasher(
+    workers=config.PASSWORD_HASH_WORKERS,
+    max_pending=config.PASSWORD_HASH_MAX_PENDING,
+    wait_seconds=config.PASSWORD_HASH_WAIT_SECONDS,
+    method=config.PASSWORD_HASH_METHOD,
+)
+hash_password = password_hasher.hash_password
+verify_password = password_hasher.verify
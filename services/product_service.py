@@ -80,9 +80,16 @@ def list_products_with_variants():
     Return list of products and nested variants in a shape convenient for frontend.
     Each product includes a 'variants' array.
     """
-    products = list(_products.find({}))
-    # gather variants per product
-    variants = list(_variants.find({}))
+    products = list(_products.find(
+        {"status": {"$ne": "deleted"}},
+        {"_id": 0, "product_id": 1, "name": 1, "category": 1}
+    ))
+    # variants of the listed products only, in one $in query
+    variants = _variants.find(
+        {"product_id": {"$in": [p["product_id"] for p in products]}},
+        {"_id": 0, "product_id": 1, "variant_id": 1, "name": 1, "price": 1,
+         "current_price": 1, "stock": 1, "sku": 1}
+    )
     var_map = {}
     for v in variants:
         pid = v["product_id"]
@@ -0,0 +1,78 @@
+"""
+services/revocation_service.py
+Per-worker set of revoked sessions, so "is this session still active"
+is a local lookup instead of a sessions query on every request.
+
+Revocations made by this worker apply immediately; those made by other
+workers are picked up by polling sessions on a revoked_at watermark,
+i.e. within REVOCATION_POLL_SECONDS.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+import config
+
+# revoked_at is stamped by each app server's clock; re-read a little
+# behind the watermark so small clock skew can't hide a logout
+WATERMARK_OVERLAP = timedelta(seconds=30)
+
+
+class RevocationList:
+    def __init__(self, poll_interval: float):
+        self.poll_interval = poll_interval
+        self._revoked = {}
+        self._watermark = None
+        self._next_poll = 0.0
+        self._lock = threading.Lock()
+
+    def is_revoked(self, db, token_hash: str) -> bool:
+        self.refresh(db)
+        return token_hash in self._revoked
+
+    def add(self, token_hash: str, expires_at=None):
+        self._revoked[token_hash] = expires_at or datetime.utcnow() + timedelta(hours=config.JWT_EXP_HOURS)
+
+    def refresh(self, db, force: bool = False):
+        if not force and time.monotonic() < self._next_poll:
+            return
+        if not self._lock.acquire(blocking=False):
+            # another greenlet is already polling; serve the current view
+            return
+        try:
+            self._next_poll = time.monotonic() + self.poll_interval
+            now = datetime.utcnow()
+            if self._watermark is None:
+                query = {"status": "inactive", "expires_at": {"$gt": now}}
+            else:
+                query = {"status": "inactive", "revoked_at": {"$gt": self._watermark - WATERMARK_OVERLAP}}
+            cursor = db.sessions.find(
+                query,
+                {"_id": 0, "token_hash": 1, "revoked_at": 1, "expires_at": 1}
+            )
+            watermark = self._watermark
+            for session in cursor:
+                if session.get("token_hash"):
+                    self._revoked[session["token_hash"]] = session.get("expires_at")
+                revoked_at = session.get("revoked_at")
+                if revoked_at and (watermark is None or revoked_at > watermark):
+                    watermark = revoked_at
+            self._watermark = watermark or now
+            self._prune(now)
+        finally:
+            self._lock.release()
+
+    def _prune(self, now):
+        # an expired token is rejected by jwt anyway
+        for token_hash, expires_at in list(self._revoked.items()):
+            if expires_at and expires_at <= now:
+                self._revoked.pop(token_hash, None)
+
+    def stats(self):
+        return {
+            "revoked": len(self._revoked),
+            "watermark": self._watermark.isoformat() if self._watermark else None,
+            "poll_interval_seconds": self.poll_interval,
+        }
+
+
+revocation_list = RevocationList(config.REVOCATION_POLL_SECONDS)
@@ -0,0 +1,328 @@
+"""
+services/rollup_service.py
+Sales rollups, maintained incrementally on checkout so analytics read a
+handful of small bucket documents instead of the whole ledger:
+
+- sales_hourly: totals per store and hour
+- product_sales: quantity and revenue per product, per day and lifetime
+
+Checkout and batch ingest write product_sales in the transaction that
+stores the sale, when the deployment has transactions. Without them, and
+for receipts stored later by the journal, both rollups are updated right
+after the sale is stored; a failed update is logged and repaired by
+--rebuild.
+
+    python -m services.rollup_service --rebuild [--since YYYY-MM-DD]
+"""
+import logging
+import sys
+from datetime import datetime
+from pymongo import UpdateOne
+import config
+
+logger = logging.getLogger(__name__)
+
+SALES_HOURLY = "sales_hourly"
+PRODUCT_SALES = "product_sales"
+LIFETIME = "all"
+
+GROUP_KEYS = {"day": "$day", "week": "$week", "month": "$month"}
+
+
+def _bucket_fields(store_id, created_at):
+    bucket = created_at.replace(minute=0, second=0, microsecond=0)
+    iso_year, iso_week, _ = bucket.isocalendar()
+    return {
+        "_id": f"{store_id}:{bucket:%Y-%m-%dT%H}",
+        "store_id": store_id,
+        "bucket": bucket,
+        "day": f"{bucket:%Y-%m-%d}",
+        "week": f"{iso_year}-W{iso_week:02d}",
+        "month": f"{bucket:%Y-%m}",
+        "hour": bucket.hour,
+    }
+
+
+def record_sales(db, transactions):
+    """Add committed transactions to their store/hour buckets, in one bulk write."""
+    buckets = {}
+    for t in transactions:
+        fields = _bucket_fields(t.get("store_id", config.STORE_ID), t["created_at"])
+        entry = buckets.setdefault(fields.pop("_id"), {"fields": fields, "total": 0, "count": 0})
+        entry["total"] += t["total_amount"]
+        entry["count"] += 1
+    if not buckets:
+        return
+    db[SALES_HOURLY].bulk_write([
+        UpdateOne(
+            {"_id": key},
+            {
+                "$inc": {"total_sales": entry["total"], "transaction_count": entry["count"]},
+                "$setOnInsert": entry["fields"]
+            },
+            upsert=True
+        )
+        for key, entry in buckets.items()
+    ], ordered=False)
+
+
+def record_committed(db, transactions, categories=None, product_sales=True):
+    """
+    Feed committed transactions to the rollups, outside any transaction.
+    product_sales=False when the sale's transaction already counted them.
+    sales_hourly never joins the sale's transaction: one hourly bucket per
+    store would make every concurrent checkout conflict.
+    """
+    try:
+        record_sales(db, transactions)
+        if product_sales:
+            record_product_sales(db, transactions, categories)
+    except Exception:
+        logger.exception("rollup update failed for %s", [t["transaction_id"] for t in transactions])
+
+
+def sales_series(db, start, end, group_by="day", store_id=None):
+    """
+    Sales totals between start and end grouped by day, ISO week
+    (e.g. 2026-W42) or month, in the shape of the old $group output.
+    """
+    match = {"bucket": {"$gte": start.replace(minute=0, second=0, microsecond=0), "$lte": end}}
+    if store_id:
+        match["store_id"] = store_id
+    return list(db[SALES_HOURLY].aggregate([
+        {"$match": match},
+        {
+            "$group": {
+                "_id": GROUP_KEYS[group_by],
+                "total_sales": {"$sum": "$total_sales"},
+                "transaction_count": {"$sum": "$transaction_count"}
+            }
+        },
+        {"$sort": {"_id": 1}}
+    ]))
+
+
+def day_totals(db, day, store_id=None):
+    """(total_sales, transaction_count) of one UTC day."""
+    query = {"day": f"{day:%Y-%m-%d}"}
+    if store_id:
+        query["store_id"] = store_id
+    total, count = 0, 0
+    for bucket in db[SALES_HOURLY].find(query, {"total_sales": 1, "transaction_count": 1}):
+        total += bucket["total_sales"]
+        count += bucket["transaction_count"]
+    return total, count
+
+
+def record_product_sales(db, transactions, categories=None, session=None):
+    """
+    Add each product of committed transactions to its daily and lifetime
+    counters, in one bulk write.
+    """
+    categories = categories or {}
+    totals = {}
+    for t in transactions:
+        store_id = t.get("store_id", config.STORE_ID)
+        day = t["created_at"].replace(hour=0, minute=0, second=0, microsecond=0)
+        for line in t["items"]:
+            for period, period_day in ((f"{day:%Y-%m-%d}", day), (LIFETIME, None)):
+                entry = totals.setdefault((store_id, period, line["product_id"]), {
+                    "day": period_day, "name": line["product_name"], "at": t["created_at"],
+                    "quantity": 0, "revenue": 0
+                })
+                if t["created_at"] >= entry["at"]:
+                    entry["name"], entry["at"] = line["product_name"], t["created_at"]
+                entry["quantity"] += line["quantity"]
+                entry["revenue"] += line["subtotal"]
+
+    ops = []
+    for (store_id, period, product_id), entry in totals.items():
+        ops.append(UpdateOne(
+            {"_id": f"{store_id}:{period}:{product_id}"},
+            {
+                "$inc": {"quantity": entry["quantity"], "revenue": entry["revenue"]},
+                "$set": {"product_name": entry["name"], "category": categories.get(product_id, "")},
+                "$max": {"last_sale_at": entry["at"]},
+                "$setOnInsert": {"store_id": store_id, "period": period, "day": entry["day"], "product_id": product_id}
+            },
+            upsert=True
+        ))
+    if ops:
+        db[PRODUCT_SALES].bulk_write(ops, ordered=False, session=session)
+
+
+def top_products(db, limit=10, start=None, end=None, category=None, store_id=None, sort_by="quantity"):
+    """
+    Top-K products by quantity or revenue. Without a window the lifetime
+    counters are used; with one, the daily buckets between start and end
+    (inclusive days) are merged. Cost depends on products x days in the
+    window, never on the number of transactions.
+    """
+    if start is None and end is None:
+        match = {"period": LIFETIME}
+    else:
+        day_range = {}
+        if start is not None:
+            day_range["$gte"] = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        if end is not None:
+            day_range["$lte"] = end
+        match = {"day": day_range}
+    if category:
+        match["category"] = category
+    if store_id:
+        match["store_id"] = store_id
+
+    sort_field = "total_revenue" if sort_by == "revenue" else "total_quantity"
+    return list(db[PRODUCT_SALES].aggregate([
+        {"$match": match},
+        # name and category as of the newest bucket, for $last
+        {"$sort": {"day": 1, "last_sale_at": 1}},
+        {
+            "$group": {
+                "_id": "$product_id",
+                "product_name": {"$last": "$product_name"},
+                "category": {"$last": "$category"},
+                "total_quantity": {"$sum": "$quantity"},
+                "total_revenue": {"$sum": "$revenue"}
+            }
+        },
+        {"$sort": {sort_field: -1, "_id": 1}},
+        {"$limit": limit}
+    ]))
+
+
+def rebuild_sales_rollups(db, since=None):
+    """
+    Recompute hourly buckets from transactions, from `since` (truncated to
+    the hour) or from the beginning. Run it while the registers are quiet:
+    sales committed during the rebuild can be counted twice or not at all.
+    """
+    match = {}
+    if since:
+        since = since.replace(minute=0, second=0, microsecond=0)
+        match["created_at"] = {"$gte": since}
+        db[SALES_HOURLY].delete_many({"bucket": {"$gte": since}})
+    else:
+        db[SALES_HOURLY].delete_many({})
+
+    store = {"$ifNull": ["$store_id", config.STORE_ID]}
+    db.transactions.aggregate([
+        {"$match": match},
+        {
+            "$group": {
+                "_id": {
+                    "store_id": store,
+                    "bucket": {"$dateFromParts": {
+                        "year": {"$year": "$created_at"},
+                        "month": {"$month": "$created_at"},
+                        "day": {"$dayOfMonth": "$created_at"},
+                        "hour": {"$hour": "$created_at"}
+                    }}
+                },
+                "total_sales": {"$sum": "$total_amount"},
+                "transaction_count": {"$sum": 1}
+            }
+        },
+        {
+            "$project": {
+                "_id": {"$concat": [
+                    "$_id.store_id", ":",
+                    {"$dateToString": {"format": "%Y-%m-%dT%H", "date": "$_id.bucket"}}
+                ]},
+                "store_id": "$_id.store_id",
+                "bucket": "$_id.bucket",
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$_id.bucket"}},
+                "week": {"$dateToString": {"format": "%G-W%V", "date": "$_id.bucket"}},
+                "month": {"$dateToString": {"format": "%Y-%m", "date": "$_id.bucket"}},
+                "hour": {"$hour": "$_id.bucket"},
+                "total_sales": 1,
+                "transaction_count": 1
+            }
+        },
+        {"$merge": {"into": SALES_HOURLY, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+    ])
+    return db[SALES_HOURLY].count_documents({})
+
+
+def rebuild_product_sales(db, since=None):
+    """
+    Recompute product counters from transactions. Daily buckets are rebuilt
+    from `since` (or from the beginning); lifetime counters always from the
+    beginning. Same quiet-time caveat as rebuild_sales_rollups.
+    """
+    store = {"$ifNull": ["$store_id", config.STORE_ID]}
+    day = {"$dateFromParts": {
+        "year": {"$year": "$created_at"},
+        "month": {"$month": "$created_at"},
+        "day": {"$dayOfMonth": "$created_at"}
+    }}
+
+    def pipeline(match, period):
+        group_id = {"store_id": store, "product_id": "$items.product_id"}
+        if period is None:
+            group_id["day"] = day
+        period_expr = (
+            {"$dateToString": {"format": "%Y-%m-%d", "date": "$_id.day"}} if period is None
+            else {"$literal": period}
+        )
+        return [
+            {"$match": match},
+            {"$sort": {"created_at": 1}},
+            {"$unwind": "$items"},
+            {
+                "$group": {
+                    "_id": group_id,
+                    "product_name": {"$last": "$items.product_name"},
+                    "last_sale_at": {"$max": "$created_at"},
+                    "quantity": {"$sum": "$items.quantity"},
+                    "revenue": {"$sum": "$items.subtotal"}
+                }
+            },
+            {"$lookup": {
+                "from": "products", "localField": "_id.product_id",
+                "foreignField": "product_id", "as": "product"
+            }},
+            {
+                "$project": {
+                    "_id": {"$concat": ["$_id.store_id", ":", period_expr, ":", "$_id.product_id"]},
+                    "store_id": "$_id.store_id",
+                    "period": period_expr,
+                    "day": "$_id.day" if period is None else {"$literal": None},
+                    "product_id": "$_id.product_id",
+                    "product_name": 1,
+                    "last_sale_at": 1,
+                    "category": {"$ifNull": [{"$arrayElemAt": ["$product.category", 0]}, ""]},
+                    "quantity": 1,
+                    "revenue": 1
+                }
+            },
+            {"$merge": {"into": PRODUCT_SALES, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+        ]
+
+    match = {}
+    if since:
+        since = since.replace(hour=0, minute=0, second=0, microsecond=0)
+        match["created_at"] = {"$gte": since}
+        db[PRODUCT_SALES].delete_many({"day": {"$gte": since}})
+    else:
+        db[PRODUCT_SALES].delete_many({"period": {"$ne": LIFETIME}})
+    db.transactions.aggregate(pipeline(match, None))
+
+    db[PRODUCT_SALES].delete_many({"period": LIFETIME})
+    db.transactions.aggregate(pipeline({}, LIFETIME))
+    return db[PRODUCT_SALES].count_documents({})
+
+
+if __name__ == "__main__":
+    from core.connection import connection_manager
+
+    logging.basicConfig(level=logging.INFO)
+    if "--rebuild" not in sys.argv:
+        print(__doc__)
+        sys.exit(2)
+    since = None
+    if "--since" in sys.argv:
+        since = datetime.strptime(sys.argv[sys.argv.index("--since") + 1], "%Y-%m-%d")
+    db = connection_manager.get_database()
+    print(f"{rebuild_sales_rollups(db, since)} hourly buckets")
+    print(f"{rebuild_product_sales(db, since)} product counters")
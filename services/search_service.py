@@ -0,0 +1,299 @@
+"""
+services/search_service.py
+Per-worker in-memory index of active products for POS lookups.
+
+- codes: exact SKU / barcode -> product_id, one dict lookup per scan
+- names: product names split into normalized tokens, with a posting set
+  of product ids per token. Prefixes are matched against the sorted
+  token vocabulary with bisect, a flattened trie that costs one list
+  instead of a dict per character at 100k SKUs.
+- trigrams of each non-numeric vocabulary token, for typo tolerance: a
+  query token with no prefix match is matched to vocabulary tokens
+  sharing enough trigrams with it.
+- categories -> product ids, for filtering.
+
+The product write routes update the index of the worker that served
+them directly. Other workers catch up from the catalog change feed
+(catalog_service.changes_since) at most every SEARCH_SYNC_SECONDS, on
+the next search. Stock moved by checkouts doesn't stamp change_seq, so
+the indexed stock is as of the product's last edit or load; the routes
+lay current stock over the results they return (with_live_stock).
+"""
+import bisect
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+
+import config
+from core.pagination import decode_cursor
+from services import catalog_service
+
+logger = logging.getLogger(__name__)
+
+INDEX_FIELDS = {"_id": 0, "product_id": 1, "name": 1, "category": 1, "price": 1, "stock": 1, "sku": 1, "barcode": 1}
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# rank of how a query token matched a product token
+EXACT, PREFIX, FUZZY = 3, 2, 1
+# minimum trigram similarity (Jaccard) for a typo match
+FUZZY_THRESHOLD = 0.4
+# shorter query tokens match whole tokens only; one letter would expand
+# to a large share of the catalog
+MIN_PREFIX = 2
+
+
+def normalize(text):
+    """Lowercase ASCII with accents stripped."""
+    text = unicodedata.normalize("NFKD", str(text or ""))
+    return text.encode("ascii", "ignore").decode().lower()
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(normalize(text))
+
+
+def normalize_code(code):
+    return str(code or "").strip().upper()
+
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ProductSearchIndex:
+    def __init__(self, sync_seconds):
+        self.sync_seconds = sync_seconds
+        self._lock = threading.RLock()
+        self._clear()
+
+    def _clear(self):
+        self.loaded = False
+        self.version = 0
+        self.synced_at = 0.0
+        self.products = {}      # product_id -> indexed fields
+        self.codes = {}         # SKU / barcode -> product_id
+        self.postings = {}      # token -> {product_id}
+        self.vocabulary = []    # sorted tokens
+        self.grams = {}         # trigram -> {token}
+        self.categories = {}    # normalized category -> {product_id}
+
+    # --- maintenance ---
+
+    def load(self, db):
+        """Build the index from the active catalog."""
+        with self._lock:
+            # version first: changes racing the load are replayed by the next sync
+            version = catalog_service.current_version(db)
+            self._clear()
+            for product in db.products.find({"status": "active"}, INDEX_FIELDS):
+                self._add(product, keep_sorted=False)
+            self.vocabulary.sort()
+            self.version = version
+            self.synced_at = time.monotonic()
+            self.loaded = True
+            logger.info("search index loaded: %d products, %d tokens", len(self.products), len(self.vocabulary))
+
+    def sync(self, db, force=False):
+        """Load on first use, then apply catalog changes at most every sync_seconds."""
+        if not self.loaded:
+            with self._lock:
+                if not self.loaded:
+                    self.load(db)
+            return
+        if not force and time.monotonic() - self.synced_at < self.sync_seconds:
+            return
+        with self._lock:
+            if not force and time.monotonic() - self.synced_at < self.sync_seconds:
+                return  # another request synced while we waited
+            self.synced_at = time.monotonic()
+            since, version, after = self.version, None, None
+            while True:
+                page = catalog_service.changes_since(db, since, 2000, after=after, version=version)
+                version = page["version"]
+                for change in page["changes"]:
+                    product = change["product"]
+                    if change["type"] == "deleted" or product.get("status") != "active":
+                        self.remove(product["product_id"])
+                    else:
+                        self.upsert(product)
+                if not page["has_more"]:
+                    break
+                after = decode_cursor(page["cursor"])["after"]
+            self.version = max(self.version, version)
+
+    def catch_up(self, db):
+        """Apply catalog changes now, after writes too broad to upsert one by one."""
+        if self.loaded:
+            self.sync(db, force=True)
+
+    def upsert(self, product):
+        with self._lock:
+            if not self.loaded:
+                return
+            self._remove(product["product_id"])
+            self._add(product)
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove(product_id)
+
+    def _add(self, product, keep_sorted=True):
+        product_id = product["product_id"]
+        entry = {field: product.get(field) for field in INDEX_FIELDS if field != "_id"}
+        entry["tokens"] = set(tokenize(entry["name"]))
+        self.products[product_id] = entry
+        for code in (normalize_code(entry.get("sku")), normalize_code(entry.get("barcode"))):
+            if code:
+                self.codes[code] = product_id
+        for token in entry["tokens"]:
+            ids = self.postings.get(token)
+            if ids is None:
+                ids = self.postings[token] = set()
+                if keep_sorted:
+                    bisect.insort(self.vocabulary, token)
+                else:
+                    self.vocabulary.append(token)
+                if not token.isdigit():
+                    for gram in trigrams(token):
+                        self.grams.setdefault(gram, set()).add(token)
+            ids.add(product_id)
+        self.categories.setdefault(normalize(entry.get("category")), set()).add(product_id)
+
+    def _remove(self, product_id):
+        entry = self.products.pop(product_id, None)
+        if entry is None:
+            return
+        for code in (normalize_code(entry.get("sku")), normalize_code(entry.get("barcode"))):
+            if self.codes.get(code) == product_id:
+                del self.codes[code]
+        for token in entry["tokens"]:
+            ids = self.postings[token]
+            ids.discard(product_id)
+            if not ids:
+                del self.postings[token]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, token)]
+                if not token.isdigit():
+                    for gram in trigrams(token):
+                        tokens = self.grams[gram]
+                        tokens.discard(token)
+                        if not tokens:
+                            del self.grams[gram]
+        category = normalize(entry.get("category"))
+        members = self.categories.get(category)
+        if members is not None:
+            members.discard(product_id)
+            if not members:
+                del self.categories[category]
+
+    def _after_fork(self):
+        self._lock = threading.RLock()
+
+    # --- queries ---
+
+    def lookup(self, code):
+        """Product with this exact SKU or barcode, or None."""
+        product_id = self.codes.get(normalize_code(code))
+        entry = self.products.get(product_id) if product_id else None
+        return _public(entry) if entry else None
+
+    def _prefixed(self, prefix):
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        end = bisect.bisect_left(self.vocabulary, prefix + "\x7f", start)
+        return self.vocabulary[start:end]
+
+    def _similar(self, token):
+        query = trigrams(token)
+        shared = {}
+        for gram in query:
+            for candidate in self.grams.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        return [
+            candidate for candidate, n in shared.items()
+            if n / (len(query) + len(trigrams(candidate)) - n) >= FUZZY_THRESHOLD
+        ]
+
+    def _expand(self, token):
+        """{vocabulary token: match rank} a query token stands for."""
+        if len(token) < MIN_PREFIX:
+            return {token: EXACT} if token in self.postings else {}
+        expanded = {t: EXACT if t == token else PREFIX for t in self._prefixed(token)}
+        if not expanded and len(token) >= 3 and not token.isdigit():
+            expanded = dict.fromkeys(self._similar(token), FUZZY)
+        return expanded
+
+    def search(self, query, category=None, limit=20):
+        """
+        Products matching every token of `query` by prefix, or by
+        similarity when a token has no prefix match, best first. An exact
+        SKU/barcode match comes first.
+        """
+        with self._lock:
+            exact = self.codes.get(normalize_code(query))
+            expansions = [self._expand(t) for t in tokenize(query)]
+            allowed = self.categories.get(normalize(category), set()) if category else None
+
+            scores = {}
+            if expansions:
+                # seed from the most selective query token, then check only
+                # the survivors' own tokens against the others
+                expansions.sort(key=lambda e: sum(len(self.postings[t]) for t in e))
+                for token, rank in expansions[0].items():
+                    for pid in self.postings[token]:
+                        if scores.get(pid, 0) < rank:
+                            scores[pid] = rank
+                for expanded in expansions[1:]:
+                    narrowed = {}
+                    for pid, score in scores.items():
+                        rank = max([expanded.get(t, 0) for t in self.products[pid]["tokens"]])
+                        if rank:
+                            narrowed[pid] = score + rank
+                    scores = narrowed
+                if allowed is not None:
+                    scores = {pid: score for pid, score in scores.items() if pid in allowed}
+            elif allowed is not None:
+                scores = dict.fromkeys(allowed, 0)
+
+            best = heapq.nsmallest(
+                limit, scores,
+                key=lambda pid: (-scores[pid], len(self.products[pid]["name"] or ""), pid)
+            )
+            if exact and (allowed is None or exact in allowed):
+                best = [exact] + [pid for pid in best if pid != exact][:limit - 1]
+            return [_public(self.products[pid]) for pid in best]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "loaded": self.loaded,
+                "version": self.version,
+                "products": len(self.products),
+                "codes": len(self.codes),
+                "tokens": len(self.vocabulary),
+                "trigrams": len(self.grams),
+                "categories": len(self.categories),
+            }
+
+
+def _public(entry):
+    return {k: v for k, v in entry.items() if k != "tokens"}
+
+
+def with_live_stock(db, products):
+    """Replace the indexed stock of `products` with current stock, in one query."""
+    if products:
+        stock = catalog_service.stock_levels(db, [p["product_id"] for p in products])
+        for product in products:
+            if product["product_id"] in stock:
+                product["stock"] = stock[product["product_id"]]
+    return products
+
+
+search_index = ProductSearchIndex(config.SEARCH_SYNC_SECONDS)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=search_index._after_fork)
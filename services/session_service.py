@@ -6,19 +6,22 @@ import jwt
 import os
 from datetime import datetime, timedelta
 from core.database import get_db
-from core.id_generator import generate_id
+from core.id_generator import IDGenerator
+from services.revocation_service import revocation_list
+from utils.token_cache import token_digest
 
 SECRET_KEY = os.getenv("SECRET_KEY", "change_this_secret")
 JWT_EXP_HOURS = int(os.getenv("JWT_EXP_HOURS", 2))
 
 def create_session(user):
-    db = get_db()
-    session_id = generate_id("SES")
+    db = get_db().db
+    session_id = IDGenerator(db).get_next_id("SES")
 
     token = jwt.encode({
         "user_id": user["employee_id"],
         "username": user["username"],
         "role": user["role"],
+        "sid": session_id,
         "exp": datetime.utcnow() + timedelta(hours=JWT_EXP_HOURS)
     }, SECRET_KEY, algorithm="HS256")
 
@@ -27,7 +30,7 @@ def create_session(user):
         "user_id": user["employee_id"],
         "username": user["username"],
         "role": user["role"],
-        "token": token,
+        "token_hash": token_digest(token),
         "issued_at": datetime.utcnow(),
         "expires_at": datetime.utcnow() + timedelta(hours=JWT_EXP_HOURS),
         "status": "active"
@@ -37,7 +40,7 @@ def create_session(user):
     return token, session_id
 
 def verify_token(token):
-    db = get_db()
+    db = get_db().db
     try:
         decoded = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
     except jwt.ExpiredSignatureError:
@@ -45,18 +48,22 @@ def verify_token(token):
     except jwt.InvalidTokenError:
         return None  # broken/wrong token
 
-    session = db.sessions.find_one({"token": token})
-    if not session or session.get("status") != "active":
+    if revocation_list.is_revoked(db, token_digest(token)):
         return None  # inactive token (logout)
 
     return decoded
 
 def destroy_session(token):
-    db = get_db()
-    result = db.sessions.update_one(
-        {"token": token},
-        {"$set": {"status": "inactive", "revoked_at": datetime.utcnow()}}
+    db = get_db().db
+    token_hash = token_digest(token)
+    session = db.sessions.find_one_and_update(
+        {"token_hash": token_hash, "status": "active"},
+        {"$set": {"status": "inactive", "revoked_at": datetime.utcnow()}},
+        projection={"expires_at": 1}
     )
-    return result.modified_count > 0
+    if not session:
+        return False
+    revocation_list.add(token_hash, session.get("expires_at"))
+    return True
 
 
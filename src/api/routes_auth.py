@@ -2,17 +2,28 @@
 flask blueprint for authentication endpoints
 """
 from flask import Blueprint, request, jsonify
-from werkzeug.security import check_password_hash, generate_password_hash
 from core.database import get_db
 from core.id_generator import IDGenerator
 from datetime import datetime, timedelta
-from utils.jwt_manager import token_required
+from utils.jwt_manager import token_required, token_cache
+from utils.token_cache import token_digest
+from services.revocation_service import revocation_list
+from services.password_service import HashingBusy, hash_password, verify_password
+from utils.event_log import log_event
+from config import LOGIN_LOG_SAMPLE_RATE
 import jwt
+import logging
 import os
 
 auth_bp = Blueprint("auth_bp", __name__)
+logger = logging.getLogger(__name__)
 SECRET_KEY = os.getenv("JWT_SECRET", "change_this_secret")
 
+def busy_response():
+    response = jsonify({"error": "Server busy, please try again"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
 # Di routes_auth.py
 @auth_bp.route("/change-my-password", methods=["POST"])
 @token_required()
@@ -29,10 +40,13 @@ def change_my_password(current_user):
     
     user = db.master_karyawan.find_one({"employee_id": user_id})
 
-    if not user or not check_password_hash(user["password_hash"], current_password):
-        return jsonify({"error": "Invalid username or password"}), 401 
-
-    new_password_hash = generate_password_hash(new_password)
+    try:
+        is_valid = bool(user) and verify_password(user["password_hash"], current_password)[0]
+        if not is_valid:
+            return jsonify({"error": "Invalid username or password"}), 401 
+        new_password_hash = hash_password(new_password)
+    except HashingBusy:
+        return busy_response()
     db.master_karyawan.update_one(
         {"employee_id": user_id},
         {"$set": {"password_hash": new_password_hash}}
@@ -54,24 +68,29 @@ def login():
     db = get_db().db
     user = db.master_karyawan.find_one({"username": username, "status": "active"}) 
 
-    # ================== BLOK DEBUGGING ==================
-    # Tambahkan kode ini untuk melihat apa yang terjadi di terminal Anda
+    is_valid, new_hash = False, None
     if user:
-        print(f"--- DEBUG: USER DITEMUKAN ---")
-        print(f"Username input: '{username}'")
-        print(f"Password input: '{password}'")
-        print(f"Hash dari DB: '{user.get('password_hash')}'") # Ambil hash dari DB
-        
-        # Cek manual
-        is_valid = check_password_hash(user.get("password_hash", ""), password)
-        print(f"Hasil check_password_hash: {is_valid}")
-    else:
-        print(f"--- DEBUG: USER TIDAK DITEMUKAN ---")
-        print(f"Username input: '{username}'")
-    # ================== AKHIR BLOK DEBUGGING ==================
-
-    if not user or not check_password_hash(user["password_hash"], password):
+        try:
+            is_valid, new_hash = verify_password(user.get("password_hash", ""), password)
+        except HashingBusy:
+            return busy_response()
+
+    log_event(
+        logger, "login",
+        sample_rate=LOGIN_LOG_SAMPLE_RATE if is_valid else 1.0,
+        level=logging.INFO if is_valid else logging.WARNING,
+        username=username, user_found=bool(user), success=is_valid,
+        rehashed=bool(new_hash), remote_addr=request.remote_addr
+    )
+
+    if not is_valid:
         return jsonify({"message": "Invalid username or password"}), 401
+    if new_hash:
+        # stored with outdated hashing parameters; upgrade it while we have the password
+        db.master_karyawan.update_one(
+            {"employee_id": user["employee_id"], "password_hash": user["password_hash"]},
+            {"$set": {"password_hash": new_hash}}
+        )
     id_gen = IDGenerator(db)
     session_id = id_gen.get_next_id("SES")
 
@@ -79,6 +98,7 @@ def login():
         "user_id": user["employee_id"],
         "username": username,
         "role": user["role"],
+        "sid": session_id,
         "exp": datetime.utcnow() + timedelta(hours=2)
     }, SECRET_KEY, algorithm="HS256")
 
@@ -87,7 +107,7 @@ def login():
         "user_id": user["employee_id"],
         "username": username,
         "role": user["role"],
-        "token": token,
+        "token_hash": token_digest(token),
         "issued_at": datetime.utcnow(),
         "expires_at": datetime.utcnow() + timedelta(hours=2),
         "status": "active"
@@ -116,17 +136,20 @@ def logout():
         return jsonify({"error": "Invalid authorization header format"}), 401
 
     db = get_db().db
+    token_hash = token_digest(token)
 
-    session = db.sessions.find_one({"token": token})
+    session = db.sessions.find_one_and_update(
+        {"token_hash": token_hash, "status": "active"},
+        {"$set": {"status": "inactive", "revoked_at": datetime.utcnow()}},
+        projection={"expires_at": 1}
+    )
     if not session:
-        return jsonify({"error": "Invalid or expired token"}), 401
-
-    if session.get("status") == "inactive":
+        session = db.sessions.find_one({"token_hash": token_hash}, {"status": 1})
+        if not session:
+            return jsonify({"error": "Invalid or expired token"}), 401
         return jsonify({"error": "Session already inactive"}), 400
 
-    db.sessions.update_one(
-        {"token": token},
-        {"$set": {"status": "inactive", "revoked_at": datetime.utcnow()}}
-    )
+    revocation_list.add(token_hash, session.get("expires_at"))
+    token_cache.invalidate(token_hash)
 
     return jsonify({"message": "Logged out successfully"}), 200
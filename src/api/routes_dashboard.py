@@ -1,24 +1,21 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, current_app, jsonify
 from core.database import get_db
+from core.query_budget import query_budget
+from services import rollup_service
+from services.dashboard_service import dashboard_bundle
 from utils.jwt_manager import require_auth
-from datetime import datetime, timedelta
+from datetime import datetime
 
 dashboard_bp = Blueprint("dashboard_bp", __name__)
 
 @dashboard_bp.route("/stats", methods=["GET"])
+@query_budget(max_queries=6)
 @require_auth(role="admin")
 def get_dashboard_stats():
     db = get_db().db
     
-    # Get today's stats
-    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-    tomorrow = today + timedelta(days=1)
-    
-    # Today's sales
-    today_sales = list(db.transactions.aggregate([
-        {"$match": {"created_at": {"$gte": today, "$lt": tomorrow}}},
-        {"$group": {"_id": None, "total": {"$sum": "$total_amount"}, "count": {"$sum": 1}}}
-    ]))
+    # Today's sales, from the hourly rollups
+    today_total, today_count = rollup_service.day_totals(db, datetime.utcnow())
     
     # Total products
     total_products = db.products.count_documents({"status": "active"})
@@ -30,11 +27,24 @@ def get_dashboard_stats():
     total_employees = db.master_karyawan.count_documents({"status": "active"})
     
     stats = {
-        "today_sales": today_sales[0]["total"] if today_sales else 0,
-        "today_transactions": today_sales[0]["count"] if today_sales else 0,
+        "today_sales": today_total,
+        "today_transactions": today_count,
         "total_products": total_products,
         "low_stock_products": low_stock,
         "total_employees": total_employees
     }
     
-    return jsonify(stats), 200
\ No newline at end of file
+    return jsonify(stats), 200
+
+@dashboard_bp.route("/bundle", methods=["GET"])
+@query_budget(max_queries=16)
+@require_auth(role="admin")
+def get_dashboard_bundle():
+    """Stats, charts, products and employees in one round trip."""
+    db = get_db().db
+    body, age = dashboard_bundle.get(db, lambda payload: jsonify(payload).get_data())
+    response = current_app.response_class(body, mimetype="application/json")
+    # shared between admin tabs for a few seconds; Age tells how stale
+    response.headers["Age"] = str(int(age))
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
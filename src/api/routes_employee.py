@@ -1,13 +1,16 @@
 from flask import Blueprint, request, jsonify
-from werkzeug.security import generate_password_hash
 from core.database import get_db
 from core.id_generator import IDGenerator
+from core.pagination import is_paged, page_from_args
 from utils.jwt_manager import token_required
+from services.password_service import HashingBusy, hash_password
 from datetime import datetime
 from functools import wraps
 
 employee_bp = Blueprint("employee", __name__)
 
+EMPLOYEE_FIELDS = {"employee_id", "name", "username", "email", "role", "status", "created_at"}
+
 @employee_bp.route("/", methods=["POST"])
 @token_required("admin") 
 def create_employee(current_user):
@@ -29,6 +32,11 @@ def create_employee(current_user):
     if existing:
         return jsonify({"error": "Username or email already exists"}), 400
 
+    try:
+        password_hash = hash_password(data["password"])
+    except HashingBusy:
+        return jsonify({"error": "Server busy, please try again"}), 503, {"Retry-After": "1"}
+
     employee_id = id_gen.get_next_id("EMP")
 
     employee = {
@@ -36,7 +44,7 @@ def create_employee(current_user):
         "name": data["nama"].strip(), 
         "username": data["username"].strip(), 
         "email": data["email"].strip().lower(), 
-        "password_hash": generate_password_hash(data["password"]),
+        "password_hash": password_hash,
         "role": data["role"], 
         "status": "active",
         "created_at": datetime.utcnow()
@@ -50,10 +58,24 @@ def create_employee(current_user):
 @token_required
 def list_employees(current_user):
     db = get_db().db
-    employees = list(db.master_karyawan.find(
-        {"status": "active"}, 
-        {"password_hash": 0}
-    ))
+    if is_paged(request.args):
+        try:
+            employees, next_cursor = page_from_args(
+                db.master_karyawan, {"status": "active"}, [("employee_id", 1)], request.args,
+                EMPLOYEE_FIELDS, always_exclude=("password_hash",), key_types=(str,)
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    else:
+        employees = list(db.master_karyawan.find(
+            {"status": "active"}, 
+            {"password_hash": 0}
+        ))
+    for e in employees:
+        e["_id"] = str(e["_id"])
+    
+    if is_paged(request.args):
+        return jsonify({"data": employees, "next_cursor": next_cursor}), 200
     return jsonify(employees), 200
 
 @employee_bp.route("/<employee_id>", methods=["GET"])
@@ -0,0 +1,98 @@
+from flask import Blueprint, Response, jsonify, request
+from config import EVENTS_HEARTBEAT_SECONDS, EVENTS_TICKET_SECONDS
+from core.connection import connection_manager
+from services.event_service import RESET, event_bus
+from services.revocation_service import revocation_list
+from utils.jwt_manager import authenticate_request, generate_stream_ticket, require_auth, verify_stream_ticket
+from utils.token_cache import token_digest
+import jwt
+import time
+
+events_bp = Blueprint("events_bp", __name__)
+
+def stream_frames(subscription, backlog, expires_at, session_hash):
+    try:
+        # the page opens a new stream with a fresh ticket 3s after this
+        # one drops, resuming from the last event id it saw
+        yield b"retry: 3000\n\n"
+        for frame in backlog:
+            yield frame
+        while True:
+            remaining = expires_at - time.time()
+            if remaining <= 0:
+                # session expired: end the stream, the client reconnects with a fresh one
+                return
+            if revocation_list.is_revoked(connection_manager.get_database(), session_hash):
+                # logged out since the stream opened; checked at least every heartbeat
+                return
+            frames = subscription.next_frames(min(EVENTS_HEARTBEAT_SECONDS, remaining))
+            if frames == RESET:
+                yield event_bus.reset_frame()
+            elif frames:
+                yield b"".join(frames)
+            else:
+                yield b": keepalive\n\n"
+    finally:
+        event_bus.unsubscribe(subscription)
+
+def stream_session():
+    """
+    (user, session token hash, None) from ?ticket= or the Authorization
+    header, or (None, None, error response).
+    """
+    ticket = request.args.get("ticket")
+    if not ticket:
+        payload, error = authenticate_request()
+        if error:
+            return None, None, error
+        return payload, token_digest(request.headers["Authorization"].split(" ", 1)[1]), None
+    try:
+        payload = verify_stream_ticket(ticket)
+    except jwt.PyJWTError as e:
+        return None, None, (jsonify({"error": "invalid or expired ticket", "detail": str(e)}), 401)
+    return dict(payload, exp=payload.get("session_exp")), payload["sid"], None
+
+@events_bp.route("/ticket", methods=["POST"])
+@require_auth()
+def stream_ticket():
+    """
+    Trade the session token for a ticket that opens one stream within
+    EVENTS_TICKET_SECONDS, so the token itself never goes in a URL.
+    A ticket is refused once used; every reconnect fetches a new one.
+    """
+    token = request.headers["Authorization"].split(" ", 1)[1]
+    response = jsonify({
+        "ticket": generate_stream_ticket(token, request.user, EVENTS_TICKET_SECONDS),
+        "expires_in": EVENTS_TICKET_SECONDS
+    })
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+@events_bp.route("/stream", methods=["GET"])
+def stream_events():
+    """
+    Server-sent events: sale, stock, catalog and reset. EventSource can't
+    send headers, so browsers pass a ticket from POST /ticket as ?ticket=;
+    other clients may send the Authorization header. Resume with the
+    Last-Event-ID header or ?last_event_id=. The stream ends when the
+    session expires or is logged out.
+    """
+    user, session_hash, error = stream_session()
+    if error:
+        return error
+
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    subscription, backlog = event_bus.subscribe(last_event_id)
+    if subscription is None:
+        response = jsonify({"error": "Too many open event streams, retry later"})
+        response.headers["Retry-After"] = "5"
+        return response, 503
+
+    response = Response(
+        stream_frames(subscription, backlog, user.get("exp") or time.time() + 3600, session_hash),
+        mimetype="text/event-stream"
+    )
+    response.headers["Cache-Control"] = "no-cache"
+    # keep reverse proxies from buffering the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
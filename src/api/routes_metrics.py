@@ -0,0 +1,77 @@
+from flask import Blueprint, Response, request, jsonify
+from config import METRICS_TOKEN
+from core.connection import connection_manager
+from services.catalog_snapshot import catalog_snapshot
+from services.event_service import event_bus
+from services.journal_service import receipt_journal
+from services.password_service import password_hasher
+from utils.jwt_manager import token_cache
+from utils.metrics import gauge_lines, registry, render_histogram
+
+metrics_bp = Blueprint("metrics_bp", __name__)
+
+@registry.collector
+def pool_metrics():
+    lines = []
+    for key, value in connection_manager.pool_stats.snapshot().items():
+        kind = "counter" if key.endswith("_total") else "gauge"
+        lines.extend(gauge_lines(f"mongodb_pool_{key}", f"Connection pool {key.replace('_', ' ')}.", value, kind))
+    return lines
+
+@registry.collector
+def journal_metrics():
+    stats = receipt_journal.stats()
+    return (
+        gauge_lines("receipt_journal_pending", "Journaled receipts not yet stored.", stats["pending"])
+        + gauge_lines("receipt_journal_lag_seconds", "Age of the oldest unstored receipt.", stats["lag_seconds"])
+        + gauge_lines("receipt_journal_flushed_total", "Receipts stored by the flusher.", stats["flushed"], "counter")
+        + gauge_lines("receipt_journal_flush_failures_total", "Failed journal flushes.", stats["flush_failures"], "counter")
+    )
+
+@registry.collector
+def password_metrics():
+    lines = ["# HELP password_hash_seconds Password hashing time by operation.",
+             "# TYPE password_hash_seconds histogram"]
+    for op, histogram in password_hasher.histograms.items():
+        lines.extend(render_histogram("password_hash_seconds", histogram, ("operation",), (op,)))
+    return lines + gauge_lines(
+        "password_hash_rejected_total", "Hash calls refused because the pool was saturated.",
+        password_hasher.rejected, "counter"
+    )
+
+@registry.collector
+def auth_cache_metrics():
+    stats = token_cache.stats()
+    return (
+        gauge_lines("auth_cache_hits_total", "Token cache hits.", stats["hits"], "counter")
+        + gauge_lines("auth_cache_misses_total", "Token cache misses.", stats["misses"], "counter")
+    )
+
+@registry.collector
+def event_metrics():
+    stats = event_bus.stats()
+    return (
+        gauge_lines("event_streams_open", "Open server-sent event streams.", stats["subscribers"])
+        + gauge_lines("events_published_total", "Events published to this worker's streams.", stats["published"], "counter")
+        + gauge_lines("event_streams_reset_total", "Streams reset for falling behind.", stats["resets"], "counter")
+    )
+
+@registry.collector
+def catalog_snapshot_metrics():
+    stats = catalog_snapshot.stats()
+    if not stats["enabled"]:
+        return []
+    return (
+        gauge_lines("catalog_snapshot_version", "Catalog version of the mapped snapshot.", stats["version"] or 0)
+        + gauge_lines("catalog_snapshot_products", "Products in the mapped snapshot.", stats["products"])
+        + gauge_lines("catalog_snapshot_age_seconds", "Seconds since the mapped snapshot was built.", stats["age_seconds"] or 0)
+        + gauge_lines("catalog_snapshot_builds_total", "Snapshots built by this worker.", stats["builds"], "counter")
+        + gauge_lines("catalog_snapshot_build_failures_total", "Failed snapshot builds in this worker.", stats["build_failures"], "counter")
+    )
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus text exposition of this worker's metrics."""
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"error": "Unauthorized"}), 401
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
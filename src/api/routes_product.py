@@ -1,12 +1,25 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from core.database import get_db
+from services import bulk_product_service, catalog_service, event_service
+from services.catalog_snapshot import catalog_snapshot
+from services.search_service import search_index, with_live_stock
+from config import BULK_MAX_ROWS, CATALOG_SNAPSHOT_ENABLED
 from core.id_generator import IDGenerator
+from core.pagination import decode_cursor, is_paged, page_from_args
+from core.query_budget import query_budget
 from utils.jwt_manager import require_auth
 from datetime import datetime
+import csv
+import io
 import re
 
 product_bp = Blueprint("product_bp", __name__)
 
+PRODUCT_FIELDS = {
+    "product_id", "name", "category", "price", "stock", "sku", "barcode", "status",
+    "created_at", "updated_at", "change_seq"
+}
+
 def validate_product_data(data, required_fields=None):
     if required_fields is None:
         required_fields = ['name', 'price', 'stock']
@@ -39,13 +52,125 @@ def validate_product_data(data, required_fields=None):
     return errors
 
 @product_bp.route("/", methods=["GET"])
+@query_budget(max_queries=5)
 @require_auth()
 def get_products():
     db = get_db().db
-    products = list(db.products.find({"status": {"$ne": "deleted"}}))
+    if is_paged(request.args):
+        return get_products_page(db)
+    
+    # the snapshot's catalog version lags by up to CATALOG_SNAPSHOT_REFRESH_SECONDS
+    # but never labels a body newer than it is, and a 304 then costs no query
+    version = catalog_snapshot.version() if CATALOG_SNAPSHOT_ENABLED else None
+    if version is None:
+        version = catalog_service.current_version(db)
+    
+    if request.if_none_match.contains(catalog_service.etag_for(version)):
+        response = current_app.response_class(status=304)
+    else:
+        # labelled with the version of the body actually sent
+        version, body = catalog_service.list_body(db, version, lambda products: jsonify(products).get_data())
+        response = current_app.response_class(body, mimetype="application/json")
+    
+    # browsers keep the body and revalidate with If-None-Match
+    response.set_etag(catalog_service.etag_for(version))
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.headers["X-Catalog-Version"] = str(version)
+    return response
+
+def get_products_page(db):
+    """Keyset pages by product_id, optionally filtered by ?category=."""
+    query = {"status": {"$ne": "deleted"}}
+    if request.args.get("category"):
+        query["category"] = request.args["category"]
+    try:
+        products, next_cursor = page_from_args(
+            db.products, query, [("product_id", 1)], request.args,
+            PRODUCT_FIELDS, always_exclude=catalog_service.INTERNAL_FIELDS, key_types=(str,)
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     for p in products:
         p["_id"] = str(p["_id"])
-    return jsonify(products), 200
+    return jsonify({"data": products, "next_cursor": next_cursor}), 200
+
+@product_bp.route("/stock", methods=["GET"])
+@query_budget(max_queries=1)
+@require_auth()
+def get_stock_levels():
+    """
+    Current stock, {product_id: stock}, of every active product or of
+    ?ids=a,b. Sales don't move the catalog version, so the cached list
+    carries stock as of the last catalog write; clients lay this over it.
+    """
+    ids = [i for i in request.args.get("ids", "").split(",") if i]
+    levels = catalog_service.stock_levels(get_db().db, ids or None)
+    response = jsonify(levels)
+    response.headers["Cache-Control"] = "no-store"
+    return response, 200
+
+@product_bp.route("/changes", methods=["GET"])
+@require_auth()
+def get_product_changes():
+    """
+    Delta sync: ?since=<version> returns products created, updated or
+    soft-deleted after that catalog version; without since, a snapshot
+    of the catalog is paged. Follow `cursor` while has_more, then
+    continue with since=<version>.
+    """
+    db = get_db().db
+    try:
+        limit = min(max(int(request.args.get("limit", 500)), 1), 2000)
+        if request.args.get("cursor"):
+            state = decode_cursor(request.args["cursor"])
+            since, version, after = state["since"], int(state["version"]), state["after"]
+        else:
+            since, version, after = request.args.get("since"), None, None
+        if since is not None:
+            since = int(since)
+            if since < 0:
+                raise ValueError(since)
+        if after is not None:
+            catalog_service.check_after(since, after)
+    except (ValueError, KeyError, TypeError):
+        return jsonify({"error": "Invalid since or cursor"}), 400
+    
+    page = catalog_service.changes_since(db, since, limit, after=after, version=version)
+    return jsonify(page), 200
+
+@product_bp.route("/search", methods=["GET"])
+@query_budget(max_queries=3)
+@require_auth()
+def search_products():
+    """
+    Type-ahead over active products: ?q= matches name prefixes (typos
+    tolerated) and exact SKU/barcode, ?category= filters, ?limit= caps.
+    Served from this worker's in-memory index, with current stock.
+    """
+    q = request.args.get("q", "").strip()
+    category = request.args.get("category")
+    try:
+        limit = min(max(int(request.args.get("limit", 20)), 1), 100)
+    except ValueError:
+        return jsonify({"error": "limit must be a number"}), 400
+    if not q and not category:
+        return jsonify({"error": "q or category is required"}), 400
+    
+    db = get_db().db
+    search_index.sync(db)
+    return jsonify(with_live_stock(db, search_index.search(q, category=category, limit=limit))), 200
+
+@product_bp.route("/lookup/<code>", methods=["GET"])
+@query_budget(max_queries=3)
+@require_auth()
+def lookup_product(code):
+    """Scanner lookup by exact SKU or barcode."""
+    db = get_db().db
+    search_index.sync(db)
+    product = search_index.lookup(code)
+    if not product:
+        return jsonify({"error": "Product not found"}), 404
+    return jsonify(with_live_stock(db, [product])[0]), 200
 
 @product_bp.route("/categories", methods=["GET"])
 @require_auth(role="admin")
@@ -89,11 +214,190 @@ def create_product():
         "status": "active",
         "created_at": datetime.utcnow()
     }
+    if data.get("barcode"):
+        product["barcode"] = str(data["barcode"]).strip()
+    
+    def insert(seq, session):
+        product.pop("_id", None)
+        product["change_seq"] = product["created_seq"] = seq
+        return db.products.insert_one(product, session=session)
     
-    result = db.products.insert_one(product)
+    result = catalog_service.write_change(db, insert)
+    search_index.upsert(product)
+    event_service.publish_catalog("created", [product["product_id"]])
     product["_id"] = str(result.inserted_id)
     return jsonify(product), 201
 
+def _bulk_rows():
+    """Rows of a bulk request: a JSON array ({"products": [...]} too) or CSV with a header line."""
+    if request.mimetype == "text/csv" or request.args.get("format") == "csv":
+        return list(csv.DictReader(io.StringIO(request.get_data(as_text=True))))
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get("products")
+    return data if isinstance(data, list) else None
+
+@product_bp.route("/bulk", methods=["POST"])
+@require_auth(role="admin")
+def bulk_import_products():
+    """
+    Import many products at once. Rows are validated in one pass, names are
+    checked against the catalog with one query, and valid rows are written
+    with one unordered bulk insert. Errors are reported per row (0-based).
+    """
+    rows = _bulk_rows()
+    if rows is None:
+        return jsonify({"error": "Expected a JSON array of products or a CSV body"}), 400
+    if len(rows) > BULK_MAX_ROWS:
+        return jsonify({"error": f"At most {BULK_MAX_ROWS} rows per request"}), 400
+    
+    db = get_db().db
+    errors = {}
+    valid = []
+    seen = set()
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict) or not isinstance(row.get("name", ""), str):
+            errors[i] = ["Row must be an object with a text name"]
+            continue
+        row_errors = [f"{field} must be text" for field in ("category", "sku")
+                      if row.get(field) is not None and not isinstance(row[field], str)]
+        row_errors += [f"{field} must be a number" for field in ("price", "stock")
+                       if isinstance(row.get(field), (list, dict))]
+        if row_errors:
+            errors[i] = row_errors
+            continue
+        row_errors = validate_product_data(row)
+        if row_errors:
+            errors[i] = row_errors
+            continue
+        name = row["name"].strip()
+        if name in seen:
+            errors[i] = ["Duplicate product name in this import"]
+            continue
+        seen.add(name)
+        valid.append(i)
+    
+    taken = bulk_product_service.existing_names(db, seen)
+    products = []
+    product_rows = []
+    for i in valid:
+        row = rows[i]
+        if row["name"].strip() in taken:
+            errors[i] = ["Product name already exists"]
+            continue
+        products.append({
+            "name": row["name"].strip(),
+            "category": (row.get("category") or "").strip(),
+            "price": float(row["price"]),
+            "stock": int(row["stock"]),
+            "sku": (row.get("sku") or "").strip()
+        })
+        product_rows.append(i)
+    
+    write_errors = bulk_product_service.insert_products(db, products)
+    for j, message in write_errors.items():
+        errors[product_rows[j]] = [message]
+    
+    created = [
+        {"row": product_rows[j], "product_id": p["product_id"]}
+        for j, p in enumerate(products) if j not in write_errors
+    ]
+    if created:
+        for j, p in enumerate(products):
+            if j not in write_errors:
+                search_index.upsert(p)
+        event_service.publish_catalog("created", [c["product_id"] for c in created])
+    result = {
+        "inserted": len(created),
+        "failed": len(errors),
+        "products": created,
+        "errors": [{"row": i, "errors": errors[i]} for i in sorted(errors)]
+    }
+    return jsonify(result), 201 if created else 400
+
+@product_bp.route("/bulk", methods=["PATCH"])
+@require_auth(role="admin")
+def bulk_update_products():
+    """
+    Batch price/stock changes, either
+    {"key": "product_id"|"sku", "updates": [{"product_id": ..., "price": ..., "stock": ..., "stock_delta": ...}]}
+    or {"category": ..., "price" | "price_multiplier" | "stock": ...}.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "No data provided"}), 400
+    
+    db = get_db().db
+    if "updates" in data:
+        key = data.get("key", "product_id")
+        updates = data["updates"]
+        if key not in ("product_id", "sku") or not isinstance(updates, list):
+            return jsonify({"error": "updates must be a list keyed by product_id or sku"}), 400
+        if len(updates) > BULK_MAX_ROWS:
+            return jsonify({"error": f"At most {BULK_MAX_ROWS} rows per request"}), 400
+        
+        errors = []
+        clean = []
+        seen = set()
+        for i, u in enumerate(updates):
+            try:
+                if not isinstance(u, dict) or not u.get(key) or not isinstance(u[key], str):
+                    raise ValueError(f"{key} is required")
+                if u[key] in seen:
+                    raise ValueError(f"Duplicate {key} in this batch")
+                change = {key: u[key]}
+                if "price" in u:
+                    change["price"] = float(u["price"])
+                    if change["price"] < 0:
+                        raise ValueError("Price must be positive")
+                if "stock" in u:
+                    change["stock"] = int(u["stock"])
+                    if change["stock"] < 0:
+                        raise ValueError("Stock must be non-negative")
+                if "stock_delta" in u:
+                    if "stock" in u:
+                        raise ValueError("Use either stock or stock_delta")
+                    change["stock_delta"] = int(u["stock_delta"])
+                if len(change) == 1:
+                    raise ValueError("Nothing to update")
+            except (ValueError, TypeError) as e:
+                errors.append({"row": i, "errors": [str(e)]})
+                continue
+            seen.add(u[key])
+            clean.append((i, change))
+        
+        failed = bulk_product_service.update_products(db, [c for _, c in clean], key) if clean else {}
+        errors += [{"row": clean[j][0], "errors": [message]} for j, message in failed.items()]
+        changed = [c for j, (_, c) in enumerate(clean) if j not in failed]
+        if changed:
+            search_index.catch_up(db)
+            ids = [c["product_id"] for c in changed] if key == "product_id" else []
+            event_service.publish_catalog("updated", ids, count=len(changed))
+        errors.sort(key=lambda e: e["row"])
+        return jsonify({"updated": len(changed), "failed": len(errors), "errors": errors}), 200
+    
+    if data.get("category"):
+        try:
+            price = float(data["price"]) if "price" in data else None
+            multiplier = float(data["price_multiplier"]) if "price_multiplier" in data else None
+            stock = int(data["stock"]) if "stock" in data else None
+        except (ValueError, TypeError):
+            return jsonify({"error": "price, price_multiplier and stock must be numbers"}), 400
+        if price is None and multiplier is None and stock is None:
+            return jsonify({"error": "Nothing to update"}), 400
+        if (price is not None and price < 0) or (multiplier is not None and multiplier < 0) or (stock is not None and stock < 0):
+            return jsonify({"error": "Values must be non-negative"}), 400
+        if price is not None and multiplier is not None:
+            return jsonify({"error": "Use either price or price_multiplier"}), 400
+        
+        updated = bulk_product_service.update_category(db, data["category"], price, multiplier, stock)
+        if updated:
+            search_index.catch_up(db)
+            event_service.publish_catalog("updated", count=updated, category=data["category"])
+        return jsonify({"updated": updated}), 200
+    
+    return jsonify({"error": "Provide updates or category"}), 400
+
 @product_bp.route("/<product_id>", methods=["PUT"])
 @require_auth(role="admin")
 def update_product(product_id):
@@ -123,7 +427,7 @@ def update_product(product_id):
             return jsonify({"error": "Product name already exists"}), 400
     
     update_data = {"updated_at": datetime.utcnow()}
-    for field in ["name", "category", "price", "stock", "sku"]:
+    for field in ["name", "category", "price", "stock", "sku", "barcode"]:
         if field in data:
             if field in ["price"]:
                 update_data[field] = float(data[field])
@@ -132,7 +436,15 @@ def update_product(product_id):
             else:
                 update_data[field] = data[field].strip() if isinstance(data[field], str) else data[field]
     
-    db.products.update_one({"product_id": product_id}, {"$set": update_data})
+    def update(seq, session):
+        update_data["change_seq"] = seq
+        db.products.update_one({"product_id": product_id}, {"$set": update_data}, session=session)
+    
+    catalog_service.write_change(db, update)
+    search_index.upsert(dict(existing, **update_data))
+    event_service.publish_catalog("updated", [product_id])
+    if "stock" in update_data:
+        event_service.publish_stock([{"product_id": product_id, "stock": update_data["stock"]}])
     return jsonify({"message": "Product updated successfully"}), 200
 
 @product_bp.route("/<product_id>", methods=["DELETE"])
@@ -140,12 +452,18 @@ def update_product(product_id):
 def delete_product(product_id):
     db = get_db().db
     
-    result = db.products.update_one(
-        {"product_id": product_id, "status": {"$ne": "deleted"}},
-        {"$set": {"status": "deleted", "deleted_at": datetime.utcnow()}}
-    )
+    def soft_delete(seq, session):
+        return db.products.update_one(
+            {"product_id": product_id, "status": {"$ne": "deleted"}},
+            {"$set": {"status": "deleted", "deleted_at": datetime.utcnow(), "change_seq": seq}},
+            session=session
+        )
+    
+    result = catalog_service.write_change(db, soft_delete)
     
     if result.matched_count == 0:
         return jsonify({"error": "Product not found"}), 404
     
+    search_index.remove(product_id)
+    event_service.publish_catalog("deleted", [product_id])
     return jsonify({"message": "Product deleted successfully"}), 200
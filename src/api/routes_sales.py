@@ -1,12 +1,25 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from core.database import get_db
-from core.id_generator import IDGenerator
+from core.pagination import page_from_args
+from core.query_budget import query_budget
+from core.tracing import span
+from config import SALES_BATCH_MAX
+from services import checkout_service, export_service, rollup_service
+from services.checkout_service import CheckoutError
 from utils.jwt_manager import require_auth
-from datetime import datetime, timedelta
+from bson import ObjectId
+from datetime import datetime, timedelta, timezone
 import re
 
 sales_bp = Blueprint("sales_bp", __name__)
 
+TRANSACTION_SORT = [("created_at", -1), ("_id", -1)]
+TRANSACTION_SORT_TYPES = (datetime, ObjectId)
+TRANSACTION_FIELDS = {
+    "transaction_id", "items", "total_amount", "payment_method", "cashier_id",
+    "cashier_name", "customer_name", "status", "store_id", "created_at"
+}
+
 def validate_transaction_data(data):
     errors = []
     
@@ -18,6 +31,9 @@ def validate_transaction_data(data):
         errors.append("At least one item is required")
     
     for i, item in enumerate(data["items"]):
+        if not isinstance(item, dict):
+            errors.append(f"Item {i+1} must be an object")
+            continue
         if not item.get("product_id"):
             errors.append(f"Item {i+1}: product_id is required")
         
@@ -34,85 +50,162 @@ def validate_transaction_data(data):
     return errors
 
 @sales_bp.route("/", methods=["POST"])
+@query_budget(max_queries=10)
 @require_auth()
 def create_transaction():
     data = request.get_json()
     if not data:
         return jsonify({"error": "No data provided"}), 400
     
-    errors = validate_transaction_data(data)
+    items = data.get("items")
+    with span("checkout.validate", items=len(items) if isinstance(items, list) else 0):
+        errors = validate_transaction_data(data)
     if errors:
         return jsonify({"errors": errors}), 400
     
     db = get_db().db
-    id_gen = IDGenerator(db)
+    try:
+        transaction = checkout_service.checkout(db, data, request.user)
+    except CheckoutError as e:
+        return jsonify({"error": str(e)}), e.status
     
-    # Validate products and calculate total
-    transaction_items = []
-    total_amount = 0
+    transaction["_id"] = str(transaction["_id"])
     
-    for item in data["items"]:
-        product = db.products.find_one({
-            "product_id": item["product_id"],
-            "status": "active"
-        })
-        
-        if not product:
-            return jsonify({"error": f"Product {item['product_id']} not found"}), 400
-        
-        quantity = int(item["quantity"])
-        
-        # Check stock availability
-        if product["stock"] < quantity:
-            return jsonify({"error": f"Insufficient stock for {product['name']}"}), 400
-        
-        item_total = product["price"] * quantity
-        total_amount += item_total
-        
-        transaction_items.append({
-            "product_id": item["product_id"],
-            "product_name": product["name"],
-            "price": product["price"],
-            "quantity": quantity,
-            "subtotal": item_total
-        })
-    
-    # Create transaction
-    transaction = {
-        "transaction_id": id_gen.get_next_id("TXN"),
-        "items": transaction_items,
-        "total_amount": total_amount,
-        "payment_method": data.get("payment_method", "cash"),
-        "cashier_id": request.user["user_id"],
-        "cashier_name": request.user.get("username", ""),
-        "customer_name": data.get("customer_name", ""),
-        "status": "completed",
-        "created_at": datetime.utcnow()
-    }
-    
-    # Update stock for all items
-    for item in data["items"]:
-        db.products.update_one(
-            {"product_id": item["product_id"]},
-            {"$inc": {"stock": -int(item["quantity"])}}
-        )
+    return jsonify(transaction), 201
+
+def parse_batch_entry(entry):
+    """Validate one replayed sale; returns (errors, created_at as naive UTC)."""
+    if not isinstance(entry, dict):
+        return ["Transaction must be an object"], None
+    errors = validate_transaction_data(entry)
+    key = entry.get("idempotency_key")
+    if not isinstance(key, str) or not 0 < len(key) <= 128:
+        errors.append("idempotency_key must be a string of 1-128 characters")
     
-    result = db.transactions.insert_one(transaction)
-    transaction["_id"] = str(result.inserted_id)
+    created_at = None
+    if entry.get("created_at"):
+        try:
+            created_at = datetime.fromisoformat(str(entry["created_at"]).replace("Z", "+00:00"))
+            if created_at.tzinfo:
+                created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+            if created_at > datetime.utcnow() + timedelta(minutes=5):
+                errors.append("created_at is in the future")
+        except ValueError:
+            errors.append("created_at must be an ISO 8601 timestamp")
+    return errors, created_at
+
+@sales_bp.route("/batch", methods=["POST"])
+@query_budget(max_queries=40)
+@require_auth()
+def ingest_transactions():
+    """
+    Replay sales recorded while a register was offline:
+    {"transactions": [{"idempotency_key", "items", "payment_method",
+    "customer_name", "created_at"}, ...]}. Each gets its own result
+    (created, duplicate, invalid, rejected or error) in request order;
+    resending the same batch is safe.
+    """
+    data = request.get_json(silent=True)
+    entries = data.get("transactions") if isinstance(data, dict) else None
+    if not isinstance(entries, list) or not entries:
+        return jsonify({"error": "transactions list is required"}), 400
+    if len(entries) > SALES_BATCH_MAX:
+        return jsonify({"error": f"At most {SALES_BATCH_MAX} transactions per batch"}), 400
     
-    return jsonify(transaction), 201
+    results = [None] * len(entries)
+    valid = []
+    for i, entry in enumerate(entries):
+        errors, created_at = parse_batch_entry(entry)
+        if errors:
+            results[i] = {"status": "invalid", "errors": errors}
+        else:
+            valid.append((i, dict(entry, created_at=created_at)))
+    
+    if valid:
+        db = get_db().db
+        try:
+            outcome = checkout_service.ingest_batch(db, [entry for _, entry in valid], request.user)
+        except CheckoutError as e:
+            return jsonify({"error": str(e)}), e.status
+        for (i, _), result in zip(valid, outcome):
+            if "duplicate_of" in result:
+                result["duplicate_of"] = valid[result["duplicate_of"]][0]
+            results[i] = result
+    
+    summary = {}
+    for i, result in enumerate(results):
+        result["index"] = i
+        if isinstance(entries[i], dict) and isinstance(entries[i].get("idempotency_key"), str):
+            result["idempotency_key"] = entries[i]["idempotency_key"]
+        summary[result["status"]] = summary.get(result["status"], 0) + 1
+    
+    return jsonify({"results": results, "summary": summary}), 200
 
 @sales_bp.route("/", methods=["GET"])
+@query_budget(max_queries=3)
 @require_auth()
 def get_transactions():
+    """
+    Newest first. ?page_size= and ?cursor= page by (created_at, _id);
+    ?shape=summary leaves out items, ?fields=a,b picks fields.
+    Without page_size/cursor a plain list of at most ?limit= is returned.
+    """
     db = get_db().db
-    limit = int(request.args.get("limit", 50))
-    
-    transactions = list(db.transactions.find({}).sort("created_at", -1).limit(limit))
+    try:
+        transactions, next_cursor = page_from_args(
+            db.transactions, {}, TRANSACTION_SORT, request.args,
+            TRANSACTION_FIELDS, summary_exclude=("items",), key_types=TRANSACTION_SORT_TYPES
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     for t in transactions:
         t["_id"] = str(t["_id"])
     
-    return jsonify(transactions), 200
+    if "cursor" not in request.args and "page_size" not in request.args:
+        return jsonify(transactions), 200
+    return jsonify({"data": transactions, "next_cursor": next_cursor}), 200
+
+@sales_bp.route("/export", methods=["GET"])
+@query_budget()  # one getMore per batch; unbounded by design
+@require_auth(role="admin")
+def export_transactions():
+    """
+    Stream transactions as NDJSON or CSV.
+    ?from=YYYY-MM-DD&to=YYYY-MM-DD (inclusive), ?format=ndjson|csv,
+    ?lines=1 for one row per line item, ?cashier_id=, ?payment_method=,
+    ?gzip=1 to compress on the fly.
+    """
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in ("ndjson", "csv"):
+        return jsonify({"error": "format must be ndjson or csv"}), 400
+    try:
+        start = end = None
+        if request.args.get("from"):
+            start = datetime.strptime(request.args["from"], "%Y-%m-%d")
+        if request.args.get("to"):
+            end = datetime.strptime(request.args["to"], "%Y-%m-%d") + timedelta(days=1)
+    except ValueError:
+        return jsonify({"error": "from/to must be YYYY-MM-DD"}), 400
+    
+    db = get_db().db
+    query = export_service.export_query(
+        start, end,
+        cashier_id=request.args.get("cashier_id"),
+        payment_method=request.args.get("payment_method")
+    )
+    lines = request.args.get("lines") in ("1", "true")
+    gzip = request.args.get("gzip") in ("1", "true")
+    
+    filename = f"{'transaction_lines' if lines else 'transactions'}.{'csv' if fmt == 'csv' else 'ndjson'}"
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    if gzip:
+        filename += ".gz"
+        mimetype = "application/gzip"
+    
+    stream = export_service.export_stream(db, query, fmt, lines, gzip)
+    response = Response(stream_with_context(stream), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    return response
 
 @sales_bp.route("/analytics/daily", methods=["GET"])
 @require_auth(role="admin")
@@ -123,19 +216,7 @@ def daily_analytics():
     end_date = datetime.utcnow()
     start_date = end_date - timedelta(days=days)
     
-    pipeline = [
-        {"$match": {"created_at": {"$gte": start_date, "$lte": end_date}}},
-        {
-            "$group": {
-                "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
-                "total_sales": {"$sum": "$total_amount"},
-                "transaction_count": {"$sum": 1}
-            }
-        },
-        {"$sort": {"_id": 1}}
-    ]
-    
-    result = list(db.transactions.aggregate(pipeline))
+    result = rollup_service.sales_series(db, start_date, end_date, "day", request.args.get("store_id"))
     return jsonify(result), 200
 
 @sales_bp.route("/analytics/weekly", methods=["GET"])
@@ -147,19 +228,8 @@ def weekly_analytics():
     end_date = datetime.utcnow()
     start_date = end_date - timedelta(weeks=weeks)
     
-    pipeline = [
-        {"$match": {"created_at": {"$gte": start_date, "$lte": end_date}}},
-        {
-            "$group": {
-                "_id": {"$week": "$created_at"},
-                "total_sales": {"$sum": "$total_amount"},
-                "transaction_count": {"$sum": 1}
-            }
-        },
-        {"$sort": {"_id": 1}}
-    ]
-    
-    result = list(db.transactions.aggregate(pipeline))
+    # grouped by ISO year and week, e.g. "2026-W42"
+    result = rollup_service.sales_series(db, start_date, end_date, "week", request.args.get("store_id"))
     return jsonify(result), 200
 
 @sales_bp.route("/analytics/monthly", methods=["GET"])
@@ -171,19 +241,7 @@ def monthly_analytics():
     end_date = datetime.utcnow()
     start_date = end_date - timedelta(days=months*30)
     
-    pipeline = [
-        {"$match": {"created_at": {"$gte": start_date, "$lte": end_date}}},
-        {
-            "$group": {
-                "_id": {"$dateToString": {"format": "%Y-%m", "date": "$created_at"}},
-                "total_sales": {"$sum": "$total_amount"},
-                "transaction_count": {"$sum": 1}
-            }
-        },
-        {"$sort": {"_id": 1}}
-    ]
-    
-    result = list(db.transactions.aggregate(pipeline))
+    result = rollup_service.sales_series(db, start_date, end_date, "month", request.args.get("store_id"))
     return jsonify(result), 200
 
 @sales_bp.route("/analytics/bestsellers", methods=["GET"])
@@ -192,19 +250,25 @@ def bestsellers():
     db = get_db().db
     limit = int(request.args.get("limit", 10))
     
-    pipeline = [
-        {"$unwind": "$items"},
-        {
-            "$group": {
-                "_id": "$items.product_id",
-                "product_name": {"$first": "$items.product_name"},
-                "total_quantity": {"$sum": "$items.quantity"},
-                "total_revenue": {"$sum": "$items.subtotal"}
-            }
-        },
-        {"$sort": {"total_quantity": -1}},
-        {"$limit": limit}
-    ]
-    
-    result = list(db.transactions.aggregate(pipeline))
+    # optional window: ?days=N, or ?from=YYYY-MM-DD&to=YYYY-MM-DD
+    start_date = end_date = None
+    try:
+        if request.args.get("days"):
+            end_date = datetime.utcnow()
+            start_date = end_date - timedelta(days=int(request.args["days"]) - 1)
+        if request.args.get("from"):
+            start_date = datetime.strptime(request.args["from"], "%Y-%m-%d")
+        if request.args.get("to"):
+            end_date = datetime.strptime(request.args["to"], "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"error": "days must be a number, from/to must be YYYY-MM-DD"}), 400
+    
+    result = rollup_service.top_products(
+        db, limit,
+        start=start_date,
+        end=end_date,
+        category=request.args.get("category"),
+        store_id=request.args.get("store_id"),
+        sort_by=request.args.get("sort", "quantity")
+    )
     return jsonify(result), 200
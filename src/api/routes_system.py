@@ -0,0 +1,60 @@
+from flask import Blueprint, jsonify
+from core.connection import connection_manager
+from core.database import get_db
+from core.indexes import ensure_indexes, explain_queries
+from utils.jwt_manager import require_auth, token_cache
+from services.catalog_snapshot import catalog_snapshot
+from services.revocation_service import revocation_list
+from services.journal_service import receipt_journal
+from services.password_service import password_hasher
+from services.search_service import search_index
+
+system_bp = Blueprint("system_bp", __name__)
+
+@system_bp.route("/db-pool", methods=["GET"])
+@require_auth(role="admin")
+def db_pool_stats():
+    return jsonify(connection_manager.pool_snapshot()), 200
+
+@system_bp.route("/auth-cache", methods=["GET"])
+@require_auth(role="admin")
+def auth_cache_stats():
+    stats = token_cache.stats()
+    stats["revocations"] = revocation_list.stats()
+    return jsonify(stats), 200
+
+@system_bp.route("/journal", methods=["GET"])
+@require_auth(role="admin")
+def journal_stats():
+    return jsonify(receipt_journal.stats()), 200
+
+@system_bp.route("/password-hashing", methods=["GET"])
+@require_auth(role="admin")
+def password_hashing_stats():
+    return jsonify(password_hasher.stats()), 200
+
+@system_bp.route("/search-index", methods=["GET"])
+@require_auth(role="admin")
+def search_index_stats():
+    return jsonify(search_index.stats()), 200
+
+@system_bp.route("/catalog-snapshot", methods=["GET"])
+@require_auth(role="admin")
+def catalog_snapshot_stats():
+    return jsonify(catalog_snapshot.stats()), 200
+
+@system_bp.route("/indexes", methods=["GET"])
+@require_auth(role="admin")
+def index_report():
+    db = get_db().db
+    plans = explain_queries(db)
+    return jsonify({
+        "collection_scans": [p["route"] for p in plans if p.get("collscan")],
+        "queries": plans
+    }), 200
+
+@system_bp.route("/indexes", methods=["POST"])
+@require_auth(role="admin")
+def rebuild_indexes():
+    db = get_db().db
+    return jsonify(ensure_indexes(db)), 200
@@ -50,4 +50,82 @@ function getCurrentUser() {
     } catch (e) {
         return null;
     }
-}
\ No newline at end of file
+}
+// Live events (sale, stock, catalog, reset) from /api/events/stream.
+// EventSource can't send headers, so each stream is opened with a
+// short-lived ticket traded for the current token. When a stream drops
+// (server restart, session expiry or logout) it is reopened with a new
+// ticket after 3s, resuming from the last event id it saw.
+function subscribeEvents(handlers) {
+    if (!window.EventSource) return null;
+    let source = null, lastEventId = null, retry = null, closed = false;
+
+    function open() {
+        const token = localStorage.getItem("jwt");
+        if (!token || closed) return;
+        fetch("/api/events/ticket", {
+            method: "POST",
+            headers: { "Authorization": "Bearer " + token }
+        }).then(function(res) {
+            // logged out or expired: nothing to reconnect with
+            if (res.status === 401) closed = true;
+            return res.ok ? res.json() : Promise.reject(res.status);
+        }).then(function(body) {
+            if (closed) return;
+            let url = "/api/events/stream?ticket=" + encodeURIComponent(body.ticket);
+            if (lastEventId) url += "&last_event_id=" + encodeURIComponent(lastEventId);
+            source = new EventSource(url);
+            Object.keys(handlers).forEach(function(type) {
+                source.addEventListener(type, function(e) {
+                    if (e.lastEventId) lastEventId = e.lastEventId;
+                    handlers[type](JSON.parse(e.data));
+                });
+            });
+            // EventSource would retry with the same, already used, ticket
+            source.onerror = reconnect;
+        }).catch(reconnect);
+    }
+
+    function reconnect() {
+        if (source) source.close();
+        source = null;
+        clearTimeout(retry);
+        if (!closed) retry = setTimeout(open, 3000);
+    }
+
+    open();
+    return {
+        close: function() {
+            closed = true;
+            clearTimeout(retry);
+            if (source) source.close();
+        }
+    };
+}
+
+// The product list is cached per catalog version, which sales don't move;
+// fetch it with current stock laid over it
+function fetchProducts() {
+    const headers = { "Authorization": "Bearer " + localStorage.getItem("jwt") };
+    return Promise.all([
+        fetch("/api/products/", { headers: headers }).then(res => res.json()),
+        fetch("/api/products/stock", { headers: headers }).then(res => res.ok ? res.json() : {})
+    ]).then(function(results) {
+        const products = results[0], stock = results[1];
+        if (Array.isArray(products)) {
+            products.forEach(function(p) {
+                if (p.product_id in stock) p.stock = stock[p.product_id];
+            });
+        }
+        return products;
+    });
+}
+
+// Run fn once calls stop for `ms`, for bursts of events that each mean "reload"
+function debounce(fn, ms) {
+    let timer = null;
+    return function() {
+        clearTimeout(timer);
+        timer = setTimeout(fn, ms);
+    };
+}
@@ -0,0 +1,123 @@
+"""
+Shared fixtures. The app runs on the benchmarks' mock backend (mongomock,
+in process), with QUERY_BUDGET_MODE=strict so a route over its budget
+fails its test, and with tracing on; traces go to a temporary file.
+
+    pip install pytest mongomock
+    python -m pytest -q
+"""
+import os
+import sys
+import tempfile
+import threading
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+os.environ.setdefault("QUERY_BUDGET_MODE", "strict")
+os.environ.setdefault("TRACE_FILE", os.path.join(tempfile.mkdtemp(prefix="pos-traces-"), "traces.ndjson"))
+
+from benchmarks import backends  # noqa: E402
+
+# before anything imports config
+backends.configure("mock", os.getenv("TEST_DB_NAME", "pos_test_bench"))
+
+# the pymongo command each mongomock method stands for
+COMMANDS = {
+    "find": "find", "find_one": "find",
+    "insert_one": "insert", "insert_many": "insert",
+    "update_one": "update", "update_many": "update", "replace_one": "update",
+    "delete_one": "delete", "delete_many": "delete",
+    "find_one_and_update": "findAndModify", "find_one_and_replace": "findAndModify",
+    "find_one_and_delete": "findAndModify",
+    "aggregate": "aggregate", "count_documents": "aggregate",
+    "estimated_document_count": "count", "distinct": "distinct",
+    "bulk_write": "update",
+}
+
+
+class _Event:
+    def __init__(self, command_name, command, reply=None):
+        self.command_name = command_name
+        self.command = command
+        self.reply = reply or {"ok": 1}
+        self.duration_micros = 0
+
+
+def _command(name, collection, args, kwargs):
+    query = kwargs.get("filter", args[0] if args and isinstance(args[0], dict) else None)
+    if name == "update":
+        return {name: collection, "updates": [{"q": query or {}}]}
+    if name == "delete":
+        return {name: collection, "deletes": [{"q": query or {}}]}
+    if name == "findAndModify":
+        return {name: collection, "query": query or {}}
+    if name == "aggregate":
+        pipeline = args[0] if args and isinstance(args[0], list) else [{"$match": query or {}}]
+        return {name: collection, "pipeline": pipeline}
+    return {name: collection, "filter": query or {}}
+
+
+@pytest.fixture(scope="session")
+def app():
+    pytest.importorskip("mongomock")
+    backends.connect("mock")
+    import app as application
+    return application.app
+
+
+@pytest.fixture
+def db(app):
+    from core.connection import connection_manager
+
+    db = connection_manager.get_database()
+    yield db
+    db.client.drop_database(db.name)
+
+
+@pytest.fixture
+def command_events(app, monkeypatch):
+    """
+    Publish a command event per collection call to the app's pymongo
+    listeners, as a real client would; mongomock sends none.
+    """
+    from mongomock.collection import Collection
+    from pymongo import monitoring
+    from core.connection import connection_manager
+
+    listeners = [l for l in connection_manager._listeners if isinstance(l, monitoring.CommandListener)]
+    depth = threading.local()
+
+    def wrap(method, name):
+        def call(self, *args, **kwargs):
+            if getattr(depth, "n", 0):
+                # mongomock implementing one call with another
+                return method(self, *args, **kwargs)
+            event = _Event(name, _command(name, self.name, args, kwargs))
+            for listener in listeners:
+                listener.started(event)
+            depth.n = 1
+            try:
+                result = method(self, *args, **kwargs)
+            finally:
+                depth.n = 0
+            for listener in listeners:
+                listener.succeeded(event)
+            return result
+        return call
+
+    for method_name, command_name in COMMANDS.items():
+        monkeypatch.setattr(Collection, method_name, wrap(getattr(Collection, method_name), command_name))
+    return listeners
+
+
+@pytest.fixture
+def auth():
+    from utils.jwt_manager import generate_token
+
+    def headers(role="admin", user_id="EMP-TEST"):
+        return {"Authorization": f"Bearer {generate_token(user_id, role)}"}
+    return headers
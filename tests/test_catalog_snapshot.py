@@ -0,0 +1,120 @@
+from datetime import datetime
+
+import pytest
+
+from services import catalog_service
+from services.catalog_snapshot import HEADER, MAGIC, SECTIONS, CatalogSnapshot, SnapshotManager, build
+
+PRODUCTS = [
+    {"product_id": "PRD-0003", "name": "Kopi Susu", "sku": "KS1", "category": "Beverages", "price": 12000.5, "stock": 5, "change_seq": 3},
+    {"product_id": "PRD-0001", "name": "Keripik Singkong Pedas", "sku": "KP1", "category": "Snacks", "price": 7500.0, "stock": 0, "change_seq": 1},
+    {"product_id": "PRD-0002", "name": "Crème Brûlée", "sku": "", "category": "Beverages", "price": 0.0, "stock": 2 ** 40, "change_seq": 2},
+]
+
+
+def _insert(db, products):
+    db.products.insert_many([dict(p, status="active", created_at=datetime.utcnow()) for p in products])
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    return str(tmp_path / "catalog" / "catalog.snap")
+
+
+def test_round_trip(db, snapshot_path):
+    _insert(db, PRODUCTS)
+    db.products.insert_one({"product_id": "PRD-0004", "name": "Gone", "status": "deleted", "change_seq": 4})
+    db.counters.insert_one({"_id": catalog_service.CATALOG_COUNTER, "version": 5, "pending": []})
+
+    build(db, snapshot_path)
+    snapshot = CatalogSnapshot(snapshot_path)
+    assert snapshot.rows == 3
+    assert snapshot.version == 5
+    # the delete is an edit; version 5 stamped no product
+    assert snapshot.edit_seq == 4
+    for product in PRODUCTS:
+        row = snapshot.find(product["product_id"])
+        assert snapshot.product(row) == {k: product[k] for k in ("product_id", "name", "sku", "category", "price", "stock")}
+
+
+def test_edit_sequence_stays_behind_writes_in_flight(db):
+    _insert(db, PRODUCTS)
+    db.counters.insert_one({
+        "_id": catalog_service.CATALOG_COUNTER, "version": 3,
+        "pending": [{"id": "w", "first": 3, "at": datetime.utcnow()}],
+    })
+    assert catalog_service.edit_sequence(db) == 2
+
+
+def test_layout(db, snapshot_path):
+    _insert(db, PRODUCTS)
+    build(db, snapshot_path)
+    with open(snapshot_path, "rb") as f:
+        data = f.read()
+    header = HEADER.unpack_from(data)
+    assert header[0] == MAGIC
+    offsets = header[7:]
+    assert len(offsets) == len(SECTIONS)
+    assert all(offset % 8 == 0 for offset in offsets)
+    assert list(offsets) == sorted(offsets)
+    assert offsets[0] >= HEADER.size
+
+    snapshot = CatalogSnapshot(snapshot_path)
+    # rows sorted by product_id, categories interned once
+    assert [snapshot.string(ref) for ref in snapshot._ids] == ["PRD-0001", "PRD-0002", "PRD-0003"]
+    assert sorted(snapshot.string(ref) for ref in snapshot._categories) == ["Beverages", "Snacks"]
+
+
+def test_find(db, snapshot_path):
+    _insert(db, PRODUCTS)
+    build(db, snapshot_path)
+    snapshot = CatalogSnapshot(snapshot_path)
+    assert snapshot.find("PRD-0001") == 0
+    assert snapshot.find("PRD-0003") == 2
+    for missing in ("PRD-0000", "PRD-00025", "PRD-0004", "", "ZZZ"):
+        assert snapshot.find(missing) is None
+    assert set(snapshot.products(["PRD-0003", "PRD-0009"])) == {"PRD-0003"}
+
+
+def test_empty_catalog(db, snapshot_path):
+    assert build(db, snapshot_path) == 0
+    snapshot = CatalogSnapshot(snapshot_path)
+    assert snapshot.rows == 0
+    assert snapshot.edit_seq == 0
+    assert snapshot.find("PRD-0001") is None
+    assert snapshot.products(["PRD-0001"]) == {}
+
+
+def test_not_a_snapshot(tmp_path):
+    path = tmp_path / "other"
+    path.write_bytes(b"\0" * HEADER.size)
+    with pytest.raises(ValueError):
+        CatalogSnapshot(str(path))
+
+
+def test_manager_falls_back_unless_every_id_is_mapped(db, snapshot_path):
+    manager = SnapshotManager(snapshot_path, refresh_seconds=60)
+    assert manager.products(["PRD-0001"]) is None
+    _insert(db, PRODUCTS)
+    build(db, snapshot_path)
+    manager._checked_at = 0.0
+    assert set(manager.products(["PRD-0001", "PRD-0003"])) == {"PRD-0001", "PRD-0003"}
+    assert manager.products(["PRD-0001", "PRD-0009"]) is None
+
+
+def test_list_body_serves_newer_cache_to_a_lagging_version(db, monkeypatch):
+    monkeypatch.setattr(catalog_service, "_cache", {"version": None, "body": None})
+    _insert(db, PRODUCTS)
+    renders = []
+
+    def render(products):
+        renders.append(len(products))
+        return b"body"
+
+    assert catalog_service.list_body(db, 5, render) == (5, b"body")
+    # a snapshot a version behind reuses the newer body, no query
+    assert catalog_service.list_body(db, 4, render) == (5, b"body")
+    assert catalog_service.list_body(db, 5, render) == (5, b"body")
+    assert renders == [3]
+    catalog_service.list_body(db, 6, render)
+    assert renders == [3, 3]
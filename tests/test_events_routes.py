@@ -0,0 +1,30 @@
+def _ticket(client, headers):
+    response = client.post("/api/events/ticket", headers=headers)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()["ticket"]
+
+
+def test_a_ticket_opens_one_stream(app, db, auth):
+    client = app.test_client()
+    headers = auth("kasir")
+    ticket = _ticket(client, headers)
+
+    first = client.get(f"/api/events/stream?ticket={ticket}", buffered=False)
+    assert first.status_code == 200
+    assert next(first.response) == b"retry: 3000\n\n"
+    first.close()
+
+    again = client.get(f"/api/events/stream?ticket={ticket}", buffered=False)
+    assert again.status_code == 401
+    assert "already been used" in again.get_json()["detail"]
+
+    # reconnecting takes a fresh ticket
+    fresh = client.get(f"/api/events/stream?ticket={_ticket(client, headers)}", buffered=False)
+    assert fresh.status_code == 200
+    fresh.close()
+
+
+def test_session_token_is_not_a_ticket(app, db, auth):
+    token = auth("kasir")["Authorization"].split(" ", 1)[1]
+    response = app.test_client().get(f"/api/events/stream?ticket={token}")
+    assert response.status_code == 401
@@ -0,0 +1,45 @@
+from datetime import datetime
+
+import pytest
+
+from core import id_generator
+from core.id_generator import IDGenerator
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Set this worker's date; leases start over as in a fresh worker."""
+    monkeypatch.setattr(id_generator, "_leases", {})
+
+    def set_date(day):
+        class Clock(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return datetime.strptime(day, "%Y%m%d")
+        monkeypatch.setattr(id_generator, "datetime", Clock)
+    return set_date
+
+
+def test_sequence_restarts_on_a_new_day(db, clock):
+    clock("20240101")
+    assert IDGenerator(db, block_size=2).get_next_ids("TXN", 3) == [
+        "TXN-20240101-0001", "TXN-20240101-0002", "TXN-20240101-0003"
+    ]
+    clock("20240102")
+    assert IDGenerator(db, block_size=2).get_next_id("TXN") == "TXN-20240102-0001"
+
+
+def test_worker_behind_midnight_doesnt_reset_the_counter(db, clock):
+    # another worker has rolled the counter over to the 2nd and issued 1-5
+    db.counters.insert_one({"_id": "TXN", "date": "20240102", "sequence": 5})
+
+    # this worker's clock is still on the 1st
+    clock("20240101")
+    straddler = IDGenerator(db, block_size=10).get_next_ids("TXN", 2)
+    assert straddler == ["TXN-20240102-0006", "TXN-20240102-0007"]
+    assert db.counters.find_one({"_id": "TXN"}) == {"_id": "TXN", "date": "20240102", "sequence": 15}
+
+    # the next lease on the 2nd continues after the straddler's block
+    clock("20240102")
+    id_generator._leases.clear()
+    assert IDGenerator(db, block_size=10).get_next_id("TXN") == "TXN-20240102-0016"
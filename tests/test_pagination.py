@@ -0,0 +1,54 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from core.pagination import check_keys, decode_cursor, encode_cursor
+
+SORT = [("created_at", -1), ("_id", -1)]
+TYPES = (datetime, ObjectId)
+
+
+def test_cursor_round_trip():
+    after = [datetime(2024, 1, 1, 12, 30), ObjectId()]
+    assert decode_cursor(encode_cursor({"after": after})) == {"after": after}
+    check_keys(SORT, after, TYPES)
+
+
+@pytest.mark.parametrize("after", [
+    [{"$ne": None}, {"$ne": None}],
+    [datetime(2024, 1, 1), {"$gt": ""}],
+    [[1], ObjectId()],
+    ["2024-01-01", ObjectId()],
+    [datetime(2024, 1, 1)],
+    [True, ObjectId()],
+    None,
+    "x",
+])
+def test_tampered_keys_are_rejected(after):
+    with pytest.raises(ValueError):
+        check_keys(SORT, after, TYPES)
+
+
+def test_default_types_refuse_documents_and_arrays():
+    check_keys([("product_id", 1)], ["PRD-0001"])
+    for value in ({"$ne": None}, ["PRD-0001"], None, False):
+        with pytest.raises(ValueError):
+            check_keys([("product_id", 1)], [value])
+
+
+def test_transaction_list_rejects_a_tampered_cursor(app, db, auth):
+    db.transactions.insert_many([
+        {"transaction_id": f"TXN-P{n}", "total_amount": 1.0, "created_at": datetime(2024, 1, 1, 12, n)}
+        for n in range(3)
+    ])
+    client = app.test_client()
+    first = client.get("/api/sales/?page_size=2", headers=auth()).get_json()
+    assert len(first["data"]) == 2
+    second = client.get(f"/api/sales/?page_size=2&cursor={first['next_cursor']}", headers=auth())
+    assert second.status_code == 200
+    assert [t["transaction_id"] for t in second.get_json()["data"]] == ["TXN-P0"]
+
+    tampered = encode_cursor({"after": [{"$ne": None}, {"$ne": None}]})
+    response = client.get(f"/api/sales/?cursor={tampered}", headers=auth())
+    assert response.status_code == 400
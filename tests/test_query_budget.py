@@ -0,0 +1,89 @@
+from datetime import datetime
+
+import pytest
+
+from core import query_budget
+from core.query_budget import QueryAccount, QueryAccountant
+
+from conftest import _Event
+
+
+def _reply(account, reply):
+    token = query_budget._current.set(account)
+    try:
+        QueryAccountant().succeeded(_Event("find", {"find": "products"}, reply))
+    finally:
+        query_budget._current.reset(token)
+
+
+def test_reply_bytes_are_counted_only_on_request():
+    reply = {"ok": 1, "cursor": {"firstBatch": [{"name": "x" * 100}]}}
+    skipped, counted = QueryAccount(), QueryAccount(count_bytes=True)
+    _reply(skipped, reply)
+    _reply(counted, reply)
+    assert skipped.docs == counted.docs == 1
+    assert skipped.bytes == 0
+    assert counted.bytes > 100
+
+
+def test_query_shape_strips_values():
+    a = query_budget.query_shape("find", {"find": "products", "filter": {"product_id": "PRD-1"}})
+    b = query_budget.query_shape("find", {"find": "products", "filter": {"product_id": "PRD-2"}})
+    assert a == b == 'find products {"product_id": "str"}'
+
+
+def _seed(db, count=3):
+    db.products.insert_many([
+        {
+            "product_id": f"PRD-T{n}", "name": f"Test product {n}", "sku": f"T{n}",
+            "category": "Food", "price": 1000.0 * (n + 1), "stock": 50,
+            "status": "active", "created_at": datetime.utcnow(),
+        }
+        for n in range(count)
+    ])
+
+
+def test_checkout_stays_within_its_budget(app, db, command_events, auth):
+    _seed(db)
+    response = app.test_client().post("/api/sales/", headers=auth("kasir"), json={
+        "items": [{"product_id": f"PRD-T{n}", "quantity": 2} for n in range(3)],
+        "payment_method": "cash",
+    })
+    assert response.status_code == 201, response.get_json()
+    assert 0 < int(response.headers["X-DB-Queries"]) <= 10
+    # strict mode counts bytes even without a max_bytes
+    assert int(response.headers["X-DB-Bytes"]) > 0
+
+
+@pytest.mark.parametrize("path", ["/api/products/", "/api/products/stock"])
+def test_catalog_reads_stay_within_their_budget(app, db, command_events, auth, path):
+    _seed(db)
+    response = app.test_client().get(path, headers=auth())
+    assert response.status_code == 200, response.get_json()
+
+
+def test_strict_mode_fails_a_route_over_budget(app, db, command_events, auth, monkeypatch):
+    _seed(db)
+    view = app.view_functions["sales_bp.create_transaction"]
+    monkeypatch.setattr(view, "query_budget", {"max_queries": 1})
+    response = app.test_client().post("/api/sales/", headers=auth("kasir"), json={
+        "items": [{"product_id": "PRD-T0", "quantity": 1}],
+    })
+    assert response.status_code == 500
+    body = response.get_json()
+    assert body["error"] == "Query budget exceeded"
+    assert body["violations"][0].startswith("max_queries: ")
+
+
+def test_streamed_export_reads_to_the_end(app, db, command_events, auth):
+    # teardown runs again when a stream_with_context body closes
+    db.transactions.insert_many([
+        {
+            "transaction_id": f"TXN-T{n}", "items": [], "total_amount": 1000.0 * n,
+            "payment_method": "cash", "status": "completed", "created_at": datetime(2024, 1, 1, 12, n),
+        }
+        for n in range(3)
+    ])
+    response = app.test_client().get("/api/sales/export", headers=auth())
+    assert response.status_code == 200
+    assert len(response.get_data().splitlines()) == 3
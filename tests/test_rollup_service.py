@@ -0,0 +1,33 @@
+from datetime import datetime
+
+from services import rollup_service
+from services.rollup_service import LIFETIME, PRODUCT_SALES
+
+
+def _sale(day, name, quantity=1):
+    created_at = datetime(2024, 1, day, 12)
+    return {
+        "transaction_id": f"TXN-R{day}", "store_id": "S1", "created_at": created_at,
+        "items": [{"product_id": "PRD-1", "product_name": name, "quantity": quantity, "subtotal": 1000.0 * quantity}],
+    }
+
+
+def test_bestsellers_name_the_product_as_last_sold(db):
+    # newest first, so insertion order alone would report the old name
+    rollup_service.record_product_sales(db, [_sale(3, "Kopi Susu Gula Aren")], {"PRD-1": "Beverages"})
+    rollup_service.record_product_sales(db, [_sale(1, "Kopi Susu")], {"PRD-1": "Snacks"})
+    db[PRODUCT_SALES].insert_one({
+        "_id": "S0:2024-01-02:PRD-1", "store_id": "S0", "period": "2024-01-02",
+        "day": datetime(2024, 1, 2), "product_id": "PRD-1", "product_name": "Kopi Susu",
+        "category": "Snacks", "quantity": 4, "revenue": 4000.0,
+    })
+
+    [top] = rollup_service.top_products(db, start=datetime(2024, 1, 1), end=datetime(2024, 1, 3))
+    assert (top["product_name"], top["total_quantity"]) == ("Kopi Susu Gula Aren", 6)
+
+
+def test_batch_keeps_the_newest_name_per_bucket(db):
+    rollup_service.record_product_sales(db, [_sale(3, "Kopi Susu Gula Aren"), _sale(1, "Kopi Susu")])
+    lifetime = db[PRODUCT_SALES].find_one({"period": LIFETIME})
+    assert lifetime["product_name"] == "Kopi Susu Gula Aren"
+    assert lifetime["last_sale_at"] == datetime(2024, 1, 3, 12)
@@ -0,0 +1,26 @@
+from datetime import datetime
+
+import pytest
+
+
+@pytest.mark.parametrize("items", [["x"], [None], [5, {"product_id": "PRD-S0", "quantity": 1}]])
+def test_checkout_rejects_items_that_are_not_objects(app, db, auth, items):
+    response = app.test_client().post("/api/sales/", headers=auth("kasir"), json={"items": items})
+    assert response.status_code == 400
+    assert "Item 1 must be an object" in response.get_json()["errors"]
+
+
+def test_batch_marks_only_the_malformed_entry_invalid(app, db, auth):
+    db.products.insert_one({
+        "product_id": "PRD-S0", "name": "Teh Botol", "sku": "S0", "category": "Beverages",
+        "price": 5000.0, "stock": 10, "status": "active", "created_at": datetime.utcnow(),
+    })
+    response = app.test_client().post("/api/sales/batch", headers=auth("kasir"), json={"transactions": [
+        {"idempotency_key": "k-1", "items": ["x"]},
+        {"idempotency_key": "k-2", "items": [{"product_id": "PRD-S0", "quantity": 2}], "payment_method": "cash"},
+    ]})
+    assert response.status_code == 200, response.get_json()
+    first, second = response.get_json()["results"]
+    assert first["status"] == "invalid"
+    assert first["errors"] == ["Item 1 must be an object"]
+    assert second["status"] == "created", second
@@ -0,0 +1,119 @@
+from datetime import datetime
+
+import pytest
+
+from services import search_service
+from services.search_service import FUZZY_THRESHOLD, ProductSearchIndex, trigrams
+
+PRODUCTS = [
+    {"product_id": "PRD-1", "name": "Kopi Susu", "category": "Beverages", "price": 12000.0, "stock": 5, "sku": "KS1"},
+    {"product_id": "PRD-2", "name": "Kopi Hitam", "category": "Beverages", "price": 10000.0, "stock": 7, "sku": "KH1"},
+    {"product_id": "PRD-3", "name": "Kopiko Candy", "category": "Snacks", "price": 3000.0, "stock": 9, "sku": "KC1"},
+    {"product_id": "PRD-4", "name": "Susu Kedelai 1000", "category": "Beverages", "price": 8000.0, "stock": 3, "sku": "SK1", "barcode": "899100"},
+]
+
+
+@pytest.fixture
+def index():
+    index = ProductSearchIndex(sync_seconds=60)
+    index.loaded = True
+    for product in PRODUCTS:
+        index.upsert(dict(product))
+    return index
+
+
+def ids(results):
+    return [p["product_id"] for p in results]
+
+
+def test_vocabulary_stays_sorted_and_drops_unused_tokens(index):
+    assert index.vocabulary == sorted(index.vocabulary)
+    index.remove("PRD-2")
+    assert "hitam" not in index.vocabulary
+    assert "hitam" not in index.postings
+    assert all("hitam" not in tokens for tokens in index.grams.values())
+    # still used by PRD-1 and PRD-3
+    assert "kopi" in index.vocabulary and "kopiko" in index.vocabulary
+    assert index.vocabulary == sorted(index.vocabulary)
+
+
+def test_remove_drops_empty_trigram_and_category_entries(index):
+    index.remove("PRD-3")
+    # "kopiko" was the only token with "iko"; PRD-3 the only snack
+    assert "iko" not in index.grams
+    assert "snacks" not in index.categories
+    for product_id in ("PRD-1", "PRD-2", "PRD-4"):
+        index.remove(product_id)
+    assert index.grams == {} and index.categories == {}
+    assert index.stats()["trigrams"] == 0 and index.stats()["categories"] == 0
+
+
+def test_remove_then_readd_restores_the_index(index):
+    before = (list(index.vocabulary), {t: set(p) for t, p in index.postings.items()})
+    index.remove("PRD-4")
+    index.upsert(dict(PRODUCTS[3]))
+    assert (index.vocabulary, index.postings) == before
+
+
+def test_upsert_moves_a_product_to_its_new_tokens(index):
+    index.upsert(dict(PRODUCTS[1], name="Teh Hitam"))
+    assert ids(index.search("kopi")) == ["PRD-1", "PRD-3"]
+    assert ids(index.search("teh")) == ["PRD-2"]
+
+
+def test_trigram_jaccard_threshold(index):
+    # "kopo" shares "  k", " ko", "kop" with "kopi": 3 / (5 + 5 - 3)
+    shared = trigrams("kopo") & trigrams("kopi")
+    assert len(shared) / len(trigrams("kopo") | trigrams("kopi")) >= FUZZY_THRESHOLD
+    assert "kopi" in index._similar("kopo")
+    assert "susu" not in index._similar("kopo")
+    assert ids(index.search("kopo susu")) == ["PRD-1"]
+
+
+def test_fuzzy_only_when_no_prefix_matches(index):
+    # "kop" is a prefix of kopi and kopiko; no typo expansion on top
+    assert set(index._expand("kop")) == {"kopi", "kopiko"}
+    # numbers are never matched by similarity
+    assert index._expand("1001") == {}
+    # one letter matches whole tokens only
+    assert index._expand("k") == {}
+
+
+def test_every_query_token_must_match(index):
+    assert set(ids(index.search("kopi"))) == {"PRD-1", "PRD-2", "PRD-3"}
+    assert ids(index.search("kopi su")) == ["PRD-1"]
+    assert ids(index.search("su kopi")) == ["PRD-1"]
+    assert index.search("kopi teh") == []
+
+
+def test_exact_token_ranks_above_prefix(index):
+    # "kopi" is exact for PRD-1/PRD-2 and a prefix of PRD-3's "kopiko"
+    assert ids(index.search("kopi"))[-1] == "PRD-3"
+
+
+def test_code_match_comes_first_and_category_filters(index):
+    assert ids(index.search("899100")) == ["PRD-4"]
+    assert index.lookup("sk1")["product_id"] == "PRD-4"
+    assert ids(index.search("kopi", category="snacks")) == ["PRD-3"]
+    assert set(ids(index.search("", category="Beverages"))) == {"PRD-1", "PRD-2", "PRD-4"}
+    assert "tokens" not in index.search("kopi")[0]
+
+
+def test_search_returns_current_stock(app, db, command_events, auth):
+    db.products.insert_many([dict(p, status="active", created_at=datetime.utcnow()) for p in PRODUCTS])
+    search_service.search_index._clear()
+    client = app.test_client()
+
+    response = client.get("/api/products/search?q=kopi+susu", headers=auth("kasir"))
+    assert response.get_json()[0]["stock"] == 5
+    # a sale moves stock without a catalog change the index would see
+    db.products.update_one({"product_id": "PRD-1"}, {"$inc": {"stock": -2}})
+
+    response = client.get("/api/products/search?q=kopi+susu", headers=auth("kasir"))
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()[0]["stock"] == 3
+    assert int(response.headers["X-DB-Queries"]) <= 3
+
+    response = client.get("/api/products/lookup/KS1", headers=auth("kasir"))
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()["stock"] == 3
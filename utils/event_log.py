@@ -0,0 +1,27 @@
+"""
+Structured, sampled event logs: one JSON object per line, so a log
+pipeline can filter on fields instead of parsing prose.
+"""
+import json
+import logging
+import random
+from datetime import datetime
+from core.tracing import current_request_id
+
+
+def log_event(logger, event, sample_rate=1.0, level=logging.INFO, **fields):
+    """
+    Log `event` with `fields` as a JSON line, keeping only `sample_rate`
+    of the calls (1.0 keeps all). The rate is recorded so counts can be
+    scaled back up. Never pass secrets as fields.
+    """
+    if sample_rate < 1.0 and random.random() >= sample_rate:
+        return
+    if not logger.isEnabledFor(level):
+        return
+    record = {"ts": datetime.utcnow().isoformat() + "Z", "event": event, "sample_rate": sample_rate}
+    request_id = current_request_id()
+    if request_id:
+        record["request_id"] = request_id
+    record.update(fields)
+    logger.log(level, json.dumps(record, default=str))
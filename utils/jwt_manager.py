@@ -4,9 +4,18 @@ JWT helper and decorator for route protection.
 from functools import wraps
 from flask import request, jsonify
 import jwt
-from config import SECRET_KEY, JWT_EXP_HOURS
+import uuid
+from pymongo.errors import DuplicateKeyError
+from config import SECRET_KEY, JWT_EXP_HOURS, AUTH_CACHE_SIZE
+from utils.token_cache import TokenCache, token_digest
+from core.database import get_db
+from services.revocation_service import revocation_list
 import datetime
 
+token_cache = TokenCache(AUTH_CACHE_SIZE)
+
+STREAM_TICKET_AUDIENCE = "event-stream"
+
 def generate_token(user_id: str, role: str) -> str:
     """
     Create JWT token with user_id and role, expires in JWT_EXP_HOURS.
@@ -24,6 +33,83 @@ def decode_token(token: str):
     """
     return jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
 
+def verify_token(token: str) -> dict:
+    """
+    Like decode_token, but answers from the per-worker cache of already
+    verified tokens when possible, and rejects revoked sessions.
+    """
+    digest = token_digest(token)
+    payload = token_cache.get(digest)
+    if payload is None:
+        payload = decode_token(token)
+        token_cache.put(digest, payload)
+    if revocation_list.is_revoked(get_db().db, digest):
+        token_cache.invalidate(digest)
+        raise jwt.InvalidTokenError("session has been logged out")
+    return dict(payload)
+
+def generate_stream_ticket(token: str, payload: dict, ttl_seconds: float) -> str:
+    """
+    Short-lived, single-use JWT that only opens an event stream, for
+    EventSource, which can't send headers: it goes in the URL instead of
+    the session token. It names its session by token hash, so a logout
+    ends the stream.
+    """
+    ticket = {
+        "jti": uuid.uuid4().hex,
+        "user_id": payload.get("user_id"),
+        "role": payload.get("role"),
+        "sid": token_digest(token),
+        "session_exp": payload.get("exp"),
+        "aud": STREAM_TICKET_AUDIENCE,
+        "exp": datetime.datetime.utcnow() + datetime.timedelta(seconds=ttl_seconds)
+    }
+    return jwt.encode(ticket, SECRET_KEY, algorithm="HS256")
+
+def verify_stream_ticket(ticket: str) -> dict:
+    """
+    Decode a stream ticket and mark it used, rejecting revoked sessions
+    and tickets seen before, by any worker. Raises jwt exceptions on
+    failure. Session tokens carry no audience, so neither kind is
+    accepted in place of the other.
+    """
+    payload = jwt.decode(
+        ticket, SECRET_KEY, algorithms=["HS256"], audience=STREAM_TICKET_AUDIENCE,
+        options={"require": ["jti", "exp"]}
+    )
+    db = get_db().db
+    if revocation_list.is_revoked(db, payload["sid"]):
+        raise jwt.InvalidTokenError("session has been logged out")
+    try:
+        # the TTL index drops it once the ticket would be expired anyway
+        db.used_stream_tickets.insert_one({
+            "_id": payload["jti"],
+            "expires_at": datetime.datetime.utcfromtimestamp(payload["exp"])
+        })
+    except DuplicateKeyError:
+        raise jwt.InvalidTokenError("ticket has already been used")
+    return payload
+
+def authenticate_request(role: str = None):
+    """
+    Shared auth pipeline for all decorators.
+    Returns (payload, None) on success or (None, error response).
+    """
+    auth = request.headers.get("Authorization", "")
+    if not auth.startswith("Bearer "):
+        return None, (jsonify({"error":"missing token"}), 401)
+    token = auth.split(" ", 1)[1]
+    try:
+        payload = verify_token(token)
+    except Exception as e:
+        return None, (jsonify({"error":"invalid or expired token", "detail": str(e)}), 401)
+    # role check
+    if role and payload.get("role") != role and payload.get("role") != "admin":
+        return None, (jsonify({"error":"forbidden"}), 403)
+    # attach user info to request (optional)
+    request.user = payload
+    return payload, None
+
 def require_auth(role: str = None):
     """
     Decorator to require Authorization: Bearer <token>.
@@ -32,19 +118,9 @@ def require_auth(role: str = None):
     def decorator(f):
         @wraps(f)
         def wrapped(*args, **kwargs):
-            auth = request.headers.get("Authorization", "")
-            if not auth.startswith("Bearer "):
-                return jsonify({"error":"missing token"}), 401
-            token = auth.split(" ", 1)[1]
-            try:
-                payload = decode_token(token)
-            except Exception as e:
-                return jsonify({"error":"invalid or expired token", "detail": str(e)}), 401
-            # role check
-            if role and payload.get("role") != role and payload.get("role") != "admin":
-                return jsonify({"error":"forbidden"}), 403
-            # attach user info to request (optional)
-            request.user = payload
+            payload, error = authenticate_request(role)
+            if error:
+                return error
             return f(*args, **kwargs)
         return wrapped
     return decorator
@@ -60,40 +136,19 @@ def token_required(role=None):
     @token_required()
     @token_required("manager")
     """
-    # If used directly as @token_required without parentheses
-    if callable(role):
-        func = role
-        role = None
+    def decorator(func, role=None):
         @wraps(func)
-        def wrapped_no_args(*args, **kwargs):
-            auth = request.headers.get("Authorization", "")
-            if not auth.startswith("Bearer "):
-                return jsonify({"error":"missing token"}), 401
-            token = auth.split(" ", 1)[1]
-            try:
-                payload = decode_token(token)
-            except Exception as e:
-                return jsonify({"error":"invalid or expired token", "detail": str(e)}), 401
-            if role and payload.get("role") != role and payload.get("role") != "admin":
-                return jsonify({"error":"forbidden"}), 403
+        def wrapped(*args, **kwargs):
+            payload, error = authenticate_request(role)
+            if error:
+                return error
             # pass payload as current_user to the route
             return func(payload, *args, **kwargs)
-        return wrapped_no_args
+        return wrapped
+
+    # If used directly as @token_required without parentheses
+    if callable(role):
+        return decorator(role)
 
     # If used as @token_required() or @token_required("role")
-    def decorator(func):
-        @wraps(func)
-        def wrapped(*args, **kwargs):
-            auth = request.headers.get("Authorization", "")
-            if not auth.startswith("Bearer "):
-                return jsonify({"error":"missing token"}), 401
-            token = auth.split(" ", 1)[1]
-            try:
-                payload = decode_token(token)
-            except Exception as e:
-                return jsonify({"error":"invalid or expired token", "detail": str(e)}), 401
-            if role and payload.get("role") != role and payload.get("role") != "admin":
-                return jsonify({"error":"forbidden"}), 403
-            return func(payload, *args, **kwargs)
-        return wrapped
-    return decorator
+    return lambda func: decorator(func, role)
@@ -0,0 +1,180 @@
+"""
+In-process metric primitives shared by the services, and their
+Prometheus text exposition. Metrics are per worker process.
+"""
+import threading
+
+# seconds; fine enough at the bottom for cache hits, wide enough for scrypt
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram, safe to observe from any thread."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def snapshot(self):
+        """{"buckets": [(le, cumulative count), ..., ("+Inf", n)], "count", "sum"}"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative, running = [], 0
+        for bound, count in zip(self.buckets + ("+Inf",), counts):
+            running += count
+            cumulative.append((bound, running))
+        return {"buckets": cumulative, "count": running, "sum": round(total, 6)}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Family:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _child(self, labels, factory):
+        child = self._children.get(labels)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(labels, factory())
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in sorted(self._children.copy().items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value[0])}")
+        return lines
+
+
+class Counter(_Family):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        cell = self._child(labels, lambda: [0])
+        with self._lock:
+            cell[0] += amount
+
+
+class Gauge(_Family):
+    kind = "gauge"
+
+    def inc(self, *labels, amount=1):
+        cell = self._child(labels, lambda: [0])
+        with self._lock:
+            cell[0] += amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value):
+        cell = self._child(labels, lambda: [0])
+        with self._lock:
+            cell[0] = value
+
+
+class HistogramFamily(_Family):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = buckets
+
+    def labels(self, *labels) -> Histogram:
+        return self._child(labels, lambda: Histogram(self.buckets))
+
+    def observe(self, *labels, value):
+        self.labels(*labels).observe(value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, histogram in sorted(self._children.copy().items()):
+            lines.extend(render_histogram(self.name, histogram, self.labelnames, labels))
+        return lines
+
+
+def render_histogram(name, histogram, labelnames=(), labels=()):
+    snap = histogram.snapshot()
+    lines = []
+    for bound, count in snap["buckets"]:
+        le = f'le="{bound}"'
+        lines.append(f"{name}_bucket{_labels(labelnames, labels, le)} {count}")
+    lines.append(f"{name}_sum{_labels(labelnames, labels)} {snap['sum']}")
+    lines.append(f"{name}_count{_labels(labelnames, labels)} {snap['count']}")
+    return lines
+
+
+class Registry:
+    def __init__(self):
+        self._families = []
+        self._collectors = []
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._add(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._add(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(HistogramFamily(name, help_text, labelnames, buckets))
+
+    def _add(self, family):
+        self._families.append(family)
+        return family
+
+    def collector(self, fn):
+        """
+        Register fn() -> iterable of exposition lines, called at scrape
+        time; for stats other modules already keep.
+        """
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        lines = []
+        for family in self._families:
+            lines.extend(family.render())
+        for fn in self._collectors:
+            try:
+                lines.extend(fn())
+            except Exception as e:
+                lines.append(f"# collector {fn.__name__} failed: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+def gauge_lines(name, help_text, value, kind="gauge"):
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {_number(value)}"]
+
+
+registry = Registry()
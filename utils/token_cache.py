@@ -0,0 +1,69 @@
+"""
+Bounded LRU of verified JWT payloads, keyed by a digest of the token.
+Entries expire together with the token's own `exp` claim.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class TokenCache:
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, digest: str):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self.misses += 1
+                return None
+            payload, expires_at = entry
+            if expires_at <= now:
+                del self._entries[digest]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return payload
+
+    def put(self, digest: str, payload: dict):
+        expires_at = payload.get("exp")
+        if self.max_size <= 0 or not isinstance(expires_at, (int, float)):
+            return
+        with self._lock:
+            self._entries[digest] = (payload, expires_at)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, digest: str):
+        with self._lock:
+            self._entries.pop(digest, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }